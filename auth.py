@@ -7,6 +7,7 @@ LDAP认证模块
 """
 
 import os
+import uuid
 import logging
 import jwt
 from datetime import datetime, timedelta
@@ -182,7 +183,9 @@ class LDAPAuth:
                 'ldap_uid': user_info['ldap_uid'],
                 'exp': datetime.utcnow() + timedelta(hours=24),
                 'iat': datetime.utcnow(),
-                'iss': 'vmware-iaas-platform'
+                'iss': 'vmware-iaas-platform',
+                # 同一秒内重复登录时保证令牌（及会话记录）唯一
+                'jti': uuid.uuid4().hex
             }
             
             token = jwt.encode(
@@ -307,6 +310,11 @@ def get_current_user():
     
     return ldap_auth.verify_token(token)
 
+def is_admin(user):
+    """检查是否为管理员（这里简单检查用户名）"""
+    admin_users = ['admin', 'administrator', 'root']
+    return bool(user) and user.get('username') in admin_users
+
 def admin_required(f):
     """管理员权限装饰器"""
     @wraps(f)
@@ -315,9 +323,7 @@ def admin_required(f):
         if not current_user:
             return jsonify({'error': '需要认证'}), 401
         
-        # 检查是否为管理员（这里简单检查用户名）
-        admin_users = ['admin', 'administrator', 'root']
-        if current_user.get('username') not in admin_users:
+        if not is_admin(current_user):
             return jsonify({'error': '需要管理员权限'}), 403
         
         return f(current_user, *args, **kwargs)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 进程内后台线程
+预加载应用后gunicorn fork出多个worker，父进程启动的线程不会带到子进程：
+各模块在首次使用时（或每个请求前）调用 start_per_process，每个进程各启动一次
+"""
+
+import os
+import threading
+
+# 线程名 -> 已启动该线程的进程号
+_started = {}
+_lock = threading.Lock()
+
+
+def start_per_process(target, name, setup=None):
+    """在当前进程启动一次名为name的守护线程执行target，返回本次调用是否启动了线程
+
+    setup在启动线程前调用（持锁，同一进程内只执行一次），用于创建线程池等按进程的资源
+    """
+    pid = os.getpid()
+    if _started.get(name) == pid:
+        return False
+    with _lock:
+        if _started.get(name) == pid:
+            return False
+        if setup is not None:
+            setup()
+        threading.Thread(target=target, name=name, daemon=True).start()
+        _started[name] = pid
+        return True
@@ -9,15 +9,21 @@ import os
 import sys
 import subprocess
 import logging
-import gzip
+import json
+import time
 import shutil
-from datetime import datetime, timedelta
+import fcntl
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 # 添加应用根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app
+from config import Config
+from backup_store import ChunkStore
 
 # 配置日志
 logging.basicConfig(
@@ -26,174 +32,1067 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BACKUP_PREFIX = 'vmware_iaas_backup_'
+
+# 压缩算法 -> (文件后缀, 默认级别, 级别范围)
+COMPRESSIONS = {
+    'gzip': ('.gz', 6, (1, 9)),
+    'zstd': ('.zst', 3, (1, 19)),
+    'none': ('', 0, (0, 0)),
+}
+
+# store格式每块单独zlib压缩: (默认级别, 级别范围)
+STORE_COMPRESSION = (6, (1, 9))
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# pg_dump纯文本输出末尾的结束标记，截断的备份没有该标记（新版本在其后还有 \unrestrict 行）
+DUMP_COMPLETE_MARKER = b'-- PostgreSQL database dump complete'
+
+# 备份任务互斥锁：定时任务与手动执行的备份不会同时运行
+RUN_LOCK_FILE = '.backup.lock'
+
+# 基础备份完成后写入的信息文件，存在即表示该基础备份完整
+BASE_BACKUP_INFO = 'backup_info.json'
+
+# 校验恢复结果：为每张表生成精确计数语句（分区表只统计各分区，避免重复计数）
+ROW_COUNT_QUERIES_SQL = """
+SELECT format('SELECT %L, count(*) FROM %I.%I', n.nspname || '.' || c.relname, n.nspname, c.relname)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r'
+  AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+  AND n.nspname NOT LIKE 'pg_toast%'
+ORDER BY 1
+"""
+
+DATABASE_LOCALE_SQL = """
+SELECT pg_encoding_to_char(encoding), datcollate, datctype
+FROM pg_database WHERE datname = current_database()
+"""
+
+def _cpu_count():
+    """优先使用进程可用的CPU数（容器限制了cpuset时小于物理核数）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class _Progress:
+    """按时间间隔输出进度日志"""
+    
+    def __init__(self, label, total, format_size=None, unit='bytes', interval=2.0):
+        self.label = label
+        self.total = total
+        self.format_size = format_size
+        self.unit = unit
+        self.interval = interval
+        self.started = time.monotonic()
+        self.reported = self.started
+    
+    def update(self, done, force=False):
+        now = time.monotonic()
+        if not force and now - self.reported < self.interval:
+            return
+        self.reported = now
+        percent = done * 100 / self.total if self.total else 100
+        if self.unit == 'bytes':
+            rate = done / (now - self.started) / 1024 / 1024 if now > self.started else 0
+            logger.info(f"{self.label} progress: {percent:.0f}% "
+                        f"({self.format_size(done)}/{self.format_size(self.total)}, {rate:.1f} MB/s)")
+        else:
+            logger.info(f"{self.label} progress: {done}/{self.total} {self.unit} ({percent:.0f}%)")
+
+class _RateLimiter:
+    """按累计字节数限速：读取方暂停时管道写满，pg_dump随之阻塞，数据库端的读取也被放慢"""
+    
+    def __init__(self, max_rate_mb):
+        self.rate = max_rate_mb * 1024 * 1024
+        self.started = time.monotonic()
+        self.done = 0
+    
+    def consume(self, size):
+        self.done += size
+        delay = self.done / self.rate - (time.monotonic() - self.started)
+        if delay > 0:
+            time.sleep(delay)
+
+class _ThrottledReader:
+    """按限速读取的流包装，每次最多读取 STREAM_CHUNK_SIZE 使速率平滑"""
+    
+    def __init__(self, stream, limiter):
+        self.stream = stream
+        self.limiter = limiter
+    
+    def read(self, size=-1):
+        data = self.stream.read(STREAM_CHUNK_SIZE if size < 0 else min(size, STREAM_CHUNK_SIZE))
+        self.limiter.consume(len(data))
+        return data
+
+class _CronSchedule:
+    """cron表达式（分 时 日 月 周），支持 * , - / 及 @hourly/@daily/@weekly/@monthly"""
+    
+    ALIASES = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *',
+    }
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    
+    def __init__(self, expression):
+        self.expression = expression
+        fields = self.ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"invalid cron expression: {expression}")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)
+        )
+        # 周日可写作0或7
+        self.weekdays = {day % 7 for day in weekdays}
+        # 日和周都被限定时满足其一即可（与cron一致）
+        self.day_restricted = fields[2] != '*'
+        self.weekday_restricted = fields[4] != '*'
+    
+    def _parse_field(self, field, low, high):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if step else start
+            step = int(step) if step else 1
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f"invalid cron field: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+    
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        # Python周一为0，cron周日为0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day or weekday
+        return day and weekday
+    
+    def next_after(self, moment):
+        """moment之后（不含）第一个匹配的时间"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"cron expression never matches: {self.expression}")
+
+def _wal_segment_name(timeline, lsn, segment_size):
+    """LSN所在WAL段的文件名"""
+    high, low = (int(part, 16) for part in lsn.split('/'))
+    segment = ((high << 32) | low) // segment_size
+    segments_per_id = 0x100000000 // segment_size
+    return f"{timeline:08X}{segment // segments_per_id:08X}{segment % segments_per_id:08X}"
+
+def _is_backup(path):
+    """备份文件/目录: .sql[.gz|.zst] 或 directory格式的 .dir"""
+    name = path.name[len(BACKUP_PREFIX):]
+    return path.name.startswith(BACKUP_PREFIX) and (
+        name.endswith(('.sql', '.sql.gz', '.sql.zst')) or (name.endswith('.dir') and path.is_dir())
+    )
+
 class BackupManager:
     def __init__(self):
-        self.backup_dir = Path('/app/backups')
-        self.backup_dir.mkdir(exist_ok=True)
+        self.backup_dir = Path(Config.BACKUP_DIR)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.base_dir = self.backup_dir / 'base'
+        self.wal_dir = Path(Config.BACKUP_WAL_DIR)
+        self.store = ChunkStore(self.backup_dir / 'store')
+        self.max_rate_mb = Config.BACKUP_MAX_RATE_MB
+        self._priority_lowered = False
         
         # 数据库配置
-        self.db_host = app.config['DB_HOST']
-        self.db_port = app.config['DB_PORT']
-        self.db_name = app.config['DB_NAME']
-        self.db_user = app.config['DB_USER']
-        self.db_password = app.config['DB_PASSWORD']
+        self.db_host = Config.DB_HOST
+        self.db_port = Config.DB_PORT
+        self.db_name = Config.DB_NAME
+        self.db_user = Config.DB_USER
+        self.db_password = Config.DB_PASSWORD
         
-    def create_db_backup(self):
-        """创建数据库备份"""
+    def _pg_env(self):
+        """设置环境变量避免密码提示"""
+        env = os.environ.copy()
+        env['PGPASSWORD'] = self.db_password
+        return env
+    
+    def _server_args(self):
+        return [
+            '-h', self.db_host,
+            '-p', str(self.db_port),
+            '-U', self.db_user,
+            '--no-password'
+        ]
+    
+    def _connection_args(self, db_name=None):
+        return self._server_args() + ['-d', db_name or self.db_name]
+    
+    def _psql_query(self, sql, db_name=None):
+        """通过psql执行查询，返回按行、按列拆分的结果"""
+        result = subprocess.run(
+            ['psql'] + self._connection_args(db_name) + ['-At', '-F', '\t', '-c', sql],
+            env=self._pg_env(),
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+        return [line.split('\t') for line in result.stdout.splitlines()]
+    
+    def _compressor_command(self, compression, level):
+        """外部压缩进程：与pg_dump并行运行在不同CPU上，zstd开启多线程，gzip优先使用pigz"""
+        if compression == 'zstd':
+            return ['zstd', f'-{level}', '-T0', '-q', '-c']
+        if compression == 'gzip':
+            return [shutil.which('pigz') or 'gzip', f'-{level}', '-c']
+        return None
+    
+    def _pg_dump_major_version(self):
+        output = subprocess.run(['pg_dump', '--version'], capture_output=True, text=True).stdout
+        return int(output.split()[-1].split('.')[0])
+    
+    def create_db_backup(self, backup_format=None, compression=None, level=None, jobs=None):
+        """创建数据库备份，成功时返回本次备份的统计信息，失败返回None
+        
+        store:     pg_dump 标准输出分块写入去重仓库，只有变化的块占用新空间
+        plain:     pg_dump 标准输出直接送入压缩进程写盘，不落未压缩的临时文件
+        directory: pg_dump -Fd -j N 多进程按表并行导出，由pg_dump逐表压缩
+        """
+        backup_format = backup_format or Config.BACKUP_FORMAT
+        compression = compression or Config.BACKUP_COMPRESSION
+        jobs = jobs or Config.BACKUP_JOBS or _cpu_count()
+        backup_path = None
         try:
+            if backup_format not in ('store', 'plain', 'directory'):
+                raise ValueError(f"unknown backup format: {backup_format}")
+            if backup_format == 'store':
+                compression = 'zlib'
+                extension = ''
+                default_level, (min_level, max_level) = STORE_COMPRESSION
+            elif compression not in COMPRESSIONS:
+                raise ValueError(f"unknown compression: {compression}")
+            else:
+                extension, default_level, (min_level, max_level) = COMPRESSIONS[compression]
+            if compression == 'none':
+                level = 0
+            elif level is None:
+                level = Config.BACKUP_COMPRESSION_LEVEL or default_level
+            if not min_level <= level <= max_level:
+                raise ValueError(f"{compression} level must be between {min_level} and {max_level}")
+            
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f"vmware_iaas_backup_{timestamp}.sql"
-            backup_path = self.backup_dir / backup_filename
-            compressed_path = self.backup_dir / f"{backup_filename}.gz"
-            
-            logger.info(f"Starting database backup to {backup_path}")
-            
-            # 设置环境变量避免密码提示
-            env = os.environ.copy()
-            env['PGPASSWORD'] = self.db_password
-            
-            # 执行pg_dump
-            cmd = [
-                'pg_dump',
-                '-h', self.db_host,
-                '-p', str(self.db_port),
-                '-U', self.db_user,
-                '-d', self.db_name,
-                '--no-password',
-                '--verbose',
-                '--clean',
-                '--create',
-                '--format=plain'
-            ]
+            backup_id = f"{BACKUP_PREFIX}{timestamp}"
+            if backup_format == 'plain':
+                backup_path = self.backup_dir / f"{backup_id}.sql{extension}"
+            elif backup_format == 'directory':
+                backup_path = self.backup_dir / f"{backup_id}.dir"
             
-            with open(backup_path, 'w') as f:
-                result = subprocess.run(
-                    cmd,
-                    env=env,
-                    stdout=f,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
+            logger.info(f"Starting database backup to {backup_path or self.store.root / backup_id} "
+                        f"(format={backup_format}, compression={compression}:{level})")
             
-            if result.returncode == 0:
-                logger.info("Database backup completed successfully")
-                
-                # 压缩备份文件
-                logger.info("Compressing backup file...")
-                with open(backup_path, 'rb') as f_in:
-                    with gzip.open(compressed_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                
-                # 删除未压缩的文件
-                backup_path.unlink()
-                
-                logger.info(f"Backup compressed and saved to {compressed_path}")
-                
-                # 清理旧备份
-                self.cleanup_old_backups()
-                
-                return True
+            database_bytes = int(self._psql_query('SELECT pg_database_size(current_database())')[0][0])
+            started = time.monotonic()
+            entry = None
+            if backup_format == 'store':
+                entry = self._dump_store(backup_id, level)
+                dump_bytes = entry['logical_bytes']
+            elif backup_format == 'plain':
+                dump_bytes = self._dump_plain(backup_path, compression, level)
             else:
-                logger.error(f"Database backup failed: {result.stderr}")
-                return False
-                
+                dump_bytes = None
+                self._dump_directory(backup_path, compression, level, jobs)
+            elapsed = time.monotonic() - started
+            
+            # store格式只计新写入仓库的块，压缩比即去重与压缩的综合效果
+            output_bytes = entry['new_bytes'] if entry else self._path_size(backup_path)
+            # plain格式按导出的SQL文本计算压缩比；directory格式的未压缩大小未知，以数据库大小为基准
+            source_bytes = dump_bytes if dump_bytes is not None else database_bytes
+            stats = {
+                'path': str(backup_path) if backup_path else backup_id,
+                'format': backup_format,
+                'compression': compression,
+                'level': level,
+                'jobs': jobs if backup_format == 'directory' else 1,
+                'seconds': round(elapsed, 2),
+                'database_bytes': database_bytes,
+                'dump_bytes': dump_bytes,
+                'output_bytes': output_bytes,
+                'throughput_mb_s': round(database_bytes / elapsed / 1024 / 1024, 2) if elapsed else None,
+                'compression_ratio': round(source_bytes / output_bytes, 2) if output_bytes else None,
+                'ratio_basis': 'dump' if dump_bytes is not None else 'database',
+            }
+            if entry:
+                stats['chunks'] = entry['chunks']
+                stats['new_chunks'] = entry['new_chunks']
+            logger.info(
+                f"Backup saved to {stats['path']}: {self._format_size(output_bytes)} in {stats['seconds']}s, "
+                f"{stats['throughput_mb_s']} MB/s, ratio {stats['compression_ratio']}x ({stats['ratio_basis']})"
+            )
+            
+            # 清理旧备份
+            self.cleanup_old_backups()
+            
+            return stats
+            
         except Exception as e:
             logger.error(f"Error creating database backup: {str(e)}")
-            return False
+            if backup_path is not None:
+                self._remove_backup(backup_path)
+            return None
+    
+    def _dump_store(self, backup_id, level):
+        """pg_dump 分块写入仓库，返回该备份的索引条目"""
+        cmd = ['pg_dump'] + self._connection_args() + ['--clean', '--create', '--format=plain']
+        
+        with tempfile.TemporaryFile() as dump_err:
+            dump = subprocess.Popen(cmd, env=self._pg_env(), stdout=subprocess.PIPE, stderr=dump_err)
+            source = dump.stdout
+            if self.max_rate_mb:
+                source = _ThrottledReader(source, _RateLimiter(self.max_rate_mb))
+            
+            def finalize():
+                # 登记到索引之前检查退出码，导出失败（输出被截断）的备份不会出现在索引中
+                dump.stdout.close()
+                if dump.wait() != 0:
+                    dump_err.seek(0)
+                    raise RuntimeError(f"pg_dump failed: {dump_err.read().decode('utf-8', 'replace').strip()}")
+            
+            try:
+                # 失败时已写入的块不被任何清单引用，由下一次清理回收
+                return self.store.put(backup_id, source, {'database': self.db_name}, level, finalize)
+            finally:
+                dump.stdout.close()
+                dump.wait()
     
-    def cleanup_old_backups(self, keep_days=30):
-        """清理旧的备份文件"""
+    def _dump_plain(self, backup_path, compression, level):
+        """pg_dump | 压缩进程 > 文件，返回未压缩的导出字节数"""
+        cmd = ['pg_dump'] + self._connection_args() + ['--clean', '--create', '--format=plain']
+        compressor_cmd = self._compressor_command(compression, level)
+        
+        # stderr写入临时文件，避免管道写满阻塞子进程
+        with open(backup_path, 'wb') as f_out, \
+                tempfile.TemporaryFile() as dump_err, tempfile.TemporaryFile() as compress_err:
+            dump = subprocess.Popen(cmd, env=self._pg_env(), stdout=subprocess.PIPE, stderr=dump_err)
+            compressor = None
+            if compressor_cmd:
+                compressor = subprocess.Popen(compressor_cmd, stdin=subprocess.PIPE, stdout=f_out,
+                                              stderr=compress_err)
+            sink = compressor.stdin if compressor else f_out
+            
+            limiter = _RateLimiter(self.max_rate_mb) if self.max_rate_mb else None
+            dump_bytes = 0
+            try:
+                for chunk in iter(lambda: dump.stdout.read(STREAM_CHUNK_SIZE), b''):
+                    dump_bytes += len(chunk)
+                    sink.write(chunk)
+                    if limiter:
+                        limiter.consume(len(chunk))
+            except BrokenPipeError:
+                # 压缩进程提前退出，错误信息见其stderr；pg_dump仍阻塞在写管道上，先终止再等待
+                dump.kill()
+            except BaseException:
+                dump.kill()
+                raise
+            finally:
+                dump.stdout.close()
+                if compressor:
+                    try:
+                        compressor.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                dump_code = dump.wait()
+                compress_code = compressor.wait() if compressor else 0
+            
+            # 压缩进程失败时pg_dump是被终止的，先报告压缩进程的错误
+            if compress_code != 0:
+                compress_err.seek(0)
+                raise RuntimeError(f"{compressor_cmd[0]} failed: "
+                                   f"{compress_err.read().decode('utf-8', 'replace').strip()}")
+            if dump_code != 0:
+                dump_err.seek(0)
+                raise RuntimeError(f"pg_dump failed: {dump_err.read().decode('utf-8', 'replace').strip()}")
+        return dump_bytes
+    
+    def _dump_directory(self, backup_path, compression, level, jobs):
+        """pg_dump -Fd -j N，每张表一个压缩文件"""
+        if self.max_rate_mb:
+            logger.warning("BACKUP_MAX_RATE_MB does not apply to directory backups (pg_dump writes the files itself)")
+        if compression == 'zstd':
+            # zstd压缩需要 pg_dump 16+（pg_dump --compress=zstd:N）
+            if self._pg_dump_major_version() < 16:
+                raise RuntimeError("zstd compression for directory backups requires pg_dump 16 or newer")
+            compress_arg = f'--compress=zstd:{level}'
+        else:
+            compress_arg = f'--compress={level}'
+        
+        cmd = ['pg_dump'] + self._connection_args() + [
+            '--format=directory',
+            f'--jobs={jobs}',
+            compress_arg,
+            '--file', str(backup_path)
+        ]
+        result = subprocess.run(cmd, env=self._pg_env(), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"pg_dump failed: {result.stderr.strip()}")
+    
+    def _path_size(self, path):
+        if path.is_dir():
+            return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+        return path.stat().st_size
+    
+    def _remove_backup(self, path):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    
+    def cleanup_old_backups(self, keep_days=None):
+        """清理旧备份：从仓库索引中移除过期备份，再回收不被任何备份引用的块"""
         try:
+            keep_days = Config.BACKUP_RETENTION_DAYS if keep_days is None else keep_days
             cutoff_date = datetime.now() - timedelta(days=keep_days)
             logger.info(f"Cleaning up backups older than {keep_days} days")
             
-            deleted_count = 0
-            for backup_file in self.backup_dir.glob("vmware_iaas_backup_*.sql.gz"):
+            expired = [
+                backup_id for backup_id, entry in self.store.load_index()['backups'].items()
+                if datetime.fromisoformat(entry['created']).astimezone().replace(tzinfo=None) < cutoff_date
+            ]
+            if expired:
+                self.store.remove(expired)
+                for backup_id in expired:
+                    logger.info(f"Deleted old backup: {backup_id}")
+            chunk_count, freed_bytes = self.store.gc()
+            
+            deleted_count = len(expired)
+            for backup_file in filter(_is_backup, self.backup_dir.glob(f"{BACKUP_PREFIX}*")):
                 try:
                     file_time = datetime.fromtimestamp(backup_file.stat().st_mtime)
                     if file_time < cutoff_date:
-                        backup_file.unlink()
+                        self._remove_backup(backup_file)
                         deleted_count += 1
                         logger.info(f"Deleted old backup: {backup_file.name}")
                 except Exception as e:
                     logger.error(f"Error deleting backup file {backup_file}: {str(e)}")
             
-            logger.info(f"Cleanup completed: {deleted_count} old backups deleted")
+            logger.info(f"Cleanup completed: {deleted_count} old backups deleted, "
+                        f"{chunk_count} unreferenced chunks ({self._format_size(freed_bytes)}) freed")
             
         except Exception as e:
             logger.error(f"Error during backup cleanup: {str(e)}")
     
-    def restore_db_backup(self, backup_file):
-        """恢复数据库备份"""
+    def restore_db_backup(self, backup_file, jobs=None, target_db=None):
+        """恢复数据库备份
+        
+        store (仓库中的备份ID):          按清单顺序读取并校验各块，送入 psql 标准输入
+        plain (.sql/.sql.gz/.sql.zst): 解压进程的输出直接送入 psql 标准输入，不落临时文件
+        custom/directory:              pg_restore -j N 按表并行恢复
+        target_db 为空时按备份重建原数据库，否则恢复到已存在的空库 target_db
+        """
         try:
+            if self.store.contains(backup_file):
+                logger.info(f"Restoring database from store backup {backup_file} "
+                            f"(target={target_db or self.db_name})")
+                started = time.monotonic()
+                self._restore_store(backup_file, target_db)
+                logger.info(f"Database restore completed in {time.monotonic() - started:.1f}s")
+                return True
+            
             backup_path = self.backup_dir / backup_file
             if not backup_path.exists():
                 logger.error(f"Backup file not found: {backup_path}")
                 return False
             
-            logger.info(f"Restoring database from {backup_path}")
+            jobs = jobs or Config.BACKUP_JOBS or _cpu_count()
+            backup_format = self._backup_format(backup_path)
+            logger.info(f"Restoring database from {backup_path} (format={backup_format}"
+                        f"{'' if backup_format == 'plain' else f', jobs={jobs}'}, "
+                        f"target={target_db or self.db_name})")
             
-            # 如果是压缩文件，先解压
-            if backup_path.suffix == '.gz':
-                temp_path = backup_path.with_suffix('')
-                with gzip.open(backup_path, 'rb') as f_in:
-                    with open(temp_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                restore_path = temp_path
+            started = time.monotonic()
+            if backup_format == 'plain':
+                self._restore_plain(backup_path, target_db)
             else:
-                restore_path = backup_path
-            
-            # 设置环境变量
-            env = os.environ.copy()
-            env['PGPASSWORD'] = self.db_password
-            
-            # 执行恢复
-            cmd = [
-                'psql',
-                '-h', self.db_host,
-                '-p', str(self.db_port),
-                '-U', self.db_user,
-                '-d', 'postgres',  # 连接到postgres数据库执行恢复
-                '--no-password',
-                '-f', str(restore_path)
-            ]
+                self._restore_archive(backup_path, jobs, target_db)
             
-            result = subprocess.run(
-                cmd,
-                env=env,
-                capture_output=True,
-                text=True
+            logger.info(f"Database restore completed in {time.monotonic() - started:.1f}s")
+            return True
+                
+        except Exception as e:
+            logger.error(f"Error restoring database backup: {str(e)}")
+            return False
+    
+    def _backup_format(self, backup_path):
+        if backup_path.is_dir():
+            return 'directory'
+        with open(backup_path, 'rb') as f:
+            if f.read(5) == b'PGDMP':
+                return 'custom'
+        return 'plain'
+    
+    def _decompressor_command(self, backup_path):
+        if backup_path.suffix == '.zst':
+            return ['zstd', '-dc', '-q']
+        if backup_path.suffix == '.gz':
+            return [shutil.which('pigz') or 'gzip', '-dc']
+        return None
+    
+    def _restore_plain(self, backup_path, target_db):
+        """解压 | psql，按已读取的备份字节数报告进度"""
+        # --clean --create 的备份先删除原库，恢复前完整校验一遍，不能在删除之后才发现备份截断或损坏
+        self._check_plain(backup_path)
+        
+        decompressor_cmd = self._decompressor_command(backup_path)
+        progress = _Progress('Restore', backup_path.stat().st_size, self._format_size)
+        
+        with open(backup_path, 'rb') as f_in, tempfile.TemporaryFile() as decompress_err:
+            decompressor = None
+            source = f_in
+            if decompressor_cmd:
+                decompressor = subprocess.Popen(decompressor_cmd, stdin=f_in, stdout=subprocess.PIPE,
+                                                stderr=decompress_err)
+                source = decompressor.stdout
+            
+            try:
+                # 解压进程与本进程共享同一文件偏移，即已读取的压缩字节数
+                self._restore_stream(source, target_db, progress,
+                                     lambda: os.lseek(f_in.fileno(), 0, os.SEEK_CUR))
+            finally:
+                if decompressor:
+                    decompressor.stdout.close()
+                    decompressor.wait()
+            
+            if decompressor and decompressor.returncode != 0:
+                decompress_err.seek(0)
+                raise RuntimeError(f"{decompressor_cmd[0]} failed: "
+                                   f"{decompress_err.read().decode('utf-8', 'replace').strip()}")
+        progress.update(progress.total, force=True)
+    
+    def _check_plain(self, backup_path):
+        """完整解压一遍（gzip/zstd校验和检查损坏），并确认以pg_dump结束标记结尾"""
+        logger.info(f"Checking {backup_path.name} before restore")
+        decompressor_cmd = self._decompressor_command(backup_path)
+        with open(backup_path, 'rb') as f_in, tempfile.TemporaryFile() as decompress_err:
+            if not decompressor_cmd:
+                complete = self._dump_complete(f_in)
+            else:
+                decompressor = subprocess.Popen(decompressor_cmd, stdin=f_in, stdout=subprocess.PIPE,
+                                                stderr=decompress_err)
+                try:
+                    complete = self._dump_complete(decompressor.stdout)
+                finally:
+                    decompressor.stdout.close()
+                    decompressor.wait()
+                if decompressor.returncode != 0:
+                    decompress_err.seek(0)
+                    raise RuntimeError(f"backup {backup_path.name} is corrupted: {decompressor_cmd[0]} failed: "
+                                       f"{decompress_err.read().decode('utf-8', 'replace').strip()}")
+        if not complete:
+            raise RuntimeError(f"backup {backup_path.name} is truncated (pg_dump end marker not found)")
+    
+    def _dump_complete(self, source):
+        """读完SQL流，返回末尾是否有pg_dump结束标记"""
+        tail = b''
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+            tail = (tail + chunk)[-4096:]
+        return DUMP_COMPLETE_MARKER in tail
+    
+    def _restore_store(self, backup_id, target_db):
+        """仓库块流 | psql，按已送出的字节数报告进度"""
+        entry = self.store.load_index()['backups'][backup_id]
+        # 恢复前先读取并校验全部块，块缺失或损坏时在删除原库之前失败
+        logger.info(f"Checking {backup_id} before restore")
+        with self.store.open(backup_id) as source:
+            if not self._dump_complete(source):
+                raise RuntimeError(f"backup {backup_id} is truncated (pg_dump end marker not found)")
+        
+        progress = _Progress('Restore', entry['logical_bytes'], self._format_size)
+        with self.store.open(backup_id) as source:
+            self._restore_stream(source, target_db, progress)
+        progress.update(progress.total, force=True)
+    
+    def _restore_stream(self, source, target_db, progress, position=None):
+        """将SQL流送入psql；position 返回当前进度位置，为空时按已送出的字节数计算"""
+        # 重建原库时连接postgres库执行备份中的 DROP/CREATE DATABASE
+        cmd = ['psql'] + self._connection_args(target_db or 'postgres') + ['-q', '-v', 'ON_ERROR_STOP=1']
+        
+        with tempfile.TemporaryFile() as psql_err:
+            psql = subprocess.Popen(cmd, env=self._pg_env(), stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL, stderr=psql_err)
+            sent = 0
+            try:
+                if target_db:
+                    header = self._skip_database_header(source)
+                    psql.stdin.write(header)
+                    sent += len(header)
+                for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+                    psql.stdin.write(chunk)
+                    sent += len(chunk)
+                    progress.update(position() if position else sent)
+            except BrokenPipeError:
+                # psql因SQL错误提前退出，错误信息见其stderr
+                pass
+            except Exception:
+                # 读取备份失败时不能让psql执行不完整的输入
+                psql.kill()
+                raise
+            finally:
+                try:
+                    psql.stdin.close()
+                except BrokenPipeError:
+                    pass
+                psql_code = psql.wait()
+            
+            if psql_code != 0:
+                psql_err.seek(0)
+                raise RuntimeError(f"psql failed: {psql_err.read().decode('utf-8', 'replace').strip()}")
+    
+    def _skip_database_header(self, source, max_lines=200):
+        """恢复到其他库时去掉 --create 备份头部的 DROP/CREATE/ALTER DATABASE 与 \\connect，返回其余头部内容"""
+        header = []
+        for _ in range(max_lines):
+            line = source.readline()
+            if not line:
+                break
+            if line.startswith(b'\\connect '):
+                break
+            if not line.startswith((b'DROP DATABASE ', b'CREATE DATABASE ', b'ALTER DATABASE ')):
+                header.append(line)
+        return b''.join(header)
+    
+    def _restore_archive(self, backup_path, jobs, target_db):
+        """pg_restore -j N，根据 --verbose 输出按表报告进度"""
+        listing = subprocess.run(['pg_restore', '-l', str(backup_path)], capture_output=True, text=True)
+        if listing.returncode != 0:
+            raise RuntimeError(f"pg_restore -l failed: {listing.stderr.strip()}")
+        total_tables = sum(1 for line in listing.stdout.splitlines() if ' TABLE DATA ' in line)
+        
+        if target_db:
+            cmd = ['pg_restore'] + self._connection_args(target_db)
+        else:
+            cmd = ['pg_restore'] + self._connection_args('postgres') + ['--clean', '--create']
+        cmd += [f'--jobs={jobs}', '--verbose', str(backup_path)]
+        
+        progress = _Progress('Restore', total_tables, unit='tables')
+        process = subprocess.Popen(cmd, env=self._pg_env(), stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True)
+        restored = 0
+        errors = []
+        for line in process.stderr:
+            if 'processing data for table' in line:
+                restored += 1
+                progress.update(restored)
+            elif 'error:' in line:
+                errors.append(line.strip())
+        
+        if process.wait() != 0:
+            raise RuntimeError(f"pg_restore failed with {len(errors)} errors: {' | '.join(errors[:5])}")
+        progress.update(total_tables, force=True)
+    
+    def _row_counts(self, db_name=None):
+        queries = [row[0] for row in self._psql_query(ROW_COUNT_QUERIES_SQL, db_name)]
+        if not queries:
+            return {}
+        return {table: int(count) for table, count in self._psql_query(' UNION ALL '.join(queries), db_name)}
+    
+    def verify_backup(self, backup_file, jobs=None, keep=False):
+        """将备份恢复到临时库并与当前数据库逐表比对行数，返回比对报告，恢复失败返回None
+        
+        当前库在备份之后仍有写入时，相关表的行数差异属于预期
+        """
+        scratch_db = f"{self.db_name}_verify_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        try:
+            encoding, collate, ctype = self._psql_query(DATABASE_LOCALE_SQL)[0]
+            self._psql_query(
+                f"CREATE DATABASE \"{scratch_db}\" TEMPLATE template0 ENCODING '{encoding}' "
+                f"LC_COLLATE '{collate}' LC_CTYPE '{ctype}'",
+                'postgres'
             )
             
-            # 清理临时文件
-            if backup_path.suffix == '.gz' and restore_path.exists():
-                restore_path.unlink()
+            started = time.monotonic()
+            if not self.restore_db_backup(backup_file, jobs, target_db=scratch_db):
+                return None
+            restore_seconds = time.monotonic() - started
             
-            if result.returncode == 0:
-                logger.info("Database restore completed successfully")
-                return True
+            source_counts = self._row_counts()
+            restored_counts = self._row_counts(scratch_db)
+            mismatches = [
+                {
+                    'table': table,
+                    'source': source_counts.get(table),
+                    'restored': restored_counts.get(table),
+                }
+                for table in sorted(set(source_counts) | set(restored_counts))
+                if source_counts.get(table) != restored_counts.get(table)
+            ]
+            
+            report = {
+                'backup': backup_file,
+                'scratch_db': scratch_db,
+                'restore_seconds': round(restore_seconds, 2),
+                'tables': len(restored_counts),
+                'rows': sum(restored_counts.values()),
+                'mismatches': mismatches,
+                'ok': not mismatches,
+            }
+            if mismatches:
+                logger.warning(f"Backup verification found {len(mismatches)} row count differences")
             else:
-                logger.error(f"Database restore failed: {result.stderr}")
-                return False
+                logger.info(f"Backup verification passed: {report['tables']} tables, {report['rows']} rows")
+            return report
+            
+        except Exception as e:
+            logger.error(f"Error verifying backup: {str(e)}")
+            return None
+        finally:
+            if not keep:
+                try:
+                    self._psql_query(f'DROP DATABASE IF EXISTS "{scratch_db}"', 'postgres')
+                except Exception as e:
+                    logger.error(f"Error dropping scratch database {scratch_db}: {str(e)}")
+    
+    def create_base_backup(self):
+        """创建基础备份（pg_basebackup），配合WAL归档可恢复到之后的任意时间点
+        
+        成功时返回备份信息，失败返回None；完成后按基础备份链清理过期备份和WAL
+        """
+        backup_path = None
+        try:
+            settings = dict(self._psql_query(
+                "SELECT name, setting FROM pg_settings WHERE name IN ('archive_mode', 'wal_segment_size')"
+            ))
+            if settings.get('archive_mode') == 'off':
+                logger.warning("archive_mode is off: this base backup can only be restored to its end point")
+            
+            started_at = datetime.now(timezone.utc)
+            label = f"base_{started_at.astimezone().strftime('%Y%m%d_%H%M%S')}"
+            backup_path = self.base_dir / label
+            self.base_dir.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Starting base backup to {backup_path}")
+            
+            # tar格式压缩输出 base.tar.gz 与 pg_wal.tar.gz（-X stream 包含达到一致性所需的WAL）
+            cmd = ['pg_basebackup'] + self._server_args() + [
+                '--pgdata', str(backup_path),
+                '--format=tar',
+                '--gzip',
+                '--wal-method=stream',
+                '--label', label
+            ]
+            if self.max_rate_mb:
+                # pg_basebackup 自带限速（单位kB/s，最小32kB/s）
+                cmd.append(f'--max-rate={max(int(self.max_rate_mb * 1024), 32)}k')
+            started = time.monotonic()
+            result = subprocess.run(cmd, env=self._pg_env(), capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"pg_basebackup failed: {result.stderr.strip()}")
+            elapsed = time.monotonic() - started
+            
+            with open(backup_path / 'backup_manifest') as f:
+                wal_range = json.load(f)['WAL-Ranges'][0]
+            segment_size = int(settings['wal_segment_size'])
+            info = {
+                'label': label,
+                'started_at': started_at.isoformat(),
+                # 恢复目标时间不能早于基础备份达到一致性的时间
+                'finished_at': datetime.now(timezone.utc).isoformat(),
+                'timeline': wal_range['Timeline'],
+                'start_lsn': wal_range['Start-LSN'],
+                'end_lsn': wal_range['End-LSN'],
+                'start_wal_segment': _wal_segment_name(wal_range['Timeline'], wal_range['Start-LSN'], segment_size),
+                'bytes': self._path_size(backup_path),
+                'seconds': round(elapsed, 2),
+            }
+            with open(backup_path / BASE_BACKUP_INFO, 'w') as f:
+                json.dump(info, f, indent=2)
+            
+            logger.info(f"Base backup {label} completed: {self._format_size(info['bytes'])} in {info['seconds']}s, "
+                        f"WAL from {info['start_wal_segment']}")
+            
+            self.cleanup_base_backups()
+            return info
+            
+        except Exception as e:
+            logger.error(f"Error creating base backup: {str(e)}")
+            if backup_path is not None:
+                self._remove_backup(backup_path)
+            return None
+    
+    def list_base_backups(self):
+        """按时间顺序列出完整的基础备份（未写入信息文件的视为未完成）"""
+        backups = []
+        if not self.base_dir.exists():
+            return backups
+        for info_path in sorted(self.base_dir.glob(f'base_*/{BASE_BACKUP_INFO}')):
+            with open(info_path) as f:
+                info = json.load(f)
+            info['path'] = str(info_path.parent)
+            backups.append(info)
+        return backups
+    
+    def cleanup_base_backups(self, keep=None):
+        """保留最近 keep 条基础备份链，删除更早的基础备份及最早保留链起点之前的WAL段"""
+        try:
+            keep = keep or Config.BACKUP_BASE_RETENTION
+            backups = self.list_base_backups()
+            if len(backups) <= keep:
+                return
+            
+            for backup in backups[:-keep]:
+                self._remove_backup(Path(backup['path']))
+                logger.info(f"Deleted expired base backup: {backup['label']}")
+            
+            # 段文件名后16位为日志序号，跨时间线比较时忽略前8位时间线；时间线历史文件始终保留
+            oldest_segment = backups[-keep]['start_wal_segment'][8:]
+            deleted_count = 0
+            for wal_file in self.wal_dir.glob('*.gz'):
+                segment = wal_file.name.split('.')[0]
+                if len(segment) == 24 and segment[8:] < oldest_segment:
+                    wal_file.unlink()
+                    deleted_count += 1
+            logger.info(f"WAL cleanup completed: {deleted_count} archived segments deleted before {oldest_segment}")
+            
+        except Exception as e:
+            logger.error(f"Error during base backup cleanup: {str(e)}")
+    
+    def get_wal_status(self):
+        """基础备份链、WAL归档和可恢复时间范围"""
+        backups = self.list_base_backups()
+        segments = list(self.wal_dir.glob('*.gz')) if self.wal_dir.exists() else []
+        status = {
+            'base_backups': len(backups),
+            'base_size': self._format_size(sum(backup['bytes'] for backup in backups)),
+            'wal_segments': len(segments),
+            'wal_size': self._format_size(sum(segment.stat().st_size for segment in segments)),
+            'recoverable_from': backups[0]['finished_at'] if backups else None,
+            'last_archived_wal': None,
+            'last_archived_time': None,
+            'last_failed_wal': None,
+        }
+        try:
+            row = self._psql_query(
+                "SELECT last_archived_wal, last_archived_time, last_failed_wal FROM pg_stat_archiver"
+            )[0]
+            status['last_archived_wal'], status['last_archived_time'], status['last_failed_wal'] = (
+                value or None for value in row
+            )
+        except Exception as e:
+            logger.warning(f"Could not read archiver status: {str(e)}")
+        return status
+    
+    def restore_pitr(self, target_time, target_dir):
+        """准备时间点恢复的数据目录：解压目标时间之前最近的基础备份并写入恢复配置
+        
+        用该目录启动PostgreSQL后会从WAL归档回放到 target_time 并提升为主库；
+        目录需由数据库服务账号拥有，且归档目录在数据库服务器上路径相同
+        """
+        try:
+            target = datetime.fromisoformat(target_time)
+            if target.tzinfo is None:
+                target = target.astimezone()
+            
+            candidates = [
+                backup for backup in self.list_base_backups()
+                if datetime.fromisoformat(backup['finished_at']) <= target
+            ]
+            if not candidates:
+                logger.error(f"No base backup finished before {target.isoformat()}")
+                return None
+            backup = candidates[-1]
+            
+            target_path = Path(target_dir)
+            if target_path.exists() and any(target_path.iterdir()):
+                logger.error(f"Target directory is not empty: {target_path}")
+                return None
+            target_path.mkdir(parents=True, exist_ok=True)
+            target_path.chmod(0o700)
+            
+            logger.info(f"Restoring base backup {backup['label']} to {target_path}")
+            backup_path = Path(backup['path'])
+            with tarfile.open(backup_path / 'base.tar.gz') as tar:
+                tar.extractall(target_path)
+            with tarfile.open(backup_path / 'pg_wal.tar.gz') as tar:
+                tar.extractall(target_path / 'pg_wal')
+            
+            with open(target_path / 'postgresql.auto.conf', 'a') as f:
+                f.write(
+                    f"\n# 时间点恢复（backup_manager.py --pitr 生成）\n"
+                    f"restore_command = 'gunzip -c \"{self.wal_dir}/%f.gz\" > \"%p\"'\n"
+                    f"recovery_target_time = '{target.isoformat()}'\n"
+                    f"recovery_target_action = 'promote'\n"
+                )
+            (target_path / 'recovery.signal').touch()
+            
+            logger.info(f"PITR data directory ready: {target_path} (target {target.isoformat()})")
+            return {
+                'base_backup': backup['label'],
+                'target_time': target.isoformat(),
+                'data_directory': str(target_path),
+            }
+            
+        except Exception as e:
+            logger.error(f"Error preparing point-in-time restore: {str(e)}")
+            return None
+    
+    @contextmanager
+    def _run_lock(self):
+        """非阻塞获取备份任务锁，产出是否获取成功"""
+        with open(self.backup_dir / RUN_LOCK_FILE, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _lower_priority(self):
+        """降低本进程的CPU与I/O优先级，pg_dump、压缩进程等子进程随之继承"""
+        if self._priority_lowered:
+            return
+        self._priority_lowered = True
+        if Config.BACKUP_NICE:
+            os.nice(Config.BACKUP_NICE)
+        if shutil.which('ionice'):
+            result = subprocess.run(
+                ['ionice', '-c', str(Config.BACKUP_IONICE_CLASS), '-n', str(Config.BACKUP_IONICE_LEVEL),
+                 '-p', str(os.getpid())],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                logger.warning(f"ionice failed: {result.stderr.strip()}")
+    
+    def _record_run(self, job, result, seconds=None, size_bytes=None):
+        """将任务结果写入指标文件（原子替换），由Web应用的Prometheus导出器读取"""
+        try:
+            metrics_path = Path(Config.BACKUP_METRICS_FILE)
+            with open(metrics_path.with_suffix('.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(metrics_path) as f:
+                        metrics = json.load(f)
+                except FileNotFoundError:
+                    metrics = {'jobs': {}}
+                
+                stats = metrics['jobs'].setdefault(job, {'runs': {'success': 0, 'failure': 0, 'skipped': 0}})
+                stats['runs'][result] += 1
+                if result != 'skipped':
+                    stats['last_run'] = time.time()
+                    stats['last_result'] = result
+                    stats['duration_seconds'] = seconds
+                    if result == 'success':
+                        stats['last_success'] = stats['last_run']
+                        stats['size_bytes'] = size_bytes
+                
+                index = self.store.load_index()
+                metrics['store'] = {
+                    'backups': len(index['backups']),
+                    'stored_bytes': index['stored_bytes'],
+                    'logical_bytes': sum(entry['logical_bytes'] for entry in index['backups'].values()),
+                }
+                metrics['updated'] = time.time()
                 
+                tmp_path = metrics_path.with_suffix('.tmp')
+                with open(tmp_path, 'w') as f:
+                    json.dump(metrics, f, indent=2)
+                os.replace(tmp_path, metrics_path)
         except Exception as e:
-            logger.error(f"Error restoring database backup: {str(e)}")
-            return False
+            logger.error(f"Error recording backup metrics: {str(e)}")
+    
+    def run_job(self, job, func):
+        """在备份锁内以低优先级执行任务并记录结果；已有任务运行时跳过
+        
+        返回任务结果，跳过或失败时返回None
+        """
+        with self._run_lock() as acquired:
+            if not acquired:
+                logger.warning(f"Skipping {job}: another backup job is still running")
+                self._record_run(job, 'skipped')
+                return None
+            
+            self._lower_priority()
+            started = time.monotonic()
+            result = func()
+            seconds = round(time.monotonic() - started, 2)
+            if result:
+                size_bytes = result.get('output_bytes', result.get('bytes'))
+                self._record_run(job, 'success', seconds, size_bytes)
+            else:
+                self._record_run(job, 'failure', seconds)
+            return result
+    
+    def run_scheduler(self):
+        """按cron策略循环执行备份任务（前台运行，由容器或进程管理器守护）"""
+        policies = {
+            'backup': (Config.BACKUP_SCHEDULE, self.create_db_backup),
+            'base_backup': (Config.BACKUP_BASE_SCHEDULE, self.create_base_backup),
+        }
+        schedules = {
+            job: (_CronSchedule(expression), func)
+            for job, (expression, func) in policies.items() if expression.strip()
+        }
+        if not schedules:
+            raise ValueError("no backup schedule configured (BACKUP_SCHEDULE / BACKUP_BASE_SCHEDULE)")
+        
+        next_runs = {job: schedule.next_after(datetime.now()) for job, (schedule, _) in schedules.items()}
+        for job, (schedule, _) in schedules.items():
+            logger.info(f"Scheduled {job} '{schedule.expression}', next run at {next_runs[job]}")
+        
+        while True:
+            job = min(next_runs, key=next_runs.get)
+            # 分段休眠，系统时间调整后仍能按时触发
+            while datetime.now() < next_runs[job]:
+                time.sleep(min((next_runs[job] - datetime.now()).total_seconds(), 60))
+            
+            logger.info(f"Running scheduled {job}")
+            self.run_job(job, schedules[job][1])
+            # 任务耗时超过间隔时跳过错过的时间点，不连续补跑
+            next_runs[job] = schedules[job][0].next_after(datetime.now())
+            logger.info(f"Next {job} at {next_runs[job]}")
     
     def list_backups(self):
-        """列出所有可用的备份"""
+        """列出所有可用的备份：仓库备份来自索引文件，plain/directory格式的备份文件逐个读取"""
         try:
             backups = []
-            for backup_file in sorted(self.backup_dir.glob("vmware_iaas_backup_*.sql.gz")):
+            for backup_id, entry in self.store.load_index()['backups'].items():
+                backups.append({
+                    'filename': backup_id,
+                    'size': self._format_size(entry['logical_bytes']),
+                    'bytes': entry['logical_bytes'],
+                    'stored_bytes': entry['new_bytes'],
+                    'created': datetime.fromisoformat(entry['created']).astimezone().strftime('%Y-%m-%d %H:%M:%S'),
+                    'path': str(self.store.manifest_dir / f'{backup_id}.json')
+                })
+            for backup_file in sorted(filter(_is_backup, self.backup_dir.glob(f"{BACKUP_PREFIX}*"))):
                 stat = backup_file.stat()
+                size_bytes = self._path_size(backup_file)
                 backups.append({
                     'filename': backup_file.name,
-                    'size': self._format_size(stat.st_size),
+                    'size': self._format_size(size_bytes),
+                    'bytes': size_bytes,
+                    'stored_bytes': size_bytes,
                     'created': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
                     'path': str(backup_file)
                 })
             
-            return backups
+            return sorted(backups, key=lambda backup: (backup['created'], backup['filename']))
             
         except Exception as e:
             logger.error(f"Error listing backups: {str(e)}")
@@ -215,9 +1114,11 @@ class BackupManager:
         """获取备份状态信息"""
         try:
             backups = self.list_backups()
-            total_size = sum(
-                Path(backup['path']).stat().st_size 
-                for backup in backups
+            index = self.store.load_index()
+            # 仓库占用按索引中的块统计，备份文件按各自大小
+            logical_size = sum(backup['bytes'] for backup in backups)
+            total_size = index['stored_bytes'] + sum(
+                backup['bytes'] for backup in backups if backup['filename'] not in index['backups']
             )
             
             latest_backup = None
@@ -227,6 +1128,9 @@ class BackupManager:
             return {
                 'total_backups': len(backups),
                 'total_size': self._format_size(total_size),
+                'logical_size': self._format_size(logical_size),
+                'dedup_ratio': round(logical_size / total_size, 2) if total_size else None,
+                'store_chunks': index['chunk_count'],
                 'latest_backup': latest_backup,
                 'backup_directory': str(self.backup_dir)
             }
@@ -242,32 +1146,116 @@ def main():
     parser = argparse.ArgumentParser(description='VMware IaaS Backup Manager')
     parser.add_argument('--backup', action='store_true', help='Create database backup')
     parser.add_argument('--restore', type=str, help='Restore from backup file')
+    parser.add_argument('--verify', type=str, metavar='BACKUP',
+                        help='Restore into a scratch database and compare row counts with the current database')
+    parser.add_argument('--keep-scratch', action='store_true', help='Keep the scratch database after --verify')
     parser.add_argument('--list', action='store_true', help='List all backups')
     parser.add_argument('--status', action='store_true', help='Show backup status')
     parser.add_argument('--cleanup', type=int, metavar='DAYS', help='Cleanup backups older than N days')
+    parser.add_argument('--base-backup', action='store_true', help='Create a base backup for WAL-based PITR')
+    parser.add_argument('--pitr', metavar='TIME', help='Prepare a data directory recovered to TIME (ISO 8601)')
+    parser.add_argument('--pitr-dir', metavar='DIR', help='Empty data directory for --pitr')
+    parser.add_argument('--wal-cleanup', action='store_true',
+                        help='Apply base backup chain retention (--keep-chains, default BACKUP_BASE_RETENTION)')
+    parser.add_argument('--keep-chains', type=int, help='Number of base backup chains to keep')
+    parser.add_argument('--format', choices=['store', 'plain', 'directory'], help='Backup format (default: BACKUP_FORMAT)')
+    parser.add_argument('--compression', choices=sorted(COMPRESSIONS), help='Compression (default: BACKUP_COMPRESSION)')
+    parser.add_argument('--level', type=int, help='Compression level (gzip/store 1-9, zstd 1-19)')
+    parser.add_argument('--jobs', type=int, help='Parallel dump/restore jobs (default: CPU count)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run scheduled backups (BACKUP_SCHEDULE / BACKUP_BASE_SCHEDULE) in the foreground')
+    parser.add_argument('--max-rate', type=float, metavar='MB_S',
+                        help='Dump throughput cap in MB/s, 0 for unlimited (default: BACKUP_MAX_RATE_MB)')
     
     args = parser.parse_args()
     
     backup_manager = BackupManager()
+    if args.max_rate is not None:
+        backup_manager.max_rate_mb = args.max_rate
+    
+    if args.daemon:
+        try:
+            backup_manager.run_scheduler()
+        except KeyboardInterrupt:
+            logger.info("Backup scheduler stopped")
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
     
-    if args.backup:
+    elif args.backup:
         logger.info("Starting database backup...")
-        success = backup_manager.create_db_backup()
-        if success:
+        stats = backup_manager.run_job(
+            'backup',
+            lambda: backup_manager.create_db_backup(args.format, args.compression, args.level, args.jobs)
+        )
+        if stats:
             print("✅ Database backup completed successfully")
+            print(f"  File: {stats['path']}")
+            print(f"  Format: {stats['format']} ({stats['compression']}:{stats['level']}, jobs={stats['jobs']})")
+            print(f"  Size: {backup_manager._format_size(stats['output_bytes'])} "
+                  f"(database {backup_manager._format_size(stats['database_bytes'])})")
+            print(f"  Time: {stats['seconds']}s, throughput {stats['throughput_mb_s']} MB/s")
+            print(f"  Compression ratio: {stats['compression_ratio']}x ({stats['ratio_basis']} size)")
+            if 'chunks' in stats:
+                print(f"  Chunks: {stats['new_chunks']} new of {stats['chunks']}")
         else:
             print("❌ Database backup failed")
             sys.exit(1)
     
     elif args.restore:
         logger.info(f"Starting database restore from {args.restore}...")
-        success = backup_manager.restore_db_backup(args.restore)
+        success = backup_manager.restore_db_backup(args.restore, args.jobs)
         if success:
             print("✅ Database restore completed successfully")
         else:
             print("❌ Database restore failed")
             sys.exit(1)
     
+    elif args.base_backup:
+        logger.info("Starting base backup...")
+        info = backup_manager.run_job('base_backup', backup_manager.create_base_backup)
+        if info:
+            print("✅ Base backup completed successfully")
+            print(f"  Path: {backup_manager.base_dir / info['label']}")
+            print(f"  Size: {backup_manager._format_size(info['bytes'])}, time {info['seconds']}s")
+            print(f"  WAL start: {info['start_wal_segment']} ({info['start_lsn']})")
+        else:
+            print("❌ Base backup failed")
+            sys.exit(1)
+    
+    elif args.pitr:
+        if not args.pitr_dir:
+            parser.error('--pitr requires --pitr-dir')
+        result = backup_manager.restore_pitr(args.pitr, args.pitr_dir)
+        if result:
+            print(f"✅ Data directory prepared from {result['base_backup']}")
+            print(f"  Recovery target: {result['target_time']}")
+            print(f"  Start PostgreSQL on {result['data_directory']} (owned by the postgres user) to replay WAL")
+        else:
+            print("❌ Point-in-time restore failed")
+            sys.exit(1)
+    
+    elif args.wal_cleanup:
+        backup_manager.cleanup_base_backups(args.keep_chains)
+        print("✅ Base backup cleanup completed")
+    
+    elif args.verify:
+        logger.info(f"Verifying backup {args.verify}...")
+        report = backup_manager.verify_backup(args.verify, args.jobs, args.keep_scratch)
+        if report is None:
+            print("❌ Backup verification failed")
+            sys.exit(1)
+        print(f"Restored into {report['scratch_db']} in {report['restore_seconds']}s: "
+              f"{report['tables']} tables, {report['rows']} rows")
+        if report['ok']:
+            print("✅ Row counts match the current database")
+        else:
+            print(f"{'Table':<40} {'Current':>12} {'Restored':>12}")
+            for mismatch in report['mismatches']:
+                print(f"{mismatch['table']:<40} {str(mismatch['source']):>12} {str(mismatch['restored']):>12}")
+            print("❌ Row counts differ (expected for tables written after the backup was taken)")
+            sys.exit(1)
+    
     elif args.list:
         backups = backup_manager.list_backups()
         if backups:
@@ -286,14 +1274,24 @@ def main():
             print("Backup Status:")
             print(f"  Total backups: {status['total_backups']}")
             print(f"  Total size: {status['total_size']}")
+            if status['dedup_ratio']:
+                print(f"  Logical size: {status['logical_size']} (dedup ratio {status['dedup_ratio']}x)")
+            print(f"  Store chunks: {status['store_chunks']}")
             print(f"  Backup directory: {status['backup_directory']}")
             if status['latest_backup']:
                 print(f"  Latest backup: {status['latest_backup']['filename']}")
                 print(f"  Created: {status['latest_backup']['created']}")
+            wal = backup_manager.get_wal_status()
+            print(f"  Base backups: {wal['base_backups']} ({wal['base_size']})")
+            print(f"  Archived WAL: {wal['wal_segments']} files ({wal['wal_size']})")
+            if wal['recoverable_from']:
+                print(f"  Recoverable from: {wal['recoverable_from']} to {wal['last_archived_time'] or 'latest base'}")
+            if wal['last_failed_wal']:
+                print(f"  ⚠️  Last failed WAL archive: {wal['last_failed_wal']}")
         else:
             print("❌ Could not get backup status")
     
-    elif args.cleanup:
+    elif args.cleanup is not None:
         logger.info(f"Cleaning up backups older than {args.cleanup} days...")
         backup_manager.cleanup_old_backups(args.cleanup)
         print(f"✅ Cleanup completed")
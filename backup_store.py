@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 内容寻址去重备份仓库
+备份数据流按内容定义分块（窗口滚动哈希），每块以SHA-256寻址并单独压缩，
+相同内容的块只存一份；index.json 汇总所有备份与仓库用量，列表和状态查询只读这一个文件。
+
+目录结构:
+  index.json                备份索引与仓库统计
+  manifests/<备份ID>.json    备份的块列表
+  chunks/<前2位>/<哈希>       zlib压缩的块数据
+"""
+
+import io
+import os
+import json
+import zlib
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+INDEX_VERSION = 1
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class RollingChunker:
+    """内容定义分块：窗口多项式滚动哈希（Rabin-Karp，模2^32），窗口哈希低于阈值处为候选边界
+
+    边界只取决于窗口内的字节，插入或删除只影响附近的块，未变化的内容切出的块与上次备份相同。
+    前缀哈希用模逆元展开成 cumsum，按段在numpy中向量化计算
+    """
+
+    PRIME = 0x01000193
+    SEGMENT_SIZE = 1024 * 1024
+
+    def __init__(self, min_size=128 * 1024, avg_size=512 * 1024, max_size=2 * 1024 * 1024, window=64):
+        if not 0 < window <= min_size < avg_size <= max_size:
+            raise ValueError("chunk sizes must satisfy window <= min < avg <= max")
+        # numpy仅在分块写入时导入，列表/状态/恢复等命令不承担其导入开销
+        import numpy as np
+        self.min_size = min_size
+        self.max_size = max_size
+        self.window = window
+        # 跳过min_size之后每个位置成为边界的概率为 1/(avg-min)，平均块长约为avg
+        self.threshold = np.uint32((1 << 32) // (avg_size - min_size))
+
+        length = self.SEGMENT_SIZE + window
+        with np.errstate(over='ignore'):
+            powers = np.full(length, self.PRIME, dtype=np.uint32)
+            powers[0] = 1
+            self.powers = np.cumprod(powers, dtype=np.uint32)
+            inverse = np.full(length, pow(self.PRIME, -1, 1 << 32), dtype=np.uint32)
+            inverse[0] = 1
+            self.inverse_powers = np.cumprod(inverse, dtype=np.uint32)
+        self.window_power = self.powers[window]
+
+    def _candidates(self, data):
+        """返回所有候选边界（块结束位置，不含）"""
+        import numpy as np
+        view = np.frombuffer(data, dtype=np.uint8)
+        candidates = []
+        for segment_start in range(0, len(view), self.SEGMENT_SIZE):
+            low = max(segment_start - self.window, 0)
+            values = view[low:segment_start + self.SEGMENT_SIZE].astype(np.uint32)
+            n = len(values)
+            if n <= self.window:
+                break
+            with np.errstate(over='ignore'):
+                # H[i] = sum(x[j] * p^(i-j)) = p^i * cumsum(x[j] * p^-j)
+                prefix = self.powers[:n] * np.cumsum(values * self.inverse_powers[:n], dtype=np.uint32)
+                # hashes[k] 为以 low+k+window 结尾的窗口哈希
+                hashes = prefix[self.window:] - self.window_power * prefix[:-self.window]
+            candidates.append(np.flatnonzero(hashes < self.threshold) + (low + self.window + 1))
+        return np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+
+    def _cut_points(self, data):
+        """在 data 中贪心选择块边界，返回边界列表（最后一个边界之后的内容尚未成块）"""
+        import numpy as np
+        candidates = self._candidates(data)
+        cuts = []
+        start = 0
+        while True:
+            i = np.searchsorted(candidates, start + self.min_size)
+            if i < len(candidates) and candidates[i] <= start + self.max_size:
+                start = int(candidates[i])
+            elif len(data) - start >= self.max_size:
+                start += self.max_size
+            else:
+                return cuts
+            cuts.append(start)
+
+    def split(self, stream):
+        """从可读流中按块产出bytes"""
+        buffer = b''
+        for block in iter(lambda: stream.read(READ_BLOCK_SIZE), b''):
+            buffer += block
+            if len(buffer) < self.max_size:
+                continue
+            start = 0
+            for cut in self._cut_points(buffer):
+                yield buffer[start:cut]
+                start = cut
+            buffer = buffer[start:]
+        # 流结束：剩余内容中的边界照常切分，末尾不足一块的部分单独成块
+        start = 0
+        for cut in self._cut_points(buffer):
+            yield buffer[start:cut]
+            start = cut
+        if start < len(buffer):
+            yield buffer[start:]
+
+
+class _ChunkReader(io.RawIOBase):
+    """按清单顺序解压块，作为只读流供恢复使用"""
+
+    def __init__(self, store, chunk_ids):
+        self.store = store
+        self.chunk_ids = iter(chunk_ids)
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            chunk_id = next(self.chunk_ids, None)
+            if chunk_id is None:
+                return 0
+            self.pending = memoryview(self.store.read_chunk(chunk_id))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class ChunkStore:
+    def __init__(self, root, compression_level=3, chunker=None):
+        self.root = Path(root)
+        self.chunk_dir = self.root / 'chunks'
+        self.manifest_dir = self.root / 'manifests'
+        self.index_path = self.root / 'index.json'
+        self.compression_level = compression_level
+        self._chunker = chunker
+
+    @property
+    def chunker(self):
+        if self._chunker is None:
+            self._chunker = RollingChunker()
+        return self._chunker
+
+    @contextmanager
+    def _lock(self):
+        """写入与GC互斥：GC不能删除正在写入的备份已上传但清单尚未保存的块"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _chunk_path(self, chunk_id):
+        return self.chunk_dir / chunk_id[:2] / chunk_id
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': INDEX_VERSION, 'backups': {}, 'stored_bytes': 0, 'chunk_count': 0}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _write_chunk(self, chunk_id, data, compression_level):
+        """写入新块，返回压缩后字节数；块已存在时返回0"""
+        path = self._chunk_path(chunk_id)
+        if path.exists():
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = zlib.compress(data, compression_level)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return len(compressed)
+
+    def read_chunk(self, chunk_id):
+        with open(self._chunk_path(chunk_id), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f"chunk {chunk_id} is corrupted")
+        return data
+
+    def contains(self, backup_id):
+        return backup_id in self.load_index()['backups']
+
+    def put(self, backup_id, stream, metadata=None, compression_level=None, finalize=None):
+        """分块写入一个备份，返回该备份的索引条目
+
+        finalize 在全部块写入之后、清单与索引写入之前调用（如检查数据源进程的退出码），
+        抛出异常时不登记该备份，已写入的块由gc回收
+        """
+        compression_level = compression_level or self.compression_level
+        with self._lock():
+            index = self.load_index()
+            if backup_id in index['backups']:
+                raise ValueError(f"backup {backup_id} already exists")
+
+            chunk_ids = []
+            logical_bytes = new_bytes = new_chunks = 0
+            for data in self.chunker.split(stream):
+                chunk_id = hashlib.sha256(data).hexdigest()
+                written = self._write_chunk(chunk_id, data, compression_level)
+                if written:
+                    new_bytes += written
+                    new_chunks += 1
+                chunk_ids.append(chunk_id)
+                logical_bytes += len(data)
+            if finalize is not None:
+                finalize()
+
+            self.manifest_dir.mkdir(parents=True, exist_ok=True)
+            entry = dict(
+                metadata or {},
+                created=datetime.now(timezone.utc).isoformat(),
+                logical_bytes=logical_bytes,
+                new_bytes=new_bytes,
+                chunks=len(chunk_ids),
+                new_chunks=new_chunks,
+            )
+            manifest_path = self.manifest_dir / f'{backup_id}.json'
+            with open(manifest_path.with_suffix('.tmp'), 'w') as f:
+                json.dump(dict(entry, id=backup_id, chunk_ids=chunk_ids), f)
+            os.replace(manifest_path.with_suffix('.tmp'), manifest_path)
+
+            index['backups'][backup_id] = entry
+            index['stored_bytes'] += new_bytes
+            index['chunk_count'] += new_chunks
+            self._save_index(index)
+            return entry
+
+    def open(self, backup_id):
+        """以流的方式读取备份内容"""
+        with open(self.manifest_dir / f'{backup_id}.json') as f:
+            manifest = json.load(f)
+        return io.BufferedReader(_ChunkReader(self, manifest['chunk_ids']), READ_BLOCK_SIZE)
+
+    def remove(self, backup_ids):
+        """从索引中移除备份（块由gc回收）"""
+        with self._lock():
+            index = self.load_index()
+            for backup_id in backup_ids:
+                index['backups'].pop(backup_id, None)
+                (self.manifest_dir / f'{backup_id}.json').unlink(missing_ok=True)
+            self._save_index(index)
+
+    def gc(self):
+        """标记-清除：删除不被任何清单引用的块，返回 (删除块数, 释放字节数)"""
+        with self._lock():
+            index = self.load_index()
+            referenced = set()
+            for backup_id in index['backups']:
+                with open(self.manifest_dir / f'{backup_id}.json') as f:
+                    referenced.update(json.load(f)['chunk_ids'])
+
+            deleted = freed = 0
+            if self.chunk_dir.exists():
+                for prefix in os.scandir(self.chunk_dir):
+                    for entry in os.scandir(prefix.path):
+                        # 中断写入留下的临时文件一并清理
+                        if entry.name not in referenced:
+                            freed += entry.stat().st_size
+                            os.unlink(entry.path)
+                            deleted += not entry.name.endswith('.tmp')
+
+            index['stored_bytes'] = max(index['stored_bytes'] - freed, 0)
+            index['chunk_count'] = max(index['chunk_count'] - deleted, 0)
+            self._save_index(index)
+            return deleted, freed
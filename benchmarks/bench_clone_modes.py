@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 克隆方式基准测试
+
+在模拟驱动上按各克隆方式并发开通一批虚拟机（每种方式使用新的驱动实例，默认首次使用时创建基础快照，
+--warm-base 预先创建），比较:
+  开通耗时  - 从提交到克隆完成的p50/p95/最大值（含排队与基础快照创建，换算为模型秒）
+  首台耗时  - 第一台虚拟机的耗时（链接/即时克隆包含创建基础快照）
+  存储占用  - 每台虚拟机平均占用与总占用（GB）
+实际等待时间 = 模型耗时 x --time-scale
+
+用法:
+  python benchmarks/bench_clone_modes.py --vms 50 --concurrency 8
+  python benchmarks/bench_clone_modes.py --template Windows-Server-2022-Template --time-scale 0.001
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hypervisor import FakeDriver, CLONE_MODES
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0
+
+
+def run(mode, template, vms, concurrency, time_scale, seed, warm_base=False):
+    driver = FakeDriver(time_scale=time_scale, seed=seed)
+    if warm_base and mode != 'full':
+        driver.ensure_base_snapshot(template['name'], powered_on=mode == 'instant')
+
+    def clone(i):
+        result = driver.clone(template['name'], f'bench-{mode}-{i}', mode, template['min_cpu_cores'],
+                              template['min_memory_gb'], template['disk_gb'])
+        return time.perf_counter(), result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(clone, range(vms)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [(finished - started) / time_scale for finished, _ in results]
+    storage = [result['storage_gb'] for _, result in results]
+    return {
+        'clone_mode': mode,
+        'vms': vms,
+        'first_s': round(min(latencies), 1),
+        'p50_s': round(percentile(latencies, 50), 1),
+        'p95_s': round(percentile(latencies, 95), 1),
+        'max_s': round(max(latencies), 1),
+        'batch_s': round(elapsed / time_scale, 1),
+        'storage_avg_gb': round(sum(storage) / len(storage), 2),
+        'storage_total_gb': round(sum(storage), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clone mode benchmark on the simulated hypervisor driver')
+    parser.add_argument('--vms', type=int, default=50, help='VMs provisioned per clone mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clones (provision workers)')
+    parser.add_argument('--template', default='Ubuntu-22.04-Template')
+    parser.add_argument('--time-scale', type=float, default=0.002, help='Wall seconds per modelled second')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--modes', default=','.join(CLONE_MODES))
+    parser.add_argument('--warm-base', action='store_true',
+                        help='Create base snapshots before timing (steady state instead of first use)')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    templates = {template['name']: template for template in FakeDriver().list_templates()}
+    if args.template not in templates:
+        parser.error(f"unknown template {args.template}, choose from {', '.join(templates)}")
+    template = templates[args.template]
+
+    print(f"template={template['name']} disk={template['disk_gb']}GB vms={args.vms} concurrency={args.concurrency}")
+    print(f"\n{'mode':<8} {'first s':>8} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'batch s':>8} "
+          f"{'GB/vm':>7} {'total GB':>9}")
+    results = []
+    for mode in args.modes.split(','):
+        result = run(mode, template, args.vms, args.concurrency, args.time_scale, args.seed, args.warm_base)
+        results.append(result)
+        print(f"{mode:<8} {result['first_s']:>8} {result['p50_s']:>8} {result['p95_s']:>8} {result['max_s']:>8} "
+              f"{result['batch_s']:>8} {result['storage_avg_gb']:>7} {result['storage_total_gb']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
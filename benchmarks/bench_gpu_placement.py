@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - GPU放置模拟器基准测试
+
+生成（或加载）GPU请求轨迹：虚拟机按泊松过程到达、按指数分布的时长释放，
+每个请求为 GPU型号 x 卡数（1/2/4/8）。在同一主机规模上按各放置策略回放轨迹，比较:
+  放置吞吐  - 每秒放置决策数（只计放置与释放调用，不含轨迹生成）
+  装箱效率  - 接受率、平均利用率、首次拒绝时的利用率、平均碎片率
+  scan      - 对照组: 每次线性扫描所有主机的first-fit（旧方案的典型实现）
+
+用法:
+  python benchmarks/bench_gpu_placement.py --hosts 500 --events 200000
+  python benchmarks/bench_gpu_placement.py --save-trace trace.json
+  python benchmarks/bench_gpu_placement.py --trace trace.json --policies best_fit,worst_fit
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gpu_placement import GpuCapacityIndex, POLICIES
+
+# 各型号单机卡数
+HOST_SHAPES = {'t4': 4, '3090': 8}
+# 请求卡数分布
+COUNT_WEIGHTS = {1: 50, 2: 25, 4: 15, 8: 10}
+
+
+def build_fleet(hosts):
+    """按型号均分主机，返回 [(host_name, gpu_type, slots)]"""
+    fleet = []
+    for i in range(hosts):
+        gpu_type = list(HOST_SHAPES)[i % len(HOST_SHAPES)]
+        fleet.append((f'esxi-{i:05d}', gpu_type, HOST_SHAPES[gpu_type]))
+    return fleet
+
+
+def generate_trace(fleet, events, load, seed):
+    """生成按时间排序的事件 [(time, 'place'|'release', request_id, gpu_type, count)]
+
+    load为稳态下请求卡数与总卡数之比，>1时持续超额以观察拒绝与碎片
+    """
+    rng = random.Random(seed)
+    counts, weights = zip(*COUNT_WEIGHTS.items())
+    mean_count = sum(c * w for c, w in COUNT_WEIGHTS.items()) / sum(weights)
+    total_slots = sum(slots for _, _, slots in fleet)
+    mean_lifetime = 100.0
+    # 稳态占用卡数 = 到达率 * 平均时长 * 平均卡数
+    arrival_rate = load * total_slots / (mean_lifetime * mean_count)
+
+    trace = []
+    now = 0.0
+    for request_id in range(events // 2):
+        now += rng.expovariate(arrival_rate)
+        gpu_type = rng.choice(list(HOST_SHAPES))
+        count = min(rng.choices(counts, weights)[0], HOST_SHAPES[gpu_type])
+        trace.append((now, 'place', request_id, gpu_type, count))
+        trace.append((now + rng.expovariate(1 / mean_lifetime), 'release', request_id, gpu_type, count))
+    trace.sort()
+    return trace
+
+
+class ScanPlacer:
+    """对照组：主机列表 + 线性扫描first-fit"""
+
+    def __init__(self, fleet):
+        self.hosts = [[host, gpu_type, slots, 0] for host, gpu_type, slots in fleet]
+        self.by_name = {entry[0]: entry for entry in self.hosts}
+
+    def place(self, gpu_type, count):
+        for entry in self.hosts:
+            if entry[1] == gpu_type and entry[2] - entry[3] >= count:
+                entry[3] += count
+                return entry[0]
+        return None
+
+    def release(self, host, gpu_type, count):
+        self.by_name[host][3] -= count
+
+
+def replay(fleet, trace, policy):
+    """回放轨迹，返回吞吐与装箱指标"""
+    if policy == 'scan':
+        placer = ScanPlacer(fleet)
+        index = None
+    else:
+        index = placer = GpuCapacityIndex.from_rows(((h, t, s, 0) for h, t, s in fleet), policy)
+
+    total_slots = sum(slots for _, _, slots in fleet)
+    placements = {}
+    accepted = rejected = used = 0
+    utilization_sum = fragmentation_sum = 0.0
+    samples = 0
+    first_reject_utilization = None
+    decision_time = 0.0
+
+    for step, (_, kind, request_id, gpu_type, count) in enumerate(trace):
+        started = time.perf_counter()
+        if kind == 'place':
+            host = placer.place(gpu_type, count)
+        else:
+            host = placements.pop(request_id, None)
+            if host is not None:
+                placer.release(host, gpu_type, count)
+        decision_time += time.perf_counter() - started
+
+        if kind == 'place':
+            if host is None:
+                rejected += 1
+                if first_reject_utilization is None:
+                    first_reject_utilization = used / total_slots
+            else:
+                accepted += 1
+                placements[request_id] = host
+                used += count
+        elif host is not None:
+            used -= count
+
+        utilization_sum += used / total_slots
+        samples += 1
+        # 碎片率统计需遍历主机，按固定间隔采样，不计入决策耗时
+        if index is not None and step % 1000 == 0:
+            stats = index.stats()
+            free = sum(s['free_slots'] for s in stats.values())
+            stranded = sum(s['fragmentation'] * s['free_slots'] for s in stats.values())
+            fragmentation_sum += stranded / free if free else 0.0
+
+    requests = accepted + rejected
+    return {
+        'policy': policy,
+        'events': len(trace),
+        'decisions_per_sec': round(len(trace) / decision_time) if decision_time else 0,
+        'acceptance': accepted / requests if requests else 0.0,
+        'mean_utilization': utilization_sum / samples if samples else 0.0,
+        'first_reject_utilization': first_reject_utilization,
+        'mean_fragmentation': fragmentation_sum / (len(trace) // 1000 + 1) if index is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GPU placement simulator benchmark')
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--events', type=int, default=200000, help='Trace length (placements + releases)')
+    parser.add_argument('--load', type=float, default=1.1, help='Offered GPU load relative to fleet capacity')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--policies', default=','.join(POLICIES + ('scan',)))
+    parser.add_argument('--trace', help='Replay a trace saved with --save-trace')
+    parser.add_argument('--save-trace', help='Write the generated trace to this JSON file')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as f:
+            saved = json.load(f)
+        fleet = [tuple(host) for host in saved['fleet']]
+        trace = [tuple(event) for event in saved['trace']]
+    else:
+        fleet = build_fleet(args.hosts)
+        trace = generate_trace(fleet, args.events, args.load, args.seed)
+    if args.save_trace:
+        with open(args.save_trace, 'w') as f:
+            json.dump({'fleet': fleet, 'trace': trace}, f)
+        print(f"✅ Trace saved to {args.save_trace}")
+
+    print(f"hosts={len(fleet)} slots={sum(s for _, _, s in fleet)} events={len(trace)}")
+    print(f"\n{'policy':<10} {'decisions/s':>12} {'accept':>8} {'mean util':>10} "
+          f"{'util@reject':>12} {'frag':>7}")
+    results = []
+    for policy in args.policies.split(','):
+        result = replay(fleet, trace, policy)
+        results.append(result)
+        first_reject = result['first_reject_utilization']
+        fragmentation = result['mean_fragmentation']
+        print(f"{policy:<10} {result['decisions_per_sec']:>12} {result['acceptance']:>8.1%} "
+              f"{result['mean_utilization']:>10.1%} "
+              f"{'-' if first_reject is None else f'{first_reject:.1%}':>12} "
+              f"{'-' if fragmentation is None else f'{fragmentation:.1%}':>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
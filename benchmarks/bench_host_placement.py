@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 主机放置基准测试
+
+生成合成主机集群（若干种ESXi规格混合）与按泊松到达、指数时长释放的虚拟机请求轨迹，
+在同一集群上按各放置策略回放，比较:
+  决策延迟  - 单次选择主机耗时的p50/p99（微秒，只计索引选择与更新）
+  装箱效率  - 接受率、首次拒绝时的内存利用率、平均空闲（无虚拟机）主机比例
+  项目亲和  - 每个项目的虚拟机平均分布在多少台主机上
+  scan      - 对照组: 每次遍历全部主机选空闲内存最多者（旧方案的典型实现）
+
+用法:
+  python benchmarks/bench_host_placement.py --hosts 2000
+  python benchmarks/bench_host_placement.py --hosts 10000 --policies spread,scan
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from host_placement import HostCapacityIndex, POLICIES
+
+# 主机规格 (物理核数, 内存GB, 磁盘GB)，vCPU按 --cpu-overcommit 超分
+HOST_SHAPES = [(64, 512, 8000), (96, 768, 12000), (128, 1024, 16000)]
+# 虚拟机规格及权重
+VM_SHAPES = {(2, 4, 50): 30, (4, 8, 100): 30, (8, 16, 200): 20, (16, 64, 500): 15, (32, 128, 1000): 5}
+
+
+def build_fleet(hosts, seed):
+    rng = random.Random(seed)
+    return [(f'esxi-{i:05d}', *rng.choice(HOST_SHAPES)) for i in range(hosts)]
+
+
+def generate_trace(fleet, events, load, projects, seed):
+    """生成按时间排序的事件 [(time, 'place'|'release', request_id, project_id, cpu, memory, disk)]
+
+    load为稳态下请求内存与总内存之比，>1时持续超额以观察拒绝
+    """
+    rng = random.Random(seed)
+    shapes, weights = zip(*VM_SHAPES.items())
+    mean_memory = sum(shape[1] * w for shape, w in VM_SHAPES.items()) / sum(weights)
+    total_memory = sum(host[2] for host in fleet)
+    mean_lifetime = 100.0
+    arrival_rate = load * total_memory / (mean_lifetime * mean_memory)
+
+    trace = []
+    now = 0.0
+    for request_id in range(events // 2):
+        now += rng.expovariate(arrival_rate)
+        cpu, memory, disk = rng.choices(shapes, weights)[0]
+        # 项目规模服从长尾分布：少数项目占多数虚拟机
+        project_id = int(rng.paretovariate(1.2)) % projects
+        trace.append((now, 'place', request_id, project_id, cpu, memory, disk))
+        trace.append((now + rng.expovariate(1 / mean_lifetime), 'release', request_id, project_id,
+                      cpu, memory, disk))
+    trace.sort()
+    return trace
+
+
+class ScanPlacer:
+    """对照组：遍历全部主机，选空闲内存最多且放得下的"""
+
+    def __init__(self, fleet, cpu_overcommit):
+        self.hosts = {host: [cpu * cpu_overcommit, memory, disk, 0, 0, 0] for host, cpu, memory, disk in fleet}
+
+    def choose(self, cpu, memory, disk, project_id=None):
+        best, best_free = None, -1
+        for host, values in self.hosts.items():
+            free = values[1] - values[4]
+            if free > best_free and values[3] + cpu <= values[0] and values[4] + memory <= values[1] \
+                    and values[5] + disk <= values[2]:
+                best, best_free = host, free
+        return best
+
+    def allocate(self, host, cpu, memory, disk, project_id=None):
+        values = self.hosts[host]
+        values[3] += cpu
+        values[4] += memory
+        values[5] += disk
+
+    def release(self, host, cpu, memory, disk, project_id=None):
+        self.allocate(host, -cpu, -memory, -disk)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0
+
+
+def replay(fleet, trace, policy, cpu_overcommit):
+    if policy == 'scan':
+        placer = ScanPlacer(fleet, cpu_overcommit)
+    else:
+        placer = HostCapacityIndex.from_rows(((*host, 0, 0, 0) for host in fleet), policy,
+                                             cpu_overcommit=cpu_overcommit)
+
+    total_memory = sum(host[2] for host in fleet)
+    placements = {}
+    project_vms = {}
+    accepted = rejected = used_memory = 0
+    first_reject_utilization = None
+    latencies = []
+    spread_samples = []
+    empty_samples = []
+
+    for step, (_, kind, request_id, project_id, cpu, memory, disk) in enumerate(trace):
+        started = time.perf_counter()
+        if kind == 'place':
+            host = placer.choose(cpu, memory, disk, project_id)
+            if host is not None:
+                placer.allocate(host, cpu, memory, disk, project_id)
+        else:
+            host = placements.pop(request_id, None)
+            if host is not None:
+                placer.release(host, cpu, memory, disk, project_id)
+        latencies.append(time.perf_counter() - started)
+
+        if kind == 'place':
+            if host is None:
+                rejected += 1
+                if first_reject_utilization is None:
+                    first_reject_utilization = used_memory / total_memory
+            else:
+                accepted += 1
+                placements[request_id] = host
+                project_vms.setdefault(project_id, []).append(host)
+                used_memory += memory
+        elif host is not None:
+            used_memory -= memory
+            project_vms[project_id].remove(host)
+
+        # 按固定间隔采样空闲主机比例与各项目的主机分布（多于1台虚拟机的项目）
+        if step % 5000 == 0:
+            empty_samples.append(sum(1 for values in placer.hosts.values() if not any(values[3:]))
+                                 / len(placer.hosts))
+            vms = sum(len(hosts) for hosts in project_vms.values() if len(hosts) > 1)
+            if vms:
+                spread_samples.append(
+                    sum(len(set(hosts)) for hosts in project_vms.values() if len(hosts) > 1) / vms
+                )
+
+    requests = accepted + rejected
+    return {
+        'policy': policy,
+        'events': len(trace),
+        'p50_us': round(percentile(latencies, 50) * 1e6, 1),
+        'p99_us': round(percentile(latencies, 99) * 1e6, 1),
+        'acceptance': accepted / requests if requests else 0.0,
+        'first_reject_utilization': first_reject_utilization,
+        'empty_hosts': sum(empty_samples) / len(empty_samples),
+        # (项目, 主机) 组合数 / 虚拟机数，越低表示同项目虚拟机越集中
+        'project_host_ratio': sum(spread_samples) / len(spread_samples) if spread_samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host placement benchmark on a synthetic fleet')
+    parser.add_argument('--hosts', type=int, default=2000)
+    parser.add_argument('--events', type=int,
+                        help='Trace length (placements + releases), default 8x the steady-state VM count')
+    parser.add_argument('--load', type=float, default=1.05, help='Offered memory load relative to fleet capacity')
+    parser.add_argument('--projects', type=int, default=500)
+    parser.add_argument('--cpu-overcommit', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--policies', default=','.join(POLICIES + ('scan',)))
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    fleet = build_fleet(args.hosts, args.seed)
+    events = args.events
+    if events is None:
+        # 稳态虚拟机数约为 总内存 x load / 平均内存，轨迹需远长于填满集群所需的到达数
+        weights = sum(VM_SHAPES.values())
+        mean_memory = sum(shape[1] * w for shape, w in VM_SHAPES.items()) / weights
+        events = int(8 * args.load * sum(host[2] for host in fleet) / mean_memory)
+    trace = generate_trace(fleet, events, args.load, args.projects, args.seed)
+    print(f"hosts={len(fleet)} memory={sum(host[2] for host in fleet)}GB events={len(trace)}")
+    print(f"\n{'policy':<10} {'p50 us':>8} {'p99 us':>8} {'accept':>8} {'mem@reject':>11} "
+          f"{'empty':>7} {'hosts/vm':>9}")
+
+    results = []
+    for policy in args.policies.split(','):
+        result = replay(fleet, trace, policy, args.cpu_overcommit)
+        results.append(result)
+        first_reject = result['first_reject_utilization']
+        ratio = result['project_host_ratio']
+        print(f"{policy:<10} {result['p50_us']:>8} {result['p99_us']:>8} {result['acceptance']:>8.1%} "
+              f"{'-' if first_reject is None else f'{first_reject:.1%}':>11} "
+              f"{result['empty_hosts']:>7.1%} {'-' if ratio is None else f'{ratio:.2f}':>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
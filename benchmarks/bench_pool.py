@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 连接池饱和测试
+
+用不同的连接池配置启动 gunicorn，按递增并发运行 loadgen.py，
+压测期间轮询 /api/metrics 记录连接池借出数峰值，观察池耗尽后吞吐与尾延迟的变化：
+  legacy    - 旧默认值: pool_size=5, max_overflow=10, pre_ping
+  tuned     - 当前配置（DB_POOL_* 环境变量，默认 20/10，无pre_ping）
+  pgbouncer - 事务池模式 (NullPool)，需 --pgbouncer-url 指向PgBouncer
+
+用法:
+  python benchmarks/bench_pool.py --levels 16,64,256 --duration 30 --gunicorn-args="--workers 4"
+  python benchmarks/bench_pool.py --pgbouncer-url postgresql://iaas_user:pw@127.0.0.1:6432/vmware_iaas
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+
+import requests
+
+from loadgen import login_rate_limit_tenants
+from bench_runtime import server, run_loadgen, gunicorn_command
+
+POOL_METRIC = re.compile(r'^vmware_iaas_db_pool_(checked_out|connections|limit) ([\d.e+-]+)$', re.MULTILINE)
+
+
+class PoolSampler(threading.Thread):
+    """压测期间定期抓取连接池指标，记录峰值"""
+
+    def __init__(self, base_url, interval=0.5):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.interval = interval
+        self.peak = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                text = requests.get(f'{self.base_url}/api/metrics', timeout=5).text
+            except requests.RequestException:
+                continue
+            for name, value in POOL_METRIC.findall(text):
+                self.peak[name] = max(self.peak.get(name, 0), float(value))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure connection pool saturation under increasing concurrency')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--levels', default='16,64,256', help='Comma separated concurrency levels')
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--read-only', action='store_true')
+    parser.add_argument('--gunicorn-args', default='')
+    parser.add_argument('--pgbouncer-url', help='DATABASE_URL of a PgBouncer in transaction pooling mode')
+    parser.add_argument('--output-dir', default='benchmark-results/pool')
+    args = parser.parse_args()
+    args.concurrency = None
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    base_env = dict(os.environ, LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'), GUNICORN_ACCESS_LOG='',
+                    RATE_LIMIT_TENANTS=os.environ.get('RATE_LIMIT_TENANTS', login_rate_limit_tenants()))
+
+    profiles = [
+        ('legacy', {'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '10', 'DB_POOL_TIMEOUT': '30',
+                    'DB_POOL_PRE_PING': 'true'}),
+        ('tuned', {}),
+    ]
+    if args.pgbouncer_url:
+        profiles.append(('pgbouncer', {'DATABASE_URL': args.pgbouncer_url, 'DB_PGBOUNCER': 'true'}))
+
+    levels = [int(level) for level in args.levels.split(',')]
+    results = []
+    for name, overrides in profiles:
+        env = dict(base_env, **overrides)
+        try:
+            with server(name, gunicorn_command(args.port, args.gunicorn_args), args.port, args.output_dir,
+                        env=env) as base_url:
+                for concurrency in levels:
+                    output = os.path.join(args.output_dir, f'{name}-c{concurrency}.json')
+                    sampler = PoolSampler(base_url)
+                    sampler.start()
+                    code = run_loadgen(base_url, args, f'{name}-c{concurrency}', output, concurrency)
+                    peak = sampler.stop()
+                    if code != 0:
+                        sys.exit(code)
+                    with open(output) as f:
+                        run = json.load(f)
+                    results.append({
+                        'profile': name,
+                        'concurrency': concurrency,
+                        'throughput_rps': run['throughput_rps'],
+                        'errors': run['errors'],
+                        'latency_ms': run['latency_ms'],
+                        'pool_peak': peak,
+                    })
+                    # 留出时间让连接归还
+                    time.sleep(1)
+        except RuntimeError as e:
+            print(f"❌ {str(e)}")
+            sys.exit(1)
+
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{'profile':<10} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'pool out/limit':>15}")
+    for row in results:
+        peak = row['pool_peak']
+        latency = row['latency_ms'] or {}
+        limit = int(peak['limit']) if peak.get('limit') else '∞'
+        print(f"{row['profile']:<10} {row['concurrency']:>7} {row['throughput_rps']:>9} "
+              f"{latency.get('p50', '-'):>9} {latency.get('p99', '-'):>9} {row['errors']:>7} "
+              f"{int(peak.get('checked_out', 0)):>9}/{limit}")
+
+
+if __name__ == '__main__':
+    main()
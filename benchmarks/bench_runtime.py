@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 运行时吞吐对比
+
+依次启动 Flask 开发服务器 (threaded=True) 和 gunicorn (gunicorn.conf.py)，
+对每个服务器运行相同的 loadgen.py 压测，再用 compare.py 输出对比（开发服务器为基线）。
+需先用 seed.py 准备数据；数据库连接沿用应用配置的环境变量。
+
+用法:
+  python benchmarks/bench_runtime.py --tenants 1000 --concurrency 64 --duration 60 --output-dir results/runtime
+  python benchmarks/bench_runtime.py --gunicorn-args="--workers 4"
+"""
+
+import os
+import sys
+import time
+import shlex
+import signal
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+import requests
+
+from loadgen import login_rate_limit_tenants
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEV_SERVER = (
+    "from app import app, init_database; init_database(); "
+    "app.run(host='127.0.0.1', port={port}, debug=False, threaded=True)"
+)
+
+
+def wait_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+@contextmanager
+def server(name, command, port, output_dir, env=None):
+    """启动服务器并等待就绪，退出时终止整个进程组"""
+    base_url = f'http://127.0.0.1:{port}'
+    log_path = os.path.join(output_dir, f'{name}.log')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                                   env=env, start_new_session=True)
+    try:
+        if not wait_ready(base_url, process):
+            raise RuntimeError(f"{name} failed to start, see {log_path}")
+        print(f"▶ {name}: {' '.join(command)}")
+        yield base_url
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+
+
+def run_loadgen(base_url, args, label, output, concurrency=None):
+    """运行loadgen.py，返回退出码"""
+    return subprocess.call([
+        sys.executable, os.path.join(BENCH_DIR, 'loadgen.py'),
+        '--base-url', base_url,
+        '--tenants', str(args.tenants),
+        '--concurrency', str(concurrency or args.concurrency),
+        '--duration', str(args.duration),
+        '--warmup', str(args.warmup),
+        '--label', label,
+        '--output', output,
+    ] + (['--read-only'] if args.read_only else []))
+
+
+def gunicorn_command(port, extra_args=''):
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+            '--bind', f'127.0.0.1:{port}'] + shlex.split(extra_args) + ['app:app']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dev server and gunicorn throughput under the load suite')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--read-only', action='store_true')
+    parser.add_argument('--gunicorn-args', default='', help='Extra gunicorn arguments, e.g. "--workers 4"')
+    parser.add_argument('--output-dir', default='benchmark-results')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('GUNICORN_ACCESS_LOG', '')
+    os.environ.setdefault('RATE_LIMIT_TENANTS', login_rate_limit_tenants())
+
+    dev_output = os.path.join(args.output_dir, 'dev-server.json')
+    gunicorn_output = os.path.join(args.output_dir, 'gunicorn.json')
+
+    dev_command = [sys.executable, '-c', DEV_SERVER.format(port=args.port)]
+    runs = (
+        ('dev-server', dev_command, dev_output),
+        ('gunicorn', gunicorn_command(args.port, args.gunicorn_args), gunicorn_output),
+    )
+    for name, command, output in runs:
+        try:
+            with server(name, command, args.port, args.output_dir) as base_url:
+                if run_loadgen(base_url, args, name, output) != 0:
+                    sys.exit(1)
+        except RuntimeError as e:
+            print(f"❌ {str(e)}")
+            sys.exit(1)
+
+    # 以开发服务器为基线，退出码反映gunicorn是否有路由变慢
+    sys.exit(subprocess.call([sys.executable, os.path.join(BENCH_DIR, 'compare.py'), dev_output, gunicorn_output]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - /api/vms 序列化基准测试
+
+对比三种实现在大结果集上的吞吐 (bytes/sec) 与延迟分位数:
+  legacy - 旧实现: ORM对象 + 逐字段 isoformat/float + 标准库jsonify
+  std    - 新实现: Row元组 + 标准库JSON Provider
+  orjson - 新实现: Row元组 + orjson JSON Provider
+
+用法:
+  python benchmarks/bench_vms_json.py --vms 10000 --requests 50
+默认使用临时SQLite数据库，可通过 DATABASE_URL 指向PostgreSQL。
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(samples, pct):
+    """计算分位数（最近秩法）"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def seed(app, db, models, vm_count):
+    """写入一个租户、一个项目和 vm_count 台虚拟机"""
+    Tenant, Project, VirtualMachine = models
+    with app.app_context():
+        db.create_all()
+        tenant = Tenant.query.filter_by(username='admin').first()
+        if tenant is None:
+            tenant = Tenant(ldap_uid='admin', username='admin', display_name='系统管理员',
+                            email='admin@demo.com', department='IT')
+            db.session.add(tenant)
+            db.session.flush()
+        project = Project(project_name='基准测试', project_code=f'BENCH-{int(time.time())}', tenant_id=tenant.id)
+        db.session.add(project)
+        db.session.flush()
+
+        existing = VirtualMachine.query.filter_by(tenant_id=tenant.id).count()
+        now = datetime.utcnow()
+        rows = []
+        for i in range(existing, vm_count):
+            rows.append({
+                'name': f'bench-vm-{i:06d}',
+                'project_id': project.id,
+                'project_name': project.project_name,
+                'project_code': project.project_code,
+                'owner': 'admin',
+                'deadline': now + timedelta(days=30 + i % 60),
+                'tenant_id': tenant.id,
+                'ip_address': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+                'cpu_cores': 4,
+                'memory_gb': 8,
+                'disk_gb': 100,
+                'gpu_type': 't4' if i % 10 == 0 else None,
+                'gpu_count': 1 if i % 10 == 0 else 0,
+                'status': 'running',
+                'template_name': 'Ubuntu-22.04-Template',
+                'created_at': now,
+                'updated_at': now,
+            })
+        if rows:
+            db.session.execute(VirtualMachine.__table__.insert(), rows)
+        db.session.commit()
+        return tenant.id
+
+
+def legacy_list_vms(app, db, VirtualMachine, tenant_id):
+    """旧实现的序列化路径（用作对照组）"""
+    from flask import jsonify
+    vms = VirtualMachine.query.filter_by(tenant_id=tenant_id).order_by(VirtualMachine.created_at.desc()).all()
+    vm_list = []
+    for vm in vms:
+        vm_list.append({
+            'id': vm.id, 'name': vm.name, 'project_id': vm.project_id,
+            'project_name': vm.project_name, 'project_code': vm.project_code,
+            'owner': vm.owner, 'ip_address': vm.ip_address, 'host_name': vm.host_name,
+            'cpu_cores': vm.cpu_cores, 'memory_gb': vm.memory_gb, 'disk_gb': vm.disk_gb,
+            'gpu_type': vm.gpu_type, 'gpu_count': vm.gpu_count, 'status': vm.status,
+            'template_name': vm.template_name,
+            'deadline': vm.deadline.isoformat() if vm.deadline else None,
+            'days_until_expiry': vm.days_until_expiry,
+            'created_at': vm.created_at.isoformat(),
+            'updated_at': vm.updated_at.isoformat()
+        })
+    return jsonify({'vms': vm_list})
+
+
+def run_variant(name, request_fn, count):
+    """执行 count 次请求并统计延迟与字节数"""
+    request_fn()  # 预热
+    latencies = []
+    total_bytes = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        size = request_fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+        total_bytes += size
+    elapsed = time.perf_counter() - started
+    return {
+        'variant': name,
+        'requests': count,
+        'bytes_per_request': total_bytes // count,
+        'bytes_per_sec': round(total_bytes / elapsed),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/vms serialization')
+    parser.add_argument('--vms', type=int, default=10000, help='Number of VMs to seed')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per variant')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        db_file = os.path.join(tempfile.mkdtemp(prefix='iaas-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app import app, db, Tenant, Project, VirtualMachine
+    from json_provider import StdJSONProvider, ORJSONProvider, orjson
+
+    tenant_id = seed(app, db, (Tenant, Project, VirtualMachine), args.vms)
+
+    from auth import ldap_auth
+    with app.app_context():
+        token = ldap_auth.generate_token({'username': 'admin', 'display_name': '系统管理员', 'email': 'admin@demo.com',
+                                          'department': 'IT', 'ldap_uid': 'admin'})
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def api_request():
+        response = client.get('/api/vms', headers=headers)
+        assert response.status_code == 200, response.status_code
+        return len(response.data)
+
+    def legacy_request():
+        with app.test_request_context('/api/vms', headers=headers):
+            app.json = StdJSONProvider(app)
+            return len(legacy_list_vms(app, db, VirtualMachine, tenant_id).data)
+
+    results = [run_variant('legacy', legacy_request, args.requests)]
+
+    app.json = StdJSONProvider(app)
+    results.append(run_variant('std', api_request, args.requests))
+
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
+        results.append(run_variant('orjson', api_request, args.requests))
+
+    baseline = results[0]
+    for result in results:
+        result['speedup_bytes_per_sec'] = round(result['bytes_per_sec'] / baseline['bytes_per_sec'], 2)
+        result['p99_improvement'] = round(baseline['p99_ms'] / result['p99_ms'], 2)
+
+    print(json.dumps({'vms': args.vms, 'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 压测结果对比
+
+对比两次 loadgen.py 的结果，按路由检查延迟分位数、吞吐和每请求SQL次数，
+超过阈值的视为性能回退，存在回退时退出码为1（可直接用于CI）。
+
+用法:
+  python benchmarks/compare.py results/baseline.json results/candidate.json --threshold 10
+"""
+
+import sys
+import json
+import argparse
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def pct_change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def compare(baseline, candidate, threshold, min_delta_ms, min_requests):
+    """返回 (逐路由对比行, 回退列表)"""
+    rows = []
+    regressions = []
+    for route in sorted(set(baseline['routes']) | set(candidate['routes'])):
+        before = baseline['routes'].get(route)
+        after = candidate['routes'].get(route)
+        if before is None or after is None:
+            rows.append({'route': route, 'note': 'only in baseline' if after is None else 'only in candidate'})
+            continue
+
+        row = {'route': route, 'requests': (before['requests'], after['requests'])}
+        problems = []
+        # 样本太少时分位数不稳定，只比较SQL次数和错误
+        enough_samples = min(before['requests'], after['requests']) >= min_requests
+
+        for name in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'][name], after['latency_ms'][name]
+            change = pct_change(old, new)
+            row[name] = (old, new, round(change, 1))
+            if enough_samples and change > threshold and new - old > min_delta_ms:
+                problems.append(f'{name} {old}ms -> {new}ms (+{change:.1f}%)')
+
+        old, new = before['throughput_rps'], after['throughput_rps']
+        change = pct_change(old, new)
+        row['throughput_rps'] = (old, new, round(change, 1))
+        if enough_samples and change < -threshold:
+            problems.append(f'throughput {old} -> {new} req/s ({change:.1f}%)')
+
+        # 每请求SQL次数增加通常意味着新的N+1查询，不受阈值限制
+        old_queries = (before.get('queries_per_request') or {}).get('mean')
+        new_queries = (after.get('queries_per_request') or {}).get('mean')
+        row['queries_per_request'] = (old_queries, new_queries)
+        if old_queries is not None and new_queries is not None and new_queries - old_queries >= 0.5:
+            problems.append(f'queries/request {old_queries} -> {new_queries}')
+
+        old_error_rate = before['errors'] / before['requests']
+        new_error_rate = after['errors'] / after['requests']
+        row['error_rate'] = (round(old_error_rate, 4), round(new_error_rate, 4))
+        if new_error_rate - old_error_rate > 0.01:
+            problems.append(f'error rate {old_error_rate:.1%} -> {new_error_rate:.1%}')
+
+        row['regressions'] = problems
+        rows.append(row)
+        regressions.extend(f'{route}: {problem}' for problem in problems)
+
+    return rows, regressions
+
+
+def print_table(rows):
+    print(f"{'route':<48} {'p50 ms':>17} {'p99 ms':>17} {'req/s':>15} {'queries':>11}")
+    for row in rows:
+        if 'note' in row:
+            print(f"{row['route']:<48} ({row['note']})")
+            continue
+        marker = '❌' if row['regressions'] else '  '
+        queries = row['queries_per_request']
+        print(
+            f"{row['route'][:46]:<46}{marker} "
+            f"{row['p50'][0]:>7}→{row['p50'][1]:<9}"
+            f"{row['p99'][0]:>7}→{row['p99'][1]:<9}"
+            f"{row['throughput_rps'][0]:>7}→{row['throughput_rps'][1]:<7}"
+            f"{'' if queries[0] is None else queries[0]:>5}→{'' if queries[1] is None else queries[1]:<5}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two loadgen results and flag regressions')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='Allowed latency/throughput change in percent')
+    parser.add_argument('--min-delta-ms', type=float, default=2,
+                        help='Ignore latency increases smaller than this many milliseconds')
+    parser.add_argument('--min-requests', type=int, default=20,
+                        help='Routes with fewer samples only check query counts and errors')
+    parser.add_argument('--json', action='store_true', help='Print the comparison as JSON')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+    rows, regressions = compare(baseline, candidate, args.threshold, args.min_delta_ms, args.min_requests)
+
+    if args.json:
+        print(json.dumps({
+            'baseline': baseline.get('label') or args.baseline,
+            'candidate': candidate.get('label') or args.candidate,
+            'routes': rows,
+            'regressions': regressions,
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(f"baseline:  {baseline.get('label') or args.baseline} ({baseline['throughput_rps']} req/s)")
+        print(f"candidate: {candidate.get('label') or args.candidate} ({candidate['throughput_rps']} req/s)")
+        print_table(rows)
+        print()
+        if regressions:
+            print(f"❌ {len(regressions)} regressions:")
+            for item in regressions:
+                print(f"  - {item}")
+        else:
+            print("✅ No regressions")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
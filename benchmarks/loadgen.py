@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 并发压测
+
+多线程按权重混合请求 routes.py 中的全部路由，输出每个路由的吞吐、延迟分位数 (p50/p95/p99)
+以及每请求SQL次数（解析响应头 Server-Timing 的 desc="N queries"）。结果为JSON，可用 compare.py 对比两次运行。
+令牌直接用 SECRET_KEY 签发给 seed.py 生成的租户，压测机无需导入应用代码。
+
+登录路由只有少数演示账号且都来自压测机一个地址，按线上登录限额会大量返回429；服务器需以
+login_rate_limit_tenants() 生成的 RATE_LIMIT_TENANTS 启动（bench_runtime.py / bench_pool.py 自动设置），
+只放开这些账号与压测机地址的登录限额，其他路由仍按线上限额。
+
+用法:
+  RATE_LIMIT_TENANTS="$(python benchmarks/loadgen.py --print-rate-limit-tenants)" gunicorn -c gunicorn.conf.py app:app
+  python benchmarks/loadgen.py --base-url http://127.0.0.1:5000 --tenants 1000 --concurrency 32 --duration 60 \\
+      --output results/baseline.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import jwt
+import requests
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+# (路由, 方法, 权重)：权重按线上读多写少的比例设置，写操作权重较低
+ROUTES = (
+    ('/', 'GET', 1),
+    ('/login', 'GET', 1),
+    ('/dashboard', 'GET', 1),
+    ('/static/<path:filename>', 'GET', 2),
+    ('/api/health', 'GET', 2),
+    ('/api/auth/login', 'POST', 1),
+    ('/api/auth/logout', 'POST', 1),
+    ('/api/auth/verify', 'POST', 3),
+    ('/api/auth/profile', 'GET', 2),
+    ('/api/templates', 'GET', 3),
+    ('/api/system/stats', 'GET', 6),
+    ('/api/vms', 'GET', 12),
+    ('/api/vms', 'POST', 2),
+    ('/api/vms/<int:vm_id>/power/<action>', 'POST', 2),
+    ('/api/vms/<int:vm_id>', 'DELETE', 1),
+    ('/api/projects', 'GET', 6),
+    ('/api/projects', 'POST', 1),
+    ('/api/billing/summary', 'GET', 6),
+    ('/api/billing/details', 'GET', 8),
+    ('/api/billing/export', 'GET', 1),
+    ('/api/metrics', 'GET', 2),
+    ('/api/admin/profiling', 'GET', 1),
+    ('/api/admin/profiles', 'GET', 1),
+    ('/api/admin/profiles/<int:profile_id>', 'GET', 1),
+)
+
+STATIC_FILES = ('app.js', 'index.html', 'api-docs.html')
+DEMO_LOGINS = (('user1', 'user123'), ('user2', 'user123'), ('test', 'test123'))
+
+
+def login_rate_limit_tenants(client_ip='127.0.0.1'):
+    """服务器的 RATE_LIMIT_TENANTS：不限制演示账号（login）与压测机地址（login_ip）的登录"""
+    tenants = {user: {'login': 'off'} for user, _ in DEMO_LOGINS}
+    tenants[f'ip:{client_ip}'] = {'login_ip': 'off'}
+    return json.dumps(tenants)
+
+
+def percentile(samples, pct):
+    """计算分位数（最近秩法）"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def mint_token(secret_key, username):
+    """按 auth.LDAPAuth.generate_token 的载荷签发令牌"""
+    now = datetime.utcnow()
+    payload = {
+        'username': username,
+        'display_name': username,
+        'email': f'{username}@bench.local',
+        'department': 'BENCH',
+        'ldap_uid': username,
+        'exp': now + timedelta(hours=24),
+        'iat': now,
+        'iss': 'vmware-iaas-platform',
+    }
+    return jwt.encode(payload, secret_key, algorithm='HS256')
+
+
+class Recorder:
+    """按路由汇总请求样本，线程安全"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+        self.recording = False
+
+    def record(self, route, method, response, elapsed, error=None):
+        if not self.recording:
+            return
+        queries = db_ms = None
+        status = None
+        size = 0
+        if response is not None:
+            status = response.status_code
+            size = len(response.content)
+            match = SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+            if match:
+                db_ms, queries = float(match.group(1)), int(match.group(2))
+        key = f'{method} {route}'
+        with self._lock:
+            bucket = self.samples.setdefault(key, {'latency': [], 'queries': [], 'db_ms': [],
+                                                   'errors': 0, 'bytes': 0, 'statuses': {}})
+            bucket['latency'].append(elapsed * 1000)
+            bucket['bytes'] += size
+            if queries is not None:
+                bucket['queries'].append(queries)
+                bucket['db_ms'].append(db_ms)
+            status_key = str(status) if status is not None else type(error).__name__
+            bucket['statuses'][status_key] = bucket['statuses'].get(status_key, 0) + 1
+            if status is None or status >= 400:
+                bucket['errors'] += 1
+
+    def report(self, elapsed):
+        routes = {}
+        total = 0
+        errors = 0
+        all_latency = []
+        for key, bucket in sorted(self.samples.items()):
+            latency = bucket['latency']
+            count = len(latency)
+            total += count
+            errors += bucket['errors']
+            all_latency.extend(latency)
+            routes[key] = {
+                'requests': count,
+                'errors': bucket['errors'],
+                'statuses': bucket['statuses'],
+                'throughput_rps': round(count / elapsed, 2),
+                'latency_ms': {
+                    'mean': round(sum(latency) / count, 2),
+                    'p50': round(percentile(latency, 50), 2),
+                    'p95': round(percentile(latency, 95), 2),
+                    'p99': round(percentile(latency, 99), 2),
+                    'max': round(max(latency), 2),
+                },
+                'queries_per_request': {
+                    'mean': round(sum(bucket['queries']) / len(bucket['queries']), 2),
+                    'max': max(bucket['queries']),
+                } if bucket['queries'] else None,
+                'db_ms_mean': round(sum(bucket['db_ms']) / len(bucket['db_ms']), 2) if bucket['db_ms'] else None,
+                'bytes_per_request': bucket['bytes'] // count,
+            }
+        return {
+            'duration_seconds': round(elapsed, 2),
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+            'latency_ms': {
+                'p50': round(percentile(all_latency, 50), 2),
+                'p95': round(percentile(all_latency, 95), 2),
+                'p99': round(percentile(all_latency, 99), 2),
+            } if all_latency else None,
+            'routes': routes,
+        }
+
+
+class Worker(threading.Thread):
+    """单个压测线程，使用独立的 requests.Session 复用连接"""
+
+    def __init__(self, index, args, tokens, admin_token, recorder, routes, deadline):
+        super().__init__(name=f'loadgen-{index}', daemon=True)
+        self.args = args
+        self.tokens = tokens
+        self.admin_token = admin_token
+        self.recorder = recorder
+        self.routes = routes
+        self.deadline = deadline
+        self.rng = random.Random(args.seed + index)
+        self.session = requests.Session()
+        self.projects = {}
+        self.created_vms = []
+
+    def request(self, route, method, path, token=None, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.args.base_url + path, headers=headers,
+                                            timeout=self.args.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.record(route, method, None, time.perf_counter() - started, e)
+            return None
+        self.recorder.record(route, method, response, time.perf_counter() - started)
+        return response
+
+    def tenant(self):
+        return self.rng.choice(self.tokens)
+
+    def project_id(self, username, token):
+        """缓存租户的一个项目ID，供创建虚拟机使用"""
+        if username not in self.projects:
+            response = self.request('/api/projects', 'GET', '/api/projects', token)
+            projects = response.json().get('projects', []) if response is not None and response.ok else []
+            self.projects[username] = projects[0]['id'] if projects else None
+        return self.projects[username]
+
+    def run(self):
+        names = [(route, method) for route, method, _ in self.routes]
+        weights = [weight for _, _, weight in self.routes]
+        while time.monotonic() < self.deadline:
+            route, method = self.rng.choices(names, weights)[0]
+            self.dispatch(route, method)
+
+    def dispatch(self, route, method):
+        username, token = self.tenant()
+        today = datetime.utcnow().date()
+
+        if route == '/static/<path:filename>':
+            self.request(route, method, f'/static/{self.rng.choice(STATIC_FILES)}')
+        elif route in ('/', '/login', '/dashboard', '/api/health'):
+            self.request(route, method, route, allow_redirects=False)
+        elif route == '/api/auth/login':
+            user, password = self.rng.choice(DEMO_LOGINS)
+            self.request(route, method, route, json={'username': user, 'password': password})
+        elif route in ('/api/auth/logout', '/api/auth/verify', '/api/auth/profile', '/api/templates',
+                       '/api/system/stats', '/api/metrics'):
+            self.request(route, method, route, token)
+        elif route == '/api/vms' and method == 'GET':
+            self.request(route, method, route, token)
+        elif route == '/api/vms':
+            project_id = self.project_id(username, token)
+            response = self.request(route, method, route, token, json={
+                'name': f'load-{uuid.uuid4().hex[:12]}',
+                'project_id': project_id,
+                'template_name': 'Ubuntu-22.04-Template',
+                'cpu_cores': 2,
+                'memory_gb': 4,
+                'disk_gb': 50,
+                'deadline': (datetime.utcnow() + timedelta(days=30)).isoformat(),
+                'owner': username,
+            })
+            if response is not None and response.status_code == 201:
+                self.created_vms.append((username, token, response.json()['vm']['id']))
+        elif route == '/api/vms/<int:vm_id>/power/<action>':
+            if not self.created_vms:
+                return
+            _, vm_token, vm_id = self.rng.choice(self.created_vms)
+            action = self.rng.choice(('on', 'off', 'restart'))
+            self.request(route, method, f'/api/vms/{vm_id}/power/{action}', vm_token)
+        elif route == '/api/vms/<int:vm_id>':
+            # 只删除本次压测创建的虚拟机，保持种子数据不变
+            if not self.created_vms:
+                return
+            _, vm_token, vm_id = self.created_vms.pop(self.rng.randrange(len(self.created_vms)))
+            self.request(route, method, f'/api/vms/{vm_id}', vm_token)
+        elif route == '/api/projects' and method == 'GET':
+            self.request(route, method, route, token)
+        elif route == '/api/projects':
+            code = f'LOAD-{uuid.uuid4().hex[:12]}'
+            self.request(route, method, route, token, json={'project_name': code, 'project_code': code})
+        elif route == '/api/billing/summary':
+            start = today - timedelta(days=self.rng.choice((7, 30, 90)))
+            self.request(route, method, route, token,
+                         params={'start_date': start.isoformat(), 'end_date': today.isoformat()})
+        elif route == '/api/billing/details':
+            start = today - timedelta(days=self.rng.choice((7, 30, 90)))
+            params = {'start_date': start.isoformat(), 'end_date': today.isoformat(), 'per_page': 50}
+            response = self.request(route, method, route, token, params=params)
+            # 翻到第二页以覆盖游标路径
+            next_cursor = response.json()['pagination']['next_cursor'] if response is not None and response.ok else None
+            if next_cursor:
+                params['cursor'] = next_cursor
+                self.request(route, method, route, token, params=params)
+        elif route == '/api/billing/export':
+            start = today - timedelta(days=7)
+            self.request(route, method, route, token,
+                         params={'start_date': start.isoformat(), 'end_date': today.isoformat(), 'format': 'csv'})
+        elif route in ('/api/admin/profiling', '/api/admin/profiles'):
+            self.request(route, method, route, self.admin_token)
+        elif route == '/api/admin/profiles/<int:profile_id>':
+            response = self.request('/api/admin/profiles', 'GET', '/api/admin/profiles', self.admin_token)
+            profiles = response.json().get('profiles', []) if response is not None and response.ok else []
+            if profiles:
+                self.request(route, method, f"/api/admin/profiles/{profiles[0]['id']}", self.admin_token)
+
+    def cleanup(self):
+        """删除压测期间创建但尚未删除的虚拟机（此时已停止记录）"""
+        for _, token, vm_id in self.created_vms:
+            self.request('/api/vms/<int:vm_id>', 'DELETE', f'/api/vms/{vm_id}', token)
+        self.created_vms = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load generator for the VMware IaaS API')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured warmup seconds')
+    parser.add_argument('--tenants', type=int, default=1000, help='Number of seeded bench tenants to spread load over')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--secret-key', default=os.environ.get('SECRET_KEY', 'vmware-iaas-secret-key-2025'))
+    parser.add_argument('--only', action='append', help='Only drive routes containing this substring (repeatable)')
+    parser.add_argument('--read-only', action='store_true', help='Skip routes that modify data')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', help='Free-form label stored in the result (e.g. git commit)')
+    parser.add_argument('--output', help='Write JSON result to this file instead of stdout')
+    parser.add_argument('--print-rate-limit-tenants', metavar='CLIENT_IP', nargs='?', const='127.0.0.1',
+                        help='Print the RATE_LIMIT_TENANTS the server needs to not throttle loadgen logins, then exit')
+    args = parser.parse_args()
+    if args.print_rate_limit_tenants:
+        print(login_rate_limit_tenants(args.print_rate_limit_tenants))
+        return
+    args.base_url = args.base_url.rstrip('/')
+
+    routes = [item for item in ROUTES
+              if not args.only or any(pattern in f'{item[1]} {item[0]}' for pattern in args.only)]
+    if args.read_only:
+        routes = [item for item in routes if item[1] == 'GET' or item[0] == '/api/auth/verify']
+    if not routes:
+        print("❌ No routes selected")
+        sys.exit(1)
+
+    tokens = []
+    for index in range(1, args.tenants + 1):
+        username = f'bench{index:05d}'
+        tokens.append((username, mint_token(args.secret_key, username)))
+    admin_token = mint_token(args.secret_key, args.admin_user)
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.warmup + args.duration
+    workers = [Worker(index, args, tokens, admin_token, recorder, routes, deadline)
+               for index in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    recorder.recording = False
+
+    for worker in workers:
+        worker.cleanup()
+
+    result = {
+        'label': args.label,
+        'base_url': args.base_url,
+        'started_at': datetime.utcnow().isoformat(),
+        'concurrency': args.concurrency,
+        'tenants': args.tenants,
+    }
+    result.update(recorder.report(elapsed))
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"✅ {result['requests']} requests, {result['throughput_rps']} req/s, "
+              f"{result['errors']} errors -> {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
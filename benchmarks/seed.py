@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 基准测试数据生成
+
+使用 PostgreSQL COPY 批量写入租户、项目、虚拟机和计费记录，数据流式生成，内存占用恒定。
+租户用户名为 bench00001、bench00002 ...，供 loadgen.py 签发令牌使用。
+
+用法:
+  python benchmarks/seed.py --reset --tenants 1000 --projects-per-tenant 5 --vms 100000 --billing-days 365
+  (100k VMs × 365 天 ≈ 36.5M 计费记录)
+数据库连接沿用应用配置（DB_HOST/DB_PORT/DB_NAME/DB_USER/DB_PASSWORD 或 DATABASE_URL）。
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GPU_TYPES = (None, None, None, None, 't4', '3090')
+STATUSES = ('running', 'running', 'running', 'stopped', 'creating', 'expired')
+TEMPLATES = ('Ubuntu-20.04-Template', 'Ubuntu-22.04-Template', 'CentOS-7-Template',
+             'Windows-Server-2019-Template', 'Windows-Server-2022-Template')
+
+
+def tenant_username(index):
+    return f"bench{index:05d}"
+
+
+class CSVStream(io.RawIOBase):
+    """把行生成器包装成 COPY FROM STDIN 可读取的文件对象"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = bytearray()
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            self.buffer += (','.join('' if value is None else str(value) for value in row) + '\n').encode('utf-8')
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        del self.buffer[:size]
+        return size
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY写入并返回行数"""
+    counter = {'rows': 0}
+
+    def counted():
+        for row in rows:
+            counter['rows'] += 1
+            yield row
+
+    stream = io.BufferedReader(CSVStream(counted()), buffer_size=1024 * 1024)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", stream)
+    return counter['rows']
+
+
+def seed(conn, args):
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    today = date.today()
+    stats = {}
+    cursor = conn.cursor()
+
+    if args.reset:
+        cursor.execute(
+            "TRUNCATE billing_records, ip_pools, virtual_machines, user_sessions, projects, tenants, resource_quotas "
+            "RESTART IDENTITY CASCADE"
+        )
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM tenants")
+    tenant_base = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM projects")
+    project_base = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM virtual_machines")
+    vm_base = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM billing_records")
+    billing_base = cursor.fetchone()[0]
+
+    started = time.perf_counter()
+    stats['tenants'] = copy_rows(
+        cursor, 'tenants',
+        ('id', 'ldap_uid', 'username', 'display_name', 'email', 'department', 'is_active', 'created_at', 'updated_at'),
+        ((tenant_base + t, tenant_username(tenant_base + t), tenant_username(tenant_base + t), f'Bench {t}',
+          f'{tenant_username(tenant_base + t)}@bench.local', 'BENCH', 't', now, now)
+         for t in range(1, args.tenants + 1))
+    )
+
+    project_count = args.tenants * args.projects_per_tenant
+    stats['projects'] = copy_rows(
+        cursor, 'projects',
+        ('id', 'project_name', 'project_code', 'tenant_id', 'description', 'is_active', 'created_at', 'updated_at'),
+        ((project_base + p, f'Bench Project {p}', f'BENCH-{project_base + p:07d}',
+          tenant_base + (p - 1) // args.projects_per_tenant + 1, '', 't', now, now)
+         for p in range(1, project_count + 1))
+    )
+
+    def vm_rows():
+        for v in range(1, args.vms + 1):
+            project_index = (v - 1) % project_count + 1
+            tenant_id = tenant_base + (project_index - 1) // args.projects_per_tenant + 1
+            gpu_type = rng.choice(GPU_TYPES)
+            created = now - timedelta(days=rng.randint(0, args.billing_days))
+            yield (vm_base + v, f'bench-vm-{vm_base + v:07d}', project_base + project_index,
+                   f'Bench Project {project_index}', f'BENCH-{project_base + project_index:07d}',
+                   tenant_username(tenant_id), now + timedelta(days=rng.randint(-10, 180)), tenant_id,
+                   rng.choice((2, 4, 8, 16)), rng.choice((4, 8, 16, 32, 64)), rng.choice((50, 100, 200, 500)),
+                   gpu_type, rng.choice((1, 2, 4)) if gpu_type else 0, rng.choice(STATUSES),
+                   rng.choice(TEMPLATES), created, created)
+
+    vm_columns = ('id', 'name', 'project_id', 'project_name', 'project_code', 'owner', 'deadline', 'tenant_id',
+                  'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_type', 'gpu_count', 'status', 'template_name',
+                  'created_at', 'updated_at')
+    stats['virtual_machines'] = copy_rows(cursor, 'virtual_machines', vm_columns, vm_rows())
+    conn.commit()
+
+    # 计费记录: 每台虚拟机每天一条，按日期顺序写入以便落入同一分区
+    cursor.execute("SELECT id, project_id, tenant_id, name, owner, cpu_cores, memory_gb, disk_gb, gpu_type, gpu_count "
+                   "FROM virtual_machines WHERE id > %s ORDER BY id", (vm_base,))
+    vms = cursor.fetchall()
+    prices = {'cpu': 0.08, 'memory': 0.16, 'disk': 0.5, 't4': 5.0, '3090': 11.0}
+
+    # 每台虚拟机除id和日期外的字段逐日不变，预先拼好CSV片段
+    fragments = []
+    for vm_id, project_id, tenant_id, name, owner, cpu, memory, disk, gpu_type, gpu_count in vms:
+        cpu_cost = round(cpu * prices['cpu'], 2)
+        memory_cost = round(memory * prices['memory'], 2)
+        disk_cost = round(disk / 100 * prices['disk'], 2)
+        gpu_cost = round((gpu_count or 0) * prices.get(gpu_type or '', 0), 2)
+        total_cost = round(cpu_cost + memory_cost + disk_cost + gpu_cost, 2)
+        fragments.append((
+            f"{vm_id},{name},{project_id},{tenant_id},{owner}",
+            f"{cpu},{memory},{disk},{gpu_type or ''},{gpu_count},{cpu_cost},{memory_cost},{disk_cost},"
+            f"{gpu_cost},{total_cost},{now}",
+        ))
+
+    def billing_rows():
+        record_id = billing_base
+        for day in range(args.billing_days, 0, -1):
+            billing_date = today - timedelta(days=day)
+            for prefix, suffix in fragments:
+                record_id += 1
+                yield (record_id, prefix, billing_date, suffix)
+
+    billing_columns = ('id', 'vm_id', 'vm_name', 'project_id', 'tenant_id', 'owner', 'billing_date',
+                       'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_type', 'gpu_count', 'cpu_cost', 'memory_cost',
+                       'disk_cost', 'gpu_cost', 'total_cost', 'created_at')
+    stats['billing_records'] = copy_rows(cursor, 'billing_records', billing_columns, billing_rows())
+
+    for table in ('tenants', 'projects', 'virtual_machines', 'billing_records'):
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                       f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)")
+    conn.commit()
+
+    cursor.execute("ANALYZE")
+    conn.commit()
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+    stats['tenant_usernames'] = [tenant_username(tenant_base + 1), tenant_username(tenant_base + args.tenants)]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database with a large benchmark dataset')
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--projects-per-tenant', type=int, default=5)
+    parser.add_argument('--vms', type=int, default=100000)
+    parser.add_argument('--billing-days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+    parser.add_argument('--reset', action='store_true', help='Truncate all tables before seeding')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from models import create_db_app, db, init_database
+    import billing_partitions
+    import quotas
+    import gpu_placement
+    import host_placement
+
+    app = create_db_app()
+    init_database(app)
+    with app.app_context():
+        start = date.today() - timedelta(days=args.billing_days)
+        months = (date.today().year - start.year) * 12 + date.today().month - start.month + 1
+        billing_partitions.ensure_partitions(db.engine, months_ahead=months, start=start)
+
+        conn = db.engine.raw_connection()
+        try:
+            stats = seed(conn, args)
+        finally:
+            conn.close()
+        # COPY绕过了接口，按写入的虚拟机重算配额计数与GPU卡槽、主机容量占用
+        quotas.rebuild_usage(db.session)
+        gpu_placement.rebuild_usage(db.session)
+        host_placement.rebuild_usage(db.session)
+
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
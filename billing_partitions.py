@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 计费记录分区管理
+billing_records 按 billing_date 月度范围分区（仅PostgreSQL），
+提供提前建分区、旧表迁移以及旧分区归档清理。
+Web进程定期补建未来月份的分区；默认分区兜底接收没有月度分区的记录，
+之后建该月分区时移入新分区
+"""
+
+import os
+import sys
+import gzip
+import time
+import logging
+import subprocess
+from datetime import date
+
+from sqlalchemy import text
+
+from background import start_per_process
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'billing_records'
+
+DEFAULT_PARTITION = f'{TABLE_NAME}_default'
+
+# 多个worker/命令行同时补建分区时串行执行
+ENSURE_LOCK_SQL = text(f"SELECT pg_advisory_xact_lock(hashtext('{TABLE_NAME}_partitions'))")
+
+# 分区表结构，需与 models.BillingRecord 保持一致；分区表的主键必须包含分区键
+PARTITIONED_TABLE_DDL = f"""
+CREATE TABLE {TABLE_NAME} (
+    id SERIAL NOT NULL,
+    vm_id INTEGER NOT NULL REFERENCES virtual_machines (id),
+    vm_name VARCHAR(100) NOT NULL,
+    project_id INTEGER NOT NULL REFERENCES projects (id),
+    tenant_id INTEGER NOT NULL REFERENCES tenants (id),
+    owner VARCHAR(200) NOT NULL,
+    billing_date DATE NOT NULL,
+    cpu_cores INTEGER NOT NULL,
+    memory_gb INTEGER NOT NULL,
+    disk_gb INTEGER NOT NULL,
+    gpu_type VARCHAR(20),
+    gpu_count INTEGER,
+    cpu_cost NUMERIC(10, 2) NOT NULL,
+    memory_cost NUMERIC(10, 2) NOT NULL,
+    disk_cost NUMERIC(10, 2) NOT NULL,
+    gpu_cost NUMERIC(10, 2) NOT NULL,
+    total_cost NUMERIC(10, 2) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id, billing_date)
+) PARTITION BY RANGE (billing_date)
+"""
+
+
+COLUMNS = (
+    'id', 'vm_id', 'vm_name', 'project_id', 'tenant_id', 'owner', 'billing_date',
+    'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_type', 'gpu_count',
+    'cpu_cost', 'memory_cost', 'disk_cost', 'gpu_cost', 'total_cost', 'created_at',
+)
+
+
+def is_supported(engine):
+    """分区仅在PostgreSQL上启用"""
+    return engine.dialect.name == 'postgresql'
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    """返回 day 所在月偏移 months 个月后的月初"""
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE_NAME}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(conn):
+    """billing_records 是否已是分区表"""
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :name AND c.relnamespace = 'public'::regnamespace
+    """), {'name': TABLE_NAME}).first() is not None
+
+
+def table_exists(conn, name):
+    return conn.execute(text("SELECT to_regclass(:name)"), {'name': f'public.{name}'}).scalar() is not None
+
+
+def create_tables(db):
+    """创建全部表，PostgreSQL上 billing_records 建为分区表"""
+    if not is_supported(db.engine):
+        db.create_all()
+        return
+
+    others = [table for table in db.metadata.sorted_tables if table.name != TABLE_NAME]
+    db.metadata.create_all(bind=db.engine, tables=others)
+
+    with db.engine.begin() as conn:
+        if not table_exists(conn, TABLE_NAME):
+            conn.execute(text(PARTITIONED_TABLE_DDL))
+            logger.info(f"Created partitioned table {TABLE_NAME}")
+        elif not is_partitioned(conn):
+            logger.warning(f"{TABLE_NAME} 不是分区表，请执行 billing_partitions.py --migrate")
+
+    ensure_partitions(db.engine)
+
+
+def list_partitions(conn):
+    """返回 [(分区名, 起始日期, 结束日期)]，按起始日期排序"""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :name
+    """), {'name': TABLE_NAME}).fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            continue
+        # 形如: FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')
+        try:
+            lower = bound.split("FROM ('", 1)[1].split("'", 1)[0]
+            upper = bound.split("TO ('", 1)[1].split("'", 1)[0]
+            partitions.append((name, date.fromisoformat(lower), date.fromisoformat(upper)))
+        except (IndexError, ValueError):
+            logger.warning(f"Skipping partition {name} with unsupported bound: {bound}")
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def _bound_clause(month):
+    return f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+
+def create_partition(conn, month):
+    """创建指定月份的分区（已存在则跳过），默认分区中已有该月的记录时移入新分区"""
+    name = partition_name(month)
+    if table_exists(conn, name):
+        return name
+
+    bounds = {'lower': month, 'upper': add_months(month, 1)}
+    in_range = "billing_date >= :lower AND billing_date < :upper"
+    stranded = table_exists(conn, DEFAULT_PARTITION) and conn.execute(
+        text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range} LIMIT 1"), bounds
+    ).first() is not None
+    if not stranded:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE_NAME} {_bound_clause(month)}"))
+        return name
+
+    # 默认分区中有该月记录时不能直接建分区：分离默认分区，建分区并移入记录后再挂回
+    column_list = ', '.join(COLUMNS)
+    conn.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE_NAME} {_bound_clause(month)}"))
+    moved = conn.execute(text(
+        f"INSERT INTO {name} ({column_list}) SELECT {column_list} FROM {DEFAULT_PARTITION} WHERE {in_range}"
+    ), bounds).rowcount
+    conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"), bounds)
+    conn.execute(text(f"ALTER TABLE {TABLE_NAME} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.warning(f"Moved {moved} billing records from {DEFAULT_PARTITION} to {name}")
+    return name
+
+
+def ensure_partitions(engine, months_ahead=None, start=None):
+    """确保从 start（默认本月）到未来 months_ahead 个月的分区以及默认分区都已存在"""
+    if not is_supported(engine):
+        return []
+
+    if months_ahead is None:
+        months_ahead = int(os.environ.get('BILLING_PARTITION_MONTHS_AHEAD', 3))
+    first = month_start(start or date.today())
+
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        conn.execute(ENSURE_LOCK_SQL)
+        existing = {name for name, _, _ in list_partitions(conn)}
+        for offset in range(months_ahead + 1):
+            month = add_months(first, offset)
+            if partition_name(month) not in existing:
+                created.append(create_partition(conn, month))
+        if not table_exists(conn, DEFAULT_PARTITION):
+            conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE_NAME} DEFAULT"))
+            created.append(DEFAULT_PARTITION)
+
+    for name in created:
+        logger.info(f"Created billing partition {name}")
+    return created
+
+
+class PartitionMaintainer:
+    """Web进程内定期补建未来月份的分区，长期运行的进程不会越过启动时建好的最后一个分区"""
+
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.interval = app.config.get('BILLING_PARTITION_CHECK_INTERVAL', 6 * 3600)
+        if self.interval > 0:
+            # 每个worker处理首个请求时启动
+            app.before_request(self._ensure_started)
+        app.extensions['billing_partitions'] = self
+
+    def _ensure_started(self):
+        start_per_process(self._loop, 'billing-partitions')
+
+    def _loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    ensure_partitions(self.db.engine)
+            except Exception as e:
+                logger.error(f"Billing partition maintenance error: {str(e)}")
+            time.sleep(self.interval)
+
+
+# 全局实例
+partition_maintainer = PartitionMaintainer()
+
+
+def migrate_to_partitioned(engine):
+    """将已有的普通 billing_records 表迁移为分区表"""
+    legacy_name = f"{TABLE_NAME}_legacy"
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            logger.info(f"{TABLE_NAME} is already partitioned")
+            return False
+
+        logger.info(f"Migrating {TABLE_NAME} to monthly partitions...")
+        conn.execute(text(f"ALTER TABLE {TABLE_NAME} RENAME TO {legacy_name}"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS {TABLE_NAME}_pkey RENAME TO {legacy_name}_pkey"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS ix_billing_records_tenant_date_id "
+                          f"RENAME TO ix_{legacy_name}_tenant_date_id"))
+        conn.execute(text(PARTITIONED_TABLE_DDL))
+
+        bounds = conn.execute(text(f"SELECT MIN(billing_date), MAX(billing_date) FROM {legacy_name}")).first()
+        if bounds[0] is not None:
+            month = month_start(bounds[0])
+            while month <= bounds[1]:
+                create_partition(conn, month)
+                month = add_months(month, 1)
+
+        column_list = ', '.join(COLUMNS)
+        conn.execute(text(f"INSERT INTO {TABLE_NAME} ({column_list}) SELECT {column_list} FROM {legacy_name}"))
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE_NAME}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {TABLE_NAME}), 0) + 1, false)"
+        ))
+        conn.execute(text(f"DROP TABLE {legacy_name}"))
+
+    ensure_partitions(engine)
+    logger.info("Migration completed")
+    return True
+
+
+def archive_old_partitions(engine, backup_manager, retain_months=None):
+    """分离并归档早于保留期的分区，导出为gzip压缩SQL后删除"""
+    if not is_supported(engine):
+        return []
+
+    if retain_months is None:
+        retain_months = int(os.environ.get('BILLING_RETENTION_MONTHS', 24))
+    cutoff = add_months(month_start(date.today()), -retain_months)
+
+    archive_dir = backup_manager.backup_dir / 'billing_archive'
+    archive_dir.mkdir(exist_ok=True)
+
+    with engine.connect() as conn:
+        expired = [(name, lower) for name, lower, upper in list_partitions(conn) if upper <= cutoff]
+
+    archived = []
+    for name, lower in expired:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {name}"))
+        logger.info(f"Detached partition {name}")
+
+        archive_path = archive_dir / f"{name}.sql.gz"
+        if not _dump_table(backup_manager, name, archive_path):
+            # 导出失败时重新挂回，避免数据丢失
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {TABLE_NAME} ATTACH PARTITION {name} {_bound_clause(lower)}"))
+            logger.error(f"Archive of {name} failed, partition re-attached")
+            continue
+
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        archived.append(str(archive_path))
+        logger.info(f"Archived partition {name} to {archive_path}")
+
+    return archived
+
+
+def _dump_table(backup_manager, table_name, archive_path):
+    """pg_dump 单表并流式压缩到 archive_path"""
+    env = os.environ.copy()
+    env['PGPASSWORD'] = backup_manager.db_password
+    cmd = [
+        'pg_dump',
+        '-h', backup_manager.db_host,
+        '-p', str(backup_manager.db_port),
+        '-U', backup_manager.db_user,
+        '-d', backup_manager.db_name,
+        '--no-password',
+        '--format=plain',
+        '-t', f'public.{table_name}'
+    ]
+    try:
+        process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with gzip.open(archive_path, 'wb') as f_out:
+            for chunk in iter(lambda: process.stdout.read(1024 * 1024), b''):
+                f_out.write(chunk)
+        stderr = process.stderr.read().decode('utf-8', 'replace')
+        if process.wait() != 0:
+            logger.error(f"pg_dump of {table_name} failed: {stderr}")
+            archive_path.unlink(missing_ok=True)
+            return False
+        return True
+    except Exception as e:
+        logger.error(f"Error dumping {table_name}: {str(e)}")
+        archive_path.unlink(missing_ok=True)
+        return False
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='VMware IaaS Billing Partition Manager')
+    parser.add_argument('--ensure', action='store_true', help='Create upcoming monthly partitions')
+    parser.add_argument('--months-ahead', type=int, help='Months of partitions to create ahead')
+    parser.add_argument('--archive', action='store_true', help='Detach and archive expired partitions')
+    parser.add_argument('--retain-months', type=int, help='Months of billing data to keep online')
+    parser.add_argument('--migrate', action='store_true', help='Convert an existing table to partitions')
+    parser.add_argument('--list', action='store_true', help='List partitions')
+    args = parser.parse_args()
+
+    from models import create_db_app, db, BillingRecord
+
+    with create_db_app().app_context():
+        engine = db.engine
+        if not is_supported(engine):
+            print("❌ Partitioning requires PostgreSQL")
+            sys.exit(1)
+
+        if args.migrate:
+            migrate_to_partitioned(engine)
+            for index in BillingRecord.__table__.indexes:
+                index.create(bind=engine, checkfirst=True)
+            print("✅ Migration completed")
+        elif args.ensure:
+            created = ensure_partitions(engine, args.months_ahead)
+            print(f"✅ Created {len(created)} partitions")
+        elif args.archive:
+            from backup_manager import BackupManager
+            archived = archive_old_partitions(engine, BackupManager(), args.retain_months)
+            print(f"✅ Archived {len(archived)} partitions")
+        elif args.list:
+            with engine.connect() as conn:
+                for name, lower, upper in list_partitions(conn):
+                    print(f"{name:<32} {lower} -> {upper}")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 应用配置
+仅依赖标准库，供Web应用和命令行工具（备份、初始化等）共用
+"""
+
+import os
+
+# 配置类
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'vmware-iaas-secret-key-2025')
+    
+    # 数据库配置
+    DB_HOST = os.environ.get('DB_HOST', 'postgres')
+    DB_PORT = os.environ.get('DB_PORT', '5432')
+    DB_NAME = os.environ.get('DB_NAME', 'vmware_iaas')
+    DB_USER = os.environ.get('DB_USER', 'iaas_user')
+    DB_PASSWORD = os.environ.get('DB_PASSWORD', 'password')
+    
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL',
+        f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    )
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # 连接池配置：每个worker进程一个池，pool_size+max_overflow 乘以worker数不应超过数据库 max_connections
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 300))
+    # pre_ping每次取连接多一次往返，仅在网络设备会静默断开空闲连接时开启
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true'
+    # PgBouncer事务池模式：连接复用交给PgBouncer，应用侧不保留连接
+    # （psycopg2在客户端拼接参数，不使用服务端预处理语句，无需额外设置）
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true'
+    
+    # PgBouncer模式下的 poolclass=NullPool 由 models.init_db 设置，配置模块不导入SQLAlchemy
+    if DB_PGBOUNCER:
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+    elif SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': DB_POOL_PRE_PING,
+        }
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_pre_ping': DB_POOL_PRE_PING,
+            'pool_recycle': DB_POOL_RECYCLE,
+        }
+    
+    # Redis（限流令牌桶，各worker共享）
+    REDIS_HOST = os.environ.get('REDIS_HOST', '')
+    REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+    REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', '')
+    
+    # 限流：路由类别=次数/秒数（令牌桶容量即次数，按该速率补充），off为不限
+    # login按提交的用户名计数，login_ip按客户端地址计数
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMITS = os.environ.get('RATE_LIMITS', 'create_vm=20/60,power=60/60,login=10/60,login_ip=30/60')
+    # 按租户覆盖，JSON: {"ci-bot": {"create_vm": "200/60"}}；login_ip的键为 "ip:<客户端地址>"
+    RATE_LIMIT_TENANTS = os.environ.get('RATE_LIMIT_TENANTS', '{}')
+    # Redis超时（秒）；出错后在该时间（秒）内改用进程内令牌桶
+    RATE_LIMIT_REDIS_TIMEOUT = float(os.environ.get('RATE_LIMIT_REDIS_TIMEOUT', 0.1))
+    RATE_LIMIT_REDIS_RETRY = float(os.environ.get('RATE_LIMIT_REDIS_RETRY', 30))
+    # 应用前的反向代理层数，>0时按 X-Forwarded-For 取客户端地址（限流与会话记录使用），直连部署保持0防止伪造
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+    # 每个worker同时处理的API请求上限，超过时返回429；默认比连接池容量少5个，留给后台线程，0为不限
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', DB_POOL_SIZE + DB_MAX_OVERFLOW - 5))
+    
+    # 只读副本（逗号分隔的连接串）：GET接口与报表查询优先走副本，延迟超过阈值时回退主库
+    SQLALCHEMY_REPLICA_URIS = [
+        uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()
+    ]
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+    # 写请求之后该客户端的读请求在此时间内仍走主库（读己之写）
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    
+    # 网络配置
+    NETWORK_SEGMENTS = [
+        os.environ.get('NETWORK_SEGMENT_1', '192.168.100.0/24'),
+        os.environ.get('NETWORK_SEGMENT_2', '192.168.101.0/24'),
+        os.environ.get('NETWORK_SEGMENT_3', '192.168.102.0/24')
+    ]
+    
+    # JSON序列化配置: orjson 或 std
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+    
+    # 监控指标聚合刷新间隔（秒）
+    METRICS_REFRESH_INTERVAL = float(os.environ.get('METRICS_REFRESH_INTERVAL', 15))
+    
+    # 慢查询/N+1检测（按采样率分析请求内SQL）
+    QUERY_PROFILER_ENABLED = os.environ.get('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+    QUERY_PROFILER_SAMPLE_RATE = float(os.environ.get('QUERY_PROFILER_SAMPLE_RATE', 0.05))
+    QUERY_PROFILER_REPEAT_THRESHOLD = int(os.environ.get('QUERY_PROFILER_REPEAT_THRESHOLD', 10))
+    QUERY_PROFILER_SLOW_QUERY_MS = float(os.environ.get('QUERY_PROFILER_SLOW_QUERY_MS', 200))
+    QUERY_PROFILER_EXPLAIN_INTERVAL = float(os.environ.get('QUERY_PROFILER_EXPLAIN_INTERVAL', 300))
+    
+    # 请求剖析（管理员通过 /api/admin/profiling 动态开关）
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0.01))
+    PROFILER_MODE = os.environ.get('PROFILER_MODE', 'sample')
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 2))
+    PROFILER_MAX_PROFILES = int(os.environ.get('PROFILER_MAX_PROFILES', 20))
+    
+    # 资源配额默认值（0表示不限）：租户/项目首次创建虚拟机时按此生成配额记录，之后可单独调整
+    QUOTA_TENANT_DEFAULTS = {
+        resource: int(os.environ.get(f'QUOTA_TENANT_{resource.upper()}', 0))
+        for resource in ('vms', 'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_count')
+    }
+    QUOTA_PROJECT_DEFAULTS = {
+        resource: int(os.environ.get(f'QUOTA_PROJECT_{resource.upper()}', 0))
+        for resource in ('vms', 'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_count')
+    }
+    
+    # GPU放置策略 best_fit（装箱，优先填满已用主机，保留整机空闲给大规格请求）/ worst_fit（分散）/ first_fit
+    GPU_PLACEMENT_POLICY = os.environ.get('GPU_PLACEMENT_POLICY', 'best_fit')
+    # 进程内GPU容量索引按此间隔（秒）从数据库重载，同步其他worker的占用与释放
+    GPU_INVENTORY_REFRESH_INTERVAL = float(os.environ.get('GPU_INVENTORY_REFRESH_INTERVAL', 30))
+    
+    # 主机放置策略 spread（均摊）/ pack（装箱）/ affinity（同项目虚拟机优先放在同一主机，放不下时按pack）
+    HOST_PLACEMENT_POLICY = os.environ.get('HOST_PLACEMENT_POLICY', 'spread')
+    HOST_INVENTORY_REFRESH_INTERVAL = float(os.environ.get('HOST_INVENTORY_REFRESH_INTERVAL', 30))
+    # vCPU超分比：每台主机可分配的vCPU = 物理核数 x 超分比（内存与磁盘不超分）
+    HOST_CPU_OVERCOMMIT = float(os.environ.get('HOST_CPU_OVERCOMMIT', 4))
+    # 放置时占用库存行的锁等待上限（毫秒，仅PostgreSQL），超时则本次创建失败而不是一直等待；0表示不限
+    PLACEMENT_LOCK_TIMEOUT_MS = int(os.environ.get('PLACEMENT_LOCK_TIMEOUT_MS', 5000))
+    
+    # 虚拟化平台驱动 auto（配置了VCENTER_HOST时使用vsphere）/ vsphere / fake（本地模拟）
+    HYPERVISOR_DRIVER = os.environ.get('HYPERVISOR_DRIVER', 'auto')
+    VCENTER_HOST = os.environ.get('VCENTER_HOST', '')
+    VCENTER_PORT = int(os.environ.get('VCENTER_PORT', 443))
+    VCENTER_USER = os.environ.get('VCENTER_USER', '')
+    VCENTER_PASSWORD = os.environ.get('VCENTER_PASSWORD', '')
+    VCENTER_VERIFY_SSL = os.environ.get('VCENTER_VERIFY_SSL', 'true').lower() == 'true'
+    
+    # 模板目录：各worker按刷新间隔从数据库重载缓存，按发现间隔（由一个worker）从虚拟化平台同步
+    TEMPLATE_REFRESH_INTERVAL = float(os.environ.get('TEMPLATE_REFRESH_INTERVAL', 60))
+    TEMPLATE_DISCOVERY_INTERVAL = float(os.environ.get('TEMPLATE_DISCOVERY_INTERVAL', 300))
+    
+    # 虚拟机开通：默认克隆方式 full / linked / instant（创建请求可用clone_mode指定），每个worker的克隆线程数
+    DEFAULT_CLONE_MODE = os.environ.get('DEFAULT_CLONE_MODE', 'full')
+    PROVISION_WORKERS = int(os.environ.get('PROVISION_WORKERS', 4))
+    # 超过重试间隔仍未开始的开通重新提交，克隆超时的标记为失败（秒）
+    PROVISION_RETRY_INTERVAL = float(os.environ.get('PROVISION_RETRY_INTERVAL', 60))
+    PROVISION_TIMEOUT = float(os.environ.get('PROVISION_TIMEOUT', 3600))
+    # 预热池规格 模板:CPU:内存GB:磁盘GB:数量（逗号分隔，如 Ubuntu-22.04-Template:4:8:50:5），为空不启用
+    WARM_POOL_SHAPES = os.environ.get('WARM_POOL_SHAPES', '')
+    WARM_POOL_CLONE_MODE = os.environ.get('WARM_POOL_CLONE_MODE', '')  # 为空时使用DEFAULT_CLONE_MODE
+    WARM_POOL_REFILL_INTERVAL = float(os.environ.get('WARM_POOL_REFILL_INTERVAL', 30))
+    WARM_POOL_WORKERS = int(os.environ.get('WARM_POOL_WORKERS', 2))
+    # 模拟驱动的克隆耗时缩放（1为按模型耗时等待，0为不等待）
+    FAKE_CLONE_TIME_SCALE = float(os.environ.get('FAKE_CLONE_TIME_SCALE', 1))
+    
+    # 计费导出配置
+    BILLING_EXPORT_BATCH_SIZE = int(os.environ.get('BILLING_EXPORT_BATCH_SIZE', 2000))
+    # 计费分区补建检查间隔（秒，0为不检查）：Web进程按此间隔创建未来 BILLING_PARTITION_MONTHS_AHEAD 个月的分区
+    BILLING_PARTITION_CHECK_INTERVAL = float(os.environ.get('BILLING_PARTITION_CHECK_INTERVAL', 6 * 3600))
+
+    # 备份配置
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', '/app/backups')
+    # store: 分块去重写入 BACKUP_DIR/store；plain: pg_dump流式写入压缩器；directory: pg_dump -Fd 按表并行导出
+    BACKUP_FORMAT = os.environ.get('BACKUP_FORMAT', 'store')
+    # plain/directory格式的压缩算法 gzip / zstd / none（store格式每块使用zlib），级别为空时使用默认级别
+    BACKUP_COMPRESSION = os.environ.get('BACKUP_COMPRESSION', 'gzip')
+    BACKUP_COMPRESSION_LEVEL = int(os.environ.get('BACKUP_COMPRESSION_LEVEL') or 0) or None
+    # directory格式的并行导出进程数，0表示使用全部可用CPU
+    BACKUP_JOBS = int(os.environ.get('BACKUP_JOBS', 0))
+    # WAL归档目录（需与数据库 archive_command 写入的目录一致），基础备份位于 BACKUP_DIR/base
+    BACKUP_WAL_DIR = os.environ.get('BACKUP_WAL_DIR', os.path.join(BACKUP_DIR, 'wal'))
+    # 保留的基础备份链数量（基础备份及其之后的WAL）
+    BACKUP_BASE_RETENTION = int(os.environ.get('BACKUP_BASE_RETENTION', 7))
+    # 逻辑备份保留天数（每次备份后清理）
+    BACKUP_RETENTION_DAYS = int(os.environ.get('BACKUP_RETENTION_DAYS', 30))
+    # 定时备份（backup_manager.py --daemon），cron表达式“分 时 日 月 周”按本地时间，为空表示不执行
+    BACKUP_SCHEDULE = os.environ.get('BACKUP_SCHEDULE', '0 2 * * *')
+    BACKUP_BASE_SCHEDULE = os.environ.get('BACKUP_BASE_SCHEDULE', '')
+    # 降低备份任务对线上请求的影响：nice/ionice 降低本机CPU与I/O优先级，
+    # 导出速率上限（MB/s，0为不限）通过管道背压同时限制数据库端的读取速度
+    BACKUP_NICE = int(os.environ.get('BACKUP_NICE', 10))
+    BACKUP_IONICE_CLASS = int(os.environ.get('BACKUP_IONICE_CLASS', 2))
+    BACKUP_IONICE_LEVEL = int(os.environ.get('BACKUP_IONICE_LEVEL', 7))
+    BACKUP_MAX_RATE_MB = float(os.environ.get('BACKUP_MAX_RATE_MB', 0))
+    # 备份任务结果文件，Web应用的 /api/metrics 读取后导出（需与备份任务使用同一目录）
+    BACKUP_METRICS_FILE = os.environ.get('BACKUP_METRICS_FILE', os.path.join(BACKUP_DIR, 'backup_metrics.json'))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+读写分离模块
+GET/HEAD 请求和报表查询路由到只读副本，写请求、会话内已有写入以及刚写过数据的客户端留在主库；
+副本复制延迟超过阈值或无法连接时自动回退主库
+"""
+
+import time
+import random
+import logging
+import threading
+
+from flask import g, request, current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+logger = logging.getLogger(__name__)
+
+# 副本上返回复制延迟秒数；WAL已全部回放时为0，连到的不是副本时为NULL
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+STICKY_COOKIE = 'db_primary_until'
+
+
+def use_primary(f):
+    """强制视图使用主库（如需要读到最新数据的GET接口）"""
+    f.db_route = 'primary'
+    return f
+
+
+def use_replica(f):
+    """允许非GET的只读视图使用副本"""
+    f.db_route = 'replica'
+    return f
+
+
+class _Replica:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.lag = None
+        self.healthy = False
+        self.error = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+
+class RoutingSession(Session):
+    """按请求的路由决定读语句使用的引擎，flush及之后的语句始终使用主库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get('has_writes'):
+            engine = db_router.read_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_writes(session, flush_context):
+    # 已写入但未提交的数据只在主库可见，本会话后续读取也留在主库
+    session.info['has_writes'] = True
+
+
+class ReplicaRouter:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.replicas = []
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """初始化读写分离，未配置副本时所有查询走主库"""
+        self.app = app
+        self.db = db
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', 5)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+        engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        self.replicas = []
+        for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS', [])):
+            options = dict(engine_options)
+            if uri.startswith('postgresql'):
+                # 副本不可达时尽快回退，而不是阻塞请求
+                options['connect_args'] = dict(options.get('connect_args', {}), connect_timeout=3)
+            self.replicas.append(_Replica(f'replica{index + 1}', create_engine(uri, **options)))
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['db_router'] = self
+
+        if self.replicas:
+            logger.info(f"Read replica routing enabled: {len(self.replicas)} replicas, max_lag={self.max_lag}s")
+
+    def _before_request(self):
+        g.db_route = 'primary'
+        if not self.replicas:
+            return
+
+        view = current_app.view_functions.get(request.endpoint)
+        route = getattr(view, 'db_route', None)
+        if route is None:
+            route = 'replica' if request.method in ('GET', 'HEAD') else 'primary'
+        if route == 'replica' and self._recently_wrote():
+            route = 'primary'
+        g.db_route = route
+
+    def _after_request(self, response):
+        # 写请求成功后一段时间内该客户端的读请求留在主库，避免读到复制前的旧数据
+        if (self.replicas and request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400):
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + self.sticky_seconds:.3f}',
+                                max_age=int(self.sticky_seconds) + 1, httponly=True, samesite='Lax')
+        return response
+
+    def _recently_wrote(self):
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def read_engine(self):
+        """当前上下文应读副本时返回一个健康副本的引擎，否则返回None（使用主库）"""
+        if not self.replicas or not has_app_context() or g.get('db_route') != 'replica':
+            return None
+        return self._pick_replica()
+
+    def reporting_engine(self):
+        """报表/聚合查询使用的引擎：健康副本优先，否则主库"""
+        engine = self._pick_replica() if self.replicas else None
+        return engine if engine is not None else self.db.engine
+
+    def _pick_replica(self):
+        healthy = [replica for replica in self.replicas if self._is_healthy(replica)]
+        if not healthy:
+            return None
+        return random.choice(healthy).engine
+
+    def _is_healthy(self, replica):
+        if time.monotonic() - replica.checked_at >= self.check_interval:
+            # 同一副本同时只做一次检查，其他请求沿用上次结果
+            if replica.lock.acquire(blocking=False):
+                try:
+                    self._check(replica)
+                finally:
+                    replica.lock.release()
+        return replica.healthy
+
+    def _check(self, replica):
+        try:
+            with replica.engine.connect() as conn:
+                lag = conn.execute(REPLICA_LAG_SQL).scalar()
+            replica.lag = float(lag) if lag is not None else 0.0
+            replica.error = None
+            healthy = replica.lag <= self.max_lag
+        except Exception as e:
+            replica.lag = None
+            replica.error = str(e)
+            healthy = False
+
+        if healthy != replica.healthy:
+            if healthy:
+                logger.info(f"Replica {replica.name} is healthy (lag {replica.lag:.1f}s)")
+            else:
+                logger.warning(f"Replica {replica.name} excluded: lag={replica.lag} error={replica.error}")
+        replica.healthy = healthy
+        replica.checked_at = time.monotonic()
+
+    def status(self):
+        return [
+            {
+                'name': replica.name,
+                'healthy': self._is_healthy(replica),
+                'lag_seconds': None if replica.lag is None else round(replica.lag, 3),
+                'error': replica.error,
+            }
+            for replica in self.replicas
+        ]
+
+    def dispose(self):
+        """fork后丢弃继承的副本连接"""
+        for replica in self.replicas:
+            replica.engine.dispose(close=False)
+
+
+# 全局实例
+db_router = ReplicaRouter()
@@ -216,7 +216,8 @@ init_database() {
         log_error "数据库初始化失败，尝试手动创建表..."
         # 备用初始化方法
         if $DOCKER_COMPOSE exec app python -c "
-from app import app, db
+from models import create_db_app, db
+app = create_db_app()
 with app.app_context():
     db.create_all()
     print('Tables created successfully')
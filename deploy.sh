@@ -315,7 +315,8 @@ init_database() {
     
     # 检查是否已初始化
     if $DOCKER_COMPOSE exec app python3 -c "
-from app import app, db, Tenant
+from models import create_db_app, db, Tenant
+app = create_db_app()
 with app.app_context():
     try:
         count = Tenant.query.count()
@@ -331,7 +332,8 @@ with app.app_context():
     
     # 运行初始化
     if $DOCKER_COMPOSE exec app python3 -c "
-from app import app, db
+from models import create_db_app, db
+app = create_db_app()
 import ipaddress
 
 with app.app_context():
@@ -341,7 +343,7 @@ with app.app_context():
         print('✓ 数据库表创建成功')
         
         # 初始化IP池
-        from app import IPPool
+        from models import IPPool
         segments = ['192.168.100.0/24', '192.168.101.0/24', '192.168.102.0/24']
         total_ips = 0
         
@@ -581,11 +583,9 @@ update() {
 # 备份函数
 backup() {
     log_info "执行数据库备份..."
-    timestamp=$(date +%Y%m%d_%H%M%S)
-    backup_file="backup_${timestamp}.sql"
     
-    if $DOCKER_COMPOSE exec postgres pg_dump -U iaas_user vmware_iaas > "$backup_file"; then
-        log_success "数据库备份完成: $backup_file"
+    if $DOCKER_COMPOSE exec app python3 backup_manager.py --backup; then
+        log_success "数据库备份完成"
     else
         log_error "数据库备份失败"
         exit 1
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - GPU库存与放置调度
+gpu_inventory 记录每台主机每种GPU的卡槽数与已用数；放置时在进程内容量索引中按策略
+（默认best-fit装箱）选出主机，再用条件UPDATE在数据库中占用卡槽，
+其他worker已抢先占用时刷新该主机并换下一台，数据库计数始终是准的
+"""
+
+import sys
+import logging
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from placement import PlacementScheduler
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'gpu_inventory'
+
+POLICIES = ('best_fit', 'worst_fit', 'first_fit')
+
+ALLOCATE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET used_slots = used_slots + :count, updated_at = :now
+WHERE host_name = :host AND gpu_type = :gpu_type AND is_active AND used_slots + :count <= total_slots
+""")
+
+RELEASE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET used_slots = CASE WHEN used_slots > :count THEN used_slots - :count ELSE 0 END,
+    updated_at = :now
+WHERE host_name = :host AND gpu_type = :gpu_type
+""")
+
+INVENTORY_SQL = text(f"""
+SELECT host_name, gpu_type, total_slots, used_slots FROM {TABLE_NAME} WHERE is_active
+""")
+
+HOST_SQL = text(f"""
+SELECT total_slots, used_slots, is_active FROM {TABLE_NAME} WHERE host_name = :host AND gpu_type = :gpu_type
+""")
+
+# 按虚拟机表重算已用卡槽；锁表期间放置/释放的事务等待
+REBUILD_SQL = (
+    f"LOCK TABLE {TABLE_NAME} IN SHARE ROW EXCLUSIVE MODE",
+    f"""
+    UPDATE {TABLE_NAME} g SET used_slots = COALESCE((
+        SELECT sum(v.gpu_count) FROM virtual_machines v
+        WHERE v.host_name = g.host_name AND v.gpu_type = g.gpu_type AND v.status <> 'deleted'
+    ), 0)
+    """,
+)
+
+
+GpuDemand = namedtuple('GpuDemand', 'gpu_type count')
+
+
+class NoGpuCapacity(Exception):
+    def __init__(self, gpu_type, count, free_slots, largest_free):
+        self.gpu_type = gpu_type
+        self.count = count
+        self.free_slots = free_slots
+        self.largest_free = largest_free
+        super().__init__(f"no host has {count} free {gpu_type} GPUs "
+                         f"(free {free_slots}, largest free block {largest_free})")
+
+
+class _TypePool:
+    """单一GPU型号的容量索引：按空闲卡数分桶，桶数为单机最大卡数，查找与更新与主机数无关"""
+
+    def __init__(self):
+        self.capacity = {}
+        self.free = {}
+        # buckets[n] 为空闲卡数恰为n的主机（dict保持插入顺序，用作有序集合）
+        self.buckets = [{}]
+        self.total_slots = 0
+        self.free_slots = 0
+
+    def set_host(self, host, capacity, used):
+        if host in self.capacity:
+            self.remove_host(host)
+        free = max(capacity - used, 0)
+        while len(self.buckets) <= capacity:
+            self.buckets.append({})
+        self.capacity[host] = capacity
+        self.free[host] = free
+        self.buckets[free][host] = None
+        self.total_slots += capacity
+        self.free_slots += free
+
+    def remove_host(self, host):
+        free = self.free.pop(host)
+        del self.buckets[free][host]
+        self.total_slots -= self.capacity.pop(host)
+        self.free_slots -= free
+
+    def adjust(self, host, delta):
+        """已用卡数增加delta（负数为释放）"""
+        free = self.free[host]
+        new_free = min(max(free - delta, 0), self.capacity[host])
+        del self.buckets[free][host]
+        self.buckets[new_free][host] = None
+        self.free[host] = new_free
+        self.free_slots += new_free - free
+
+    def largest_free(self):
+        for free in range(len(self.buckets) - 1, 0, -1):
+            if self.buckets[free]:
+                return free
+        return 0
+
+    def candidates(self, count, policy):
+        """按策略依次产出可容纳count张卡的主机"""
+        if policy == 'first_fit':
+            # 按主机名顺序，需遍历该型号全部主机（仅用于对照，生产使用best_fit/worst_fit）
+            for host in sorted(self.free):
+                if self.free[host] >= count:
+                    yield host
+            return
+        sizes = range(count, len(self.buckets))
+        if policy == 'worst_fit':
+            sizes = reversed(sizes)
+        for free in sizes:
+            # 复制键列表：调用方可能在迭代中调整主机所在的桶
+            yield from list(self.buckets[free])
+
+    def stats(self):
+        used = self.total_slots - self.free_slots
+        # 碎片率：空闲卡中位于已部分占用主机上的比例（无法满足整机请求）
+        stranded = sum(free for host, free in self.free.items() if 0 < free < self.capacity[host])
+        return {
+            'hosts': len(self.capacity),
+            'total_slots': self.total_slots,
+            'used_slots': used,
+            'free_slots': self.free_slots,
+            'largest_free': self.largest_free(),
+            'utilization': used / self.total_slots if self.total_slots else 0.0,
+            'fragmentation': stranded / self.free_slots if self.free_slots else 0.0,
+        }
+
+
+class GpuCapacityIndex:
+    """进程内GPU容量索引（不访问数据库，也用于模拟器）"""
+
+    def __init__(self, policy='best_fit'):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown placement policy: {policy}")
+        self.policy = policy
+        self.pools = {}
+
+    @classmethod
+    def from_rows(cls, rows, policy='best_fit'):
+        """rows: (host_name, gpu_type, total_slots, used_slots)"""
+        index = cls(policy)
+        for host, gpu_type, total_slots, used_slots in rows:
+            index.set_host(host, gpu_type, total_slots, used_slots)
+        return index
+
+    def set_host(self, host, gpu_type, total_slots, used_slots=0):
+        self.pools.setdefault(gpu_type, _TypePool()).set_host(host, total_slots, used_slots)
+
+    def remove_host(self, host, gpu_type):
+        pool = self.pools.get(gpu_type)
+        if pool and host in pool.capacity:
+            pool.remove_host(host)
+
+    def can_place(self, gpu_type, count):
+        """是否存在能容纳count张卡的主机（与主机数无关的常数时间检查）"""
+        pool = self.pools.get(gpu_type)
+        return pool is not None and any(pool.buckets[free] for free in range(count, len(pool.buckets)))
+
+    def fits(self, host, gpu_type, count):
+        pool = self.pools.get(gpu_type)
+        return pool is not None and pool.free.get(host, -1) >= count
+
+    def candidates(self, gpu_type, count):
+        pool = self.pools.get(gpu_type)
+        if pool is None:
+            return iter(())
+        return pool.candidates(count, self.policy)
+
+    def place(self, gpu_type, count):
+        """选出主机并在索引中占用，无可用主机时返回None"""
+        for host in self.candidates(gpu_type, count):
+            self.allocate(host, gpu_type, count)
+            return host
+        return None
+
+    def allocate(self, host, gpu_type, count):
+        self.pools[gpu_type].adjust(host, count)
+
+    def release(self, host, gpu_type, count):
+        pool = self.pools.get(gpu_type)
+        if pool and host in pool.capacity:
+            pool.adjust(host, -count)
+
+    def free_slots(self, gpu_type):
+        pool = self.pools.get(gpu_type)
+        return pool.free_slots if pool else 0
+
+    def largest_free(self, gpu_type):
+        pool = self.pools.get(gpu_type)
+        return pool.largest_free() if pool else 0
+
+    def stats(self):
+        return {gpu_type: pool.stats() for gpu_type, pool in self.pools.items()}
+
+
+class GpuScheduler(PlacementScheduler):
+    """GPU卡槽调度：索引按 主机 x GPU型号 记录卡槽数与已用数"""
+
+    extension_name = 'gpu_scheduler'
+    allocate_sql = ALLOCATE_SQL
+    release_sql = RELEASE_SQL
+
+    def init_app(self, app, db):
+        self.policy = app.config.get('GPU_PLACEMENT_POLICY', 'best_fit')
+        self.refresh_interval = app.config.get('GPU_INVENTORY_REFRESH_INTERVAL', 30)
+        if self.policy not in POLICIES:
+            raise ValueError(f"unknown GPU placement policy: {self.policy}")
+        super().init_app(app, db)
+
+    def _load_index(self, session):
+        return GpuCapacityIndex.from_rows(session.execute(INVENTORY_SQL).all(), self.policy)
+
+    def _fetch_host(self, session, host, demand):
+        return session.execute(HOST_SQL, {'host': host, 'gpu_type': demand.gpu_type}).first()
+
+    def _apply_host(self, host, demand, row):
+        if row is None or not row.is_active:
+            self.index.remove_host(host, demand.gpu_type)
+        else:
+            self.index.set_host(host, demand.gpu_type, row.total_slots, row.used_slots)
+
+    def _choose(self, demand, skip):
+        for host in self.index.candidates(demand.gpu_type, demand.count):
+            if host not in skip:
+                return host
+        return None
+
+    def _fits(self, host, demand):
+        return self.index.fits(host, demand.gpu_type, demand.count)
+
+    def _allocate(self, host, demand):
+        self.index.allocate(host, demand.gpu_type, demand.count)
+
+    def _unallocate(self, host, demand):
+        self.index.release(host, demand.gpu_type, demand.count)
+
+    def _params(self, host, demand):
+        return {'host': host, 'gpu_type': demand.gpu_type, 'count': demand.count}
+
+    def place(self, session, gpu_type, count, skip=()):
+        """在当前事务内为 gpu_type x count 占用卡槽并返回主机名，skip中的主机不考虑
+
+        未配置任何GPU库存时返回None（不做容量管理）；容量不足时抛出NoGpuCapacity
+        """
+        self._ensure_loaded(session)
+        if not self.index.pools:
+            return None
+        host = self._place(session, GpuDemand(gpu_type, count), skip=skip)
+        if host is None:
+            with self._lock:
+                raise NoGpuCapacity(gpu_type, count, self.index.free_slots(gpu_type),
+                                    self.index.largest_free(gpu_type))
+        return host
+
+    def release(self, session, host, gpu_type, count):
+        self._release(session, host, GpuDemand(gpu_type, count))
+
+    def gpu_types(self, session):
+        self._ensure_loaded(session)
+        with self._lock:
+            return set(self.index.pools)
+
+
+def rebuild_usage(session):
+    """按虚拟机表重算各主机已用卡槽（直接写入虚拟机表或升级后使用）"""
+    for statement in REBUILD_SQL:
+        session.execute(text(statement))
+    session.commit()
+
+
+# 全局实例
+gpu_scheduler = GpuScheduler()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS GPU inventory')
+    parser.add_argument('--list', action='store_true', help='List GPU hosts and utilization')
+    parser.add_argument('--add', nargs=3, metavar=('HOST', 'GPU_TYPE', 'SLOTS'),
+                        help='Add a GPU host or change its slot count')
+    parser.add_argument('--disable', nargs=2, metavar=('HOST', 'GPU_TYPE'),
+                        help='Stop placing new VMs on a GPU host')
+    parser.add_argument('--rebuild', action='store_true', help='Recalculate used slots from virtual_machines')
+    args = parser.parse_args()
+
+    from models import create_db_app, db, GpuInventory
+
+    with create_db_app().app_context():
+        if args.add:
+            host, gpu_type, slots = args.add
+            entry = db.session.get(GpuInventory, (host, gpu_type)) or GpuInventory(host_name=host, gpu_type=gpu_type)
+            entry.total_slots = int(slots)
+            entry.is_active = True
+            db.session.add(entry)
+            db.session.commit()
+            print(f"✅ {host} {gpu_type} x{slots}")
+        elif args.disable:
+            entry = db.session.get(GpuInventory, tuple(args.disable))
+            if entry is None:
+                print("❌ GPU host not found")
+                sys.exit(1)
+            entry.is_active = False
+            db.session.commit()
+            print(f"✅ {args.disable[0]} disabled")
+        elif args.rebuild:
+            rebuild_usage(db.session)
+            print("✅ GPU usage rebuilt")
+        elif args.list:
+            rows = db.session.execute(INVENTORY_SQL).all()
+            for row in sorted(rows):
+                print(f"{row.host_name:<32} {row.gpu_type:<8} {row.used_slots:>3}/{row.total_slots}")
+            for gpu_type, stats in sorted(GpuCapacityIndex.from_rows(rows).stats().items()):
+                print(f"{gpu_type}: {stats['used_slots']}/{stats['total_slots']} used "
+                      f"({stats['utilization']:.0%}), largest free block {stats['largest_free']}, "
+                      f"fragmentation {stats['fragmentation']:.0%}")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
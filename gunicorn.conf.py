@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - Gunicorn 生产运行配置
+启动: gunicorn -c gunicorn.conf.py app:app （app 为 create_app() 创建的模块级实例）
+所有参数可通过 GUNICORN_* 环境变量覆盖
+"""
+
+import os
+import shutil
+import multiprocessing
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+# gevent需在导入应用（preload）之前打补丁，psycopg2是C扩展，需psycogreen让其等待IO时让出greenlet
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def _cpu_count():
+    """优先使用进程可用的CPU数（容器限制了cpuset时小于物理核数）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# gevent worker单进程即可处理大量并发连接，按核数起进程；同步worker沿用 2*CPU+1
+if worker_class == 'gevent':
+    workers = int(os.environ.get('GUNICORN_WORKERS', _cpu_count()))
+else:
+    workers = int(os.environ.get('GUNICORN_WORKERS', _cpu_count() * 2 + 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# 预加载应用，fork后由post_fork释放继承的数据库连接
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# 定期回收worker防止内存增长，抖动避免所有worker同时重启
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# 计费导出为流式长响应
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# GUNICORN_ACCESS_LOG设为空字符串可关闭访问日志
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# 多worker时Prometheus请求指标写入共享目录汇总，必须在导入prometheus_client之前设置
+if workers > 1:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/vmware-iaas-prometheus')
+
+# 栈采样依赖真实线程，gevent下默认改用跟踪模式
+if worker_class == 'gevent':
+    os.environ.setdefault('PROFILER_MODE', 'trace')
+
+
+def on_starting(server):
+    """清理上次运行残留的多进程指标文件"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    """初始化数据库（与 python app.py 启动时一致），随后关闭主进程的连接"""
+    from app import app
+    from models import db, init_database
+    init_database(app)
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    """丢弃从主进程继承的连接池，子进程使用各自的连接"""
+    from app import app
+    from models import db
+    from db_routing import db_router
+    with app.app_context():
+        db.engine.dispose(close=False)
+    db_router.dispose()
+
+
+def child_exit(server, worker):
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid, multiproc_dir)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 主机容量与放置调度
+host_inventory 记录每台ESXi主机的CPU/内存/磁盘容量与已分配量；放置时在进程内索引中
+按策略选出主机，再用条件UPDATE在数据库中占用，其他worker已抢先占用时刷新该主机并换下一台。
+
+索引按空闲内存排序（内存通常最先耗尽），二分定位到内存足够的第一台主机后顺序检查CPU与磁盘:
+  spread   - 从空闲最多的主机开始，负载均摊
+  pack     - 从刚好放得下的主机开始（best-fit），保留整机空闲给大规格
+  affinity - 优先放到该项目已有虚拟机的主机（已有台数多者优先），都放不下时按pack
+"""
+
+import sys
+import bisect
+import logging
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from placement import PlacementScheduler
+from gpu_placement import NoGpuCapacity
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'host_inventory'
+
+POLICIES = ('spread', 'pack', 'affinity')
+
+ALLOCATE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET
+    cpu_used = cpu_used + :cpu, memory_used = memory_used + :memory, disk_used = disk_used + :disk,
+    updated_at = :now
+WHERE host_name = :host AND is_active
+  AND cpu_used + :cpu <= cpu_cores * :cpu_overcommit
+  AND memory_used + :memory <= memory_gb AND disk_used + :disk <= disk_gb
+""")
+
+RELEASE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET
+    cpu_used = CASE WHEN cpu_used > :cpu THEN cpu_used - :cpu ELSE 0 END,
+    memory_used = CASE WHEN memory_used > :memory THEN memory_used - :memory ELSE 0 END,
+    disk_used = CASE WHEN disk_used > :disk THEN disk_used - :disk ELSE 0 END, updated_at = :now
+WHERE host_name = :host
+""")
+
+INVENTORY_SQL = text(f"""
+SELECT host_name, cpu_cores, memory_gb, disk_gb, cpu_used, memory_used, disk_used
+FROM {TABLE_NAME} WHERE is_active
+""")
+
+HOST_SQL = text(f"""
+SELECT cpu_cores, memory_gb, disk_gb, cpu_used, memory_used, disk_used, is_active
+FROM {TABLE_NAME} WHERE host_name = :host
+""")
+
+# 项目亲和：各项目在各主机上的虚拟机数
+PROJECT_HOSTS_SQL = text("""
+SELECT project_id, host_name, count(*) FROM virtual_machines
+WHERE status <> 'deleted' AND host_name IS NOT NULL
+GROUP BY project_id, host_name
+""")
+
+# 按虚拟机表（及尚未领用的预热池虚拟机）重算已分配量；锁表期间放置/释放的事务等待
+REBUILD_SQL = (
+    f"LOCK TABLE {TABLE_NAME} IN SHARE ROW EXCLUSIVE MODE",
+    f"UPDATE {TABLE_NAME} SET cpu_used = 0, memory_used = 0, disk_used = 0",
+    f"""
+    UPDATE {TABLE_NAME} h SET cpu_used = u.cpu, memory_used = u.memory, disk_used = u.disk
+    FROM (
+        SELECT host_name, sum(cpu_cores) AS cpu, sum(memory_gb) AS memory, sum(disk_gb) AS disk
+        FROM (
+            SELECT host_name, cpu_cores, memory_gb, disk_gb FROM virtual_machines
+            WHERE status <> 'deleted' AND host_name IS NOT NULL
+            UNION ALL
+            SELECT host_name, cpu_cores, memory_gb, disk_gb FROM warm_pool_vms
+            WHERE status IN ('provisioning', 'ready') AND host_name IS NOT NULL
+        ) vms
+        GROUP BY host_name
+    ) u
+    WHERE h.host_name = u.host_name
+    """,
+)
+
+
+HostDemand = namedtuple('HostDemand', 'cpu memory disk project_id')
+
+
+class NoHostCapacity(Exception):
+    def __init__(self, cpu, memory, disk, host=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.disk = disk
+        self.host = host
+        target = f"host {host}" if host else "no host"
+        super().__init__(f"{target} has capacity for {cpu} vCPU / {memory} GB memory / {disk} GB disk")
+
+
+class HostCapacityIndex:
+    """进程内主机容量索引（不访问数据库，也用于基准测试）"""
+
+    def __init__(self, policy='spread', cpu_overcommit=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown placement policy: {policy}")
+        self.policy = policy
+        self.cpu_overcommit = cpu_overcommit
+        # host -> [可分配vCPU, memory_gb, disk_gb, cpu_used, memory_used, disk_used]
+        self.hosts = {}
+        # (空闲内存, 主机名) 有序列表
+        self.order = []
+        # project_id -> {host: 虚拟机数}
+        self.project_hosts = {}
+
+    @classmethod
+    def from_rows(cls, rows, policy='spread', project_rows=(), cpu_overcommit=1.0):
+        """rows: (host_name, cpu_cores, memory_gb, disk_gb, cpu_used, memory_used, disk_used)
+        project_rows: (project_id, host_name, vm_count)"""
+        index = cls(policy, cpu_overcommit)
+        for host, cpu_cores, *values in rows:
+            index.hosts[host] = [cpu_cores * cpu_overcommit] + values
+        index.order = sorted((values[1] - values[4], host) for host, values in index.hosts.items())
+        for project_id, host, count in project_rows:
+            index.project_hosts.setdefault(project_id, {})[host] = count
+        return index
+
+    def _key(self, host):
+        values = self.hosts[host]
+        return (values[1] - values[4], host)
+
+    def set_host(self, host, cpu_cores, memory_gb, disk_gb, cpu_used=0, memory_used=0, disk_used=0):
+        if host in self.hosts:
+            self.order.pop(bisect.bisect_left(self.order, self._key(host)))
+        self.hosts[host] = [cpu_cores * self.cpu_overcommit, memory_gb, disk_gb, cpu_used, memory_used, disk_used]
+        bisect.insort(self.order, self._key(host))
+
+    def remove_host(self, host):
+        if host in self.hosts:
+            self.order.pop(bisect.bisect_left(self.order, self._key(host)))
+            del self.hosts[host]
+
+    def fits(self, host, cpu, memory, disk):
+        values = self.hosts.get(host)
+        return (values is not None and values[3] + cpu <= values[0]
+                and values[4] + memory <= values[1] and values[5] + disk <= values[2])
+
+    def choose(self, cpu, memory, disk, project_id=None, skip=()):
+        """按策略选出一台放得下的主机，没有时返回None"""
+        if self.policy == 'affinity' and project_id is not None:
+            best, best_count = None, 0
+            for host, count in self.project_hosts.get(project_id, {}).items():
+                if count > best_count and host not in skip and self.fits(host, cpu, memory, disk):
+                    best, best_count = host, count
+            if best is not None:
+                return best
+
+        start = bisect.bisect_left(self.order, (memory, ''))
+        positions = range(start, len(self.order))
+        if self.policy == 'spread':
+            positions = reversed(positions)
+        for position in positions:
+            host = self.order[position][1]
+            if host not in skip and self.fits(host, cpu, memory, disk):
+                return host
+        return None
+
+    def allocate(self, host, cpu, memory, disk, project_id=None):
+        self._adjust(host, cpu, memory, disk)
+        if project_id is not None:
+            placed = self.project_hosts.setdefault(project_id, {})
+            placed[host] = placed.get(host, 0) + 1
+
+    def release(self, host, cpu, memory, disk, project_id=None):
+        if host not in self.hosts:
+            return
+        self._adjust(host, -cpu, -memory, -disk)
+        placed = self.project_hosts.get(project_id)
+        if placed and host in placed:
+            placed[host] -= 1
+            if placed[host] <= 0:
+                del placed[host]
+
+    def _adjust(self, host, cpu, memory, disk):
+        values = self.hosts[host]
+        self.order.pop(bisect.bisect_left(self.order, self._key(host)))
+        values[3] = max(values[3] + cpu, 0)
+        values[4] = max(values[4] + memory, 0)
+        values[5] = max(values[5] + disk, 0)
+        bisect.insort(self.order, self._key(host))
+
+    def stats(self):
+        totals = [0] * 6
+        for values in self.hosts.values():
+            for i, value in enumerate(values):
+                totals[i] += value
+        return {
+            'hosts': len(self.hosts),
+            'cpu_cores': totals[0], 'memory_gb': totals[1], 'disk_gb': totals[2],
+            'cpu_used': totals[3], 'memory_used': totals[4], 'disk_used': totals[5],
+            'empty_hosts': sum(1 for values in self.hosts.values() if not any(values[3:])),
+        }
+
+
+class HostScheduler(PlacementScheduler):
+    """主机容量调度：索引按主机记录CPU/内存/磁盘容量与已分配量"""
+
+    extension_name = 'host_scheduler'
+    allocate_sql = ALLOCATE_SQL
+    release_sql = RELEASE_SQL
+
+    def init_app(self, app, db):
+        self.policy = app.config.get('HOST_PLACEMENT_POLICY', 'spread')
+        self.refresh_interval = app.config.get('HOST_INVENTORY_REFRESH_INTERVAL', 30)
+        self.cpu_overcommit = app.config.get('HOST_CPU_OVERCOMMIT', 1.0)
+        if self.policy not in POLICIES:
+            raise ValueError(f"unknown host placement policy: {self.policy}")
+        super().init_app(app, db)
+
+    def _load_index(self, session):
+        rows = session.execute(INVENTORY_SQL).all()
+        project_rows = session.execute(PROJECT_HOSTS_SQL).all() if self.policy == 'affinity' else ()
+        return HostCapacityIndex.from_rows(rows, self.policy, project_rows, self.cpu_overcommit)
+
+    def _fetch_host(self, session, host, demand):
+        return session.execute(HOST_SQL, {'host': host}).first()
+
+    def _apply_host(self, host, demand, row):
+        if row is None or not row.is_active:
+            self.index.remove_host(host)
+        else:
+            self.index.set_host(host, *row[:6])
+
+    def _choose(self, demand, skip):
+        return self.index.choose(demand.cpu, demand.memory, demand.disk, demand.project_id, skip)
+
+    def _fits(self, host, demand):
+        return self.index.fits(host, demand.cpu, demand.memory, demand.disk)
+
+    def _allocate(self, host, demand):
+        self.index.allocate(host, demand.cpu, demand.memory, demand.disk, demand.project_id)
+
+    def _unallocate(self, host, demand):
+        self.index.release(host, demand.cpu, demand.memory, demand.disk, demand.project_id)
+
+    def _params(self, host, demand):
+        return {'host': host, 'cpu': demand.cpu, 'memory': demand.memory, 'disk': demand.disk,
+                'cpu_overcommit': self.cpu_overcommit}
+
+    def place(self, session, cpu, memory, disk, project_id=None, host=None):
+        """在当前事务内占用主机容量并返回主机名
+
+        host已确定（如GPU放置选出的主机）时只在该主机上占用，主机不在库存中时原样返回；
+        未登记任何主机库存时返回host（不做容量管理）；容量不足时抛出NoHostCapacity
+        """
+        self._ensure_loaded(session)
+        if not self.index.hosts or (host is not None and host not in self.index.hosts):
+            return host
+        placed = self._place(session, HostDemand(cpu, memory, disk, project_id), host)
+        if placed is None:
+            raise NoHostCapacity(cpu, memory, disk, host)
+        return placed
+
+    def place_gpu(self, session, gpu_scheduler, gpu_type, gpu_count, cpu, memory, disk, project_id=None):
+        """GPU虚拟机：GPU调度选出主机后在该主机上占用CPU/内存/磁盘，放不下时释放卡槽换下一台GPU主机
+
+        没有空闲卡槽时抛出NoGpuCapacity，有卡槽的主机都放不下时抛出NoHostCapacity
+        """
+        tried = set()
+        while True:
+            try:
+                host = gpu_scheduler.place(session, gpu_type, gpu_count, skip=tried)
+            except NoGpuCapacity:
+                if tried:
+                    raise NoHostCapacity(cpu, memory, disk)
+                raise
+            try:
+                return self.place(session, cpu, memory, disk, project_id=project_id, host=host)
+            except NoHostCapacity:
+                if host is None:
+                    raise
+                gpu_scheduler.release(session, host, gpu_type, gpu_count)
+                tried.add(host)
+
+    def attribute(self, session, host, project_id):
+        """将已在数据库中占用容量的主机（领用的预热虚拟机）计入项目，亲和策略据此选择主机"""
+        if host is None or project_id is None:
+            return
+        self._ensure_loaded(session)
+        demand = HostDemand(0, 0, 0, project_id)
+        with self._lock:
+            if host not in self.index.hosts:
+                return
+            self._allocate(host, demand)
+        # 与占用一样，事务未提交时撤销
+        self._track(session, 'claim', host, demand)
+
+    def release(self, session, host, cpu, memory, disk, project_id=None):
+        self._release(session, host, HostDemand(cpu, memory, disk, project_id))
+
+
+def rebuild_usage(session):
+    """按虚拟机表与预热池重算各主机已分配量（直接写入虚拟机表或升级后使用）"""
+    for statement in REBUILD_SQL:
+        session.execute(text(statement))
+    session.commit()
+
+
+# 全局实例
+host_scheduler = HostScheduler()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS host inventory')
+    parser.add_argument('--list', action='store_true', help='List hosts and allocated capacity')
+    parser.add_argument('--add', nargs=4, metavar=('HOST', 'CORES', 'MEMORY_GB', 'DISK_GB'),
+                        help='Add a host or change its capacity')
+    parser.add_argument('--disable', metavar='HOST', help='Stop placing new VMs on a host')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Recalculate allocations from virtual_machines and the warm pool')
+    args = parser.parse_args()
+
+    from models import create_db_app, db, HostInventory
+
+    with create_db_app().app_context():
+        if args.add:
+            host, cpu, memory, disk = args.add
+            entry = db.session.get(HostInventory, host) or HostInventory(host_name=host)
+            entry.cpu_cores, entry.memory_gb, entry.disk_gb = int(cpu), int(memory), int(disk)
+            entry.is_active = True
+            db.session.add(entry)
+            db.session.commit()
+            print(f"✅ {host} {cpu} cores / {memory} GB / {disk} GB")
+        elif args.disable:
+            entry = db.session.get(HostInventory, args.disable)
+            if entry is None:
+                print("❌ Host not found")
+                sys.exit(1)
+            entry.is_active = False
+            db.session.commit()
+            print(f"✅ {args.disable} disabled")
+        elif args.rebuild:
+            rebuild_usage(db.session)
+            print("✅ Host allocations rebuilt")
+        elif args.list:
+            rows = db.session.execute(INVENTORY_SQL).all()
+            print(f"{'Host':<32} {'Cores':>11} {'Memory GB':>13} {'Disk GB':>15}")
+            for row in sorted(rows):
+                print(f"{row.host_name:<32} {f'{row.cpu_used}/{row.cpu_cores}':>11} "
+                      f"{f'{row.memory_used}/{row.memory_gb}':>13} {f'{row.disk_used}/{row.disk_gb}':>15}")
+            stats = HostCapacityIndex.from_rows(rows).stats()
+            print(f"{stats['hosts']} hosts ({stats['empty_hosts']} empty): "
+                  f"vCPU {stats['cpu_used']}/{stats['cpu_cores']:g} cores, "
+                  f"memory {stats['memory_used']}/{stats['memory_gb']} GB, "
+                  f"disk {stats['disk_used']}/{stats['disk_gb']} GB")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 虚拟化平台驱动
+vsphere: 通过pyvmomi访问vCenter；fake: 本地模拟（未配置vCenter的开发/测试环境）
+
+克隆方式:
+  full    - 从模板完整复制磁盘，耗时与占用随磁盘大小增长
+  linked  - 基于模板基础快照创建差分盘，秒级完成，只占用写入的增量
+  instant - 从运行中的基础虚拟机分叉内存与磁盘状态，最快，规格与基础虚拟机相同
+链接克隆与即时克隆所需的基础虚拟机/快照由驱动按模板维护，首次使用时创建
+"""
+
+import ssl
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 模拟驱动的模板（与原固定模板列表一致）
+FAKE_TEMPLATES = [
+    {'name': 'Ubuntu-20.04-Template', 'display_name': 'Ubuntu 20.04 LTS', 'os_type': 'Linux',
+     'guest_os': 'ubuntu64Guest', 'min_cpu_cores': 1, 'min_memory_gb': 1, 'disk_gb': 20},
+    {'name': 'Ubuntu-22.04-Template', 'display_name': 'Ubuntu 22.04 LTS', 'os_type': 'Linux',
+     'guest_os': 'ubuntu64Guest', 'min_cpu_cores': 1, 'min_memory_gb': 2, 'disk_gb': 25},
+    {'name': 'CentOS-7-Template', 'display_name': 'CentOS 7', 'os_type': 'Linux',
+     'guest_os': 'centos7_64Guest', 'min_cpu_cores': 1, 'min_memory_gb': 1, 'disk_gb': 20},
+    {'name': 'Windows-Server-2019-Template', 'display_name': 'Windows Server 2019', 'os_type': 'Windows',
+     'guest_os': 'windows2019srv_64Guest', 'min_cpu_cores': 2, 'min_memory_gb': 4, 'disk_gb': 60},
+    {'name': 'Windows-Server-2022-Template', 'display_name': 'Windows Server 2022', 'os_type': 'Windows',
+     'guest_os': 'windows2019srvNext_64Guest', 'min_cpu_cores': 2, 'min_memory_gb': 4, 'disk_gb': 60},
+]
+
+
+CLONE_MODES = ('full', 'linked', 'instant')
+
+# 基础虚拟机命名后缀与快照名
+BASE_VM_SUFFIX = '-iaas-base'
+BASE_SNAPSHOT_NAME = 'iaas-base'
+
+# 模拟驱动各克隆方式的耗时与存储模型:
+# 耗时 = 固定开销 + 每GB复制耗时 x 复制量，存储 = 固定占用 + 模板磁盘 x 复制比例（秒、GB）
+FAKE_CLONE_PROFILES = {
+    'full': {'overhead': 15.0, 'seconds_per_gb': 1.5, 'fixed_gb': 0.0, 'copy_ratio': 1.0},
+    'linked': {'overhead': 4.0, 'seconds_per_gb': 0.0, 'fixed_gb': 0.2, 'copy_ratio': 0.0},
+    'instant': {'overhead': 1.0, 'seconds_per_gb': 0.0, 'fixed_gb': 0.1, 'copy_ratio': 0.0},
+}
+# 模拟驱动领用预热虚拟机（改名 + 开机）的耗时（秒）
+FAKE_ASSIGN_SECONDS = 1.5
+
+
+class HypervisorError(Exception):
+    pass
+
+
+class FakeDriver:
+    """模拟驱动：按克隆方式模拟耗时与存储占用，time_scale缩放实际等待时间（0为不等待）"""
+
+    name = 'fake'
+
+    def __init__(self, templates=None, time_scale=1.0, jitter=0.2, seed=None):
+        self.templates = [dict(t) for t in (templates or FAKE_TEMPLATES)]
+        self.time_scale = time_scale
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.base_snapshots = {}
+        self.powered_on_bases = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def list_templates(self):
+        return [dict(t) for t in self.templates]
+
+    def _template(self, template_name):
+        for template in self.templates:
+            if template['name'] == template_name:
+                return template
+        raise HypervisorError(f"template {template_name} not found")
+
+    def _wait(self, seconds):
+        if self.time_scale:
+            time.sleep(seconds * self.time_scale * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def ensure_base_snapshot(self, template_name, powered_on=False):
+        """返回模板的基础快照名，首次调用时模拟完整克隆出基础虚拟机并打快照的耗时"""
+        template = self._template(template_name)
+        with self._lock:
+            snapshot = self.base_snapshots.get(template_name)
+            if snapshot is None:
+                profile = FAKE_CLONE_PROFILES['full']
+                self._wait(profile['overhead'] + profile['seconds_per_gb'] * template['disk_gb'] + 5)
+                snapshot = self.base_snapshots[template_name] = f"{template_name}{BASE_VM_SUFFIX}/{BASE_SNAPSHOT_NAME}"
+            if powered_on and template_name not in self.powered_on_bases:
+                self._wait(30)
+                self.powered_on_bases.add(template_name)
+        return snapshot
+
+    def clone(self, template_name, vm_name, mode, cpu_cores, memory_gb, disk_gb, host_name=None, power_on=True):
+        """克隆虚拟机，返回 {'vm_id', 'storage_gb', 'base_snapshot'}"""
+        if mode not in CLONE_MODES:
+            raise HypervisorError(f"unknown clone mode: {mode}")
+        template = self._template(template_name)
+        base_snapshot = None
+        if mode != 'full':
+            base_snapshot = self.ensure_base_snapshot(template_name, powered_on=mode == 'instant')
+
+        profile = FAKE_CLONE_PROFILES[mode]
+        copied_gb = template['disk_gb'] * profile['copy_ratio']
+        self._wait(profile['overhead'] + profile['seconds_per_gb'] * copied_gb)
+        with self._lock:
+            self._counter += 1
+            vm_id = f'vm-fake-{self._counter}'
+        return {
+            'vm_id': vm_id,
+            'storage_gb': round(profile['fixed_gb'] + copied_gb, 2),
+            'base_snapshot': base_snapshot,
+        }
+
+    def assign(self, vm_id, vm_name):
+        """已开通的虚拟机改名并开机（领用预热池虚拟机）"""
+        self._wait(FAKE_ASSIGN_SECONDS)
+        return {'vm_id': vm_id}
+
+
+class VSphereDriver:
+    name = 'vsphere'
+
+    def __init__(self, host, user, password, port=443, verify_ssl=True):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.verify_ssl = verify_ssl
+        self._service_instance = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """复用会话，会话失效时重新登录"""
+        from pyVim.connect import SmartConnect
+        with self._lock:
+            if self._service_instance is not None:
+                try:
+                    if self._service_instance.content.sessionManager.currentSession:
+                        return self._service_instance
+                except Exception:
+                    pass
+            context = None if self.verify_ssl else ssl._create_unverified_context()
+            try:
+                self._service_instance = SmartConnect(host=self.host, user=self.user, pwd=self.password,
+                                                      port=self.port, sslContext=context)
+            except Exception as e:
+                raise HypervisorError(f"vCenter connection failed: {str(e)}") from e
+            return self._service_instance
+
+    def list_templates(self):
+        """列出vCenter中的模板及其硬件规格（模板的配置作为创建虚拟机的最低规格）"""
+        from pyVmomi import vim, vmodl
+
+        content = self._connect().RetrieveContent()
+        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+        try:
+            # 属性收集器一次取回所需字段，避免逐个虚拟机往返
+            traversal = vmodl.query.PropertyCollector.TraversalSpec(
+                name='view', path='view', skip=False, type=vim.view.ContainerView)
+            spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=[
+                    'name', 'config.template', 'config.guestId', 'config.guestFullName',
+                    'config.hardware.numCPU', 'config.hardware.memoryMB', 'config.hardware.device',
+                ])],
+            )
+            objects = content.propertyCollector.RetrieveContents([spec])
+        finally:
+            view.Destroy()
+
+        templates = []
+        for obj in objects:
+            props = {prop.name: prop.val for prop in obj.propSet}
+            if not props.get('config.template'):
+                continue
+            guest_id = props.get('config.guestId') or ''
+            disk_kb = sum(device.capacityInKB for device in props.get('config.hardware.device', [])
+                          if isinstance(device, vim.vm.device.VirtualDisk))
+            templates.append({
+                'name': props['name'],
+                'display_name': props.get('config.guestFullName') or props['name'],
+                'os_type': 'Windows' if guest_id.startswith('windows') else 'Linux',
+                'guest_os': guest_id,
+                'min_cpu_cores': props.get('config.hardware.numCPU') or 1,
+                'min_memory_gb': max((props.get('config.hardware.memoryMB') or 0) // 1024, 1),
+                'disk_gb': -(-disk_kb // (1024 * 1024)),
+            })
+        return templates
+
+    def _find_vm(self, content, name):
+        from pyVmomi import vim
+        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+        try:
+            for vm in view.view:
+                if vm.name == name:
+                    return vm
+        finally:
+            view.Destroy()
+        return None
+
+    def _find_host(self, content, name):
+        from pyVmomi import vim
+        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
+        try:
+            for host in view.view:
+                if host.name == name:
+                    return host
+        finally:
+            view.Destroy()
+        return None
+
+    @staticmethod
+    def _wait_task(task):
+        from pyVmomi import vim
+        while task.info.state in (vim.TaskInfo.State.queued, vim.TaskInfo.State.running):
+            time.sleep(0.5)
+        if task.info.state != vim.TaskInfo.State.success:
+            raise HypervisorError(str(task.info.error.msg if task.info.error else task.info.state))
+        return task.info.result
+
+    def ensure_base_snapshot(self, template_name, powered_on=False):
+        """返回模板对应的基础虚拟机（带基础快照），不存在时从模板完整克隆后打快照；
+        即时克隆要求基础虚拟机处于开机状态"""
+        from pyVmomi import vim
+
+        content = self._connect().RetrieveContent()
+        template = self._find_vm(content, template_name)
+        if template is None:
+            raise HypervisorError(f"template {template_name} not found")
+
+        base_name = f'{template_name}{BASE_VM_SUFFIX}'
+        with self._lock:
+            base = self._find_vm(content, base_name)
+            if base is None:
+                spec = vim.vm.CloneSpec(location=vim.vm.RelocateSpec(pool=template.resourcePool), powerOn=False)
+                base = self._wait_task(template.CloneVM_Task(folder=template.parent, name=base_name, spec=spec))
+            if base.snapshot is None:
+                self._wait_task(base.CreateSnapshot_Task(name=BASE_SNAPSHOT_NAME, description='IaaS clone base',
+                                                         memory=False, quiesce=False))
+            if powered_on and base.runtime.powerState != vim.VirtualMachinePowerState.poweredOn:
+                self._wait_task(base.PowerOnVM_Task())
+        return base
+
+    def clone(self, template_name, vm_name, mode, cpu_cores, memory_gb, disk_gb, host_name=None, power_on=True):
+        """克隆虚拟机，返回 {'vm_id', 'storage_gb', 'base_snapshot'}
+
+        完整克隆按请求设置CPU/内存并扩容系统盘；链接克隆设置CPU/内存，系统盘保持基础快照大小；
+        即时克隆继承基础虚拟机的运行状态，CPU/内存与模板相同
+        """
+        from pyVmomi import vim
+
+        if mode not in CLONE_MODES:
+            raise HypervisorError(f"unknown clone mode: {mode}")
+        content = self._connect().RetrieveContent()
+        location = vim.vm.RelocateSpec()
+        if host_name:
+            host = self._find_host(content, host_name)
+            if host is None:
+                raise HypervisorError(f"host {host_name} not found")
+            location.host = host
+            location.pool = host.parent.resourcePool
+
+        config = vim.vm.ConfigSpec(numCPUs=cpu_cores, memoryMB=memory_gb * 1024)
+        base_snapshot = None
+        if mode == 'full':
+            source = self._find_vm(content, template_name)
+            if source is None:
+                raise HypervisorError(f"template {template_name} not found")
+            disks = [d for d in source.config.hardware.device if isinstance(d, vim.vm.device.VirtualDisk)]
+            if disks and disk_gb * 1024 * 1024 > disks[0].capacityInKB:
+                disks[0].capacityInKB = disk_gb * 1024 * 1024
+                config.deviceChange = [vim.vm.device.VirtualDeviceSpec(
+                    operation=vim.vm.device.VirtualDeviceSpec.Operation.edit, device=disks[0])]
+            if location.pool is None:
+                location.pool = source.resourcePool
+            spec = vim.vm.CloneSpec(location=location, config=config, powerOn=power_on)
+            vm = self._wait_task(source.CloneVM_Task(folder=source.parent, name=vm_name, spec=spec))
+        elif mode == 'linked':
+            base = self.ensure_base_snapshot(template_name)
+            base_snapshot = f'{base.name}/{BASE_SNAPSHOT_NAME}'
+            location.diskMoveType = 'createNewChildDiskBacking'
+            if location.pool is None:
+                location.pool = base.resourcePool
+            spec = vim.vm.CloneSpec(location=location, config=config, powerOn=power_on,
+                                    snapshot=base.snapshot.currentSnapshot)
+            vm = self._wait_task(base.CloneVM_Task(folder=base.parent, name=vm_name, spec=spec))
+        else:
+            base = self.ensure_base_snapshot(template_name, powered_on=True)
+            base_snapshot = f'{base.name}/running'
+            if location.pool is None:
+                location.pool = base.resourcePool
+            spec = vim.vm.InstantCloneSpec(name=vm_name, location=location)
+            vm = self._wait_task(base.InstantClone_Task(spec=spec))
+            if not power_on:
+                self._wait_task(vm.PowerOffVM_Task())
+
+        return {
+            'vm_id': vm._moId,
+            'storage_gb': round(vm.summary.storage.committed / 1024 ** 3, 2),
+            'base_snapshot': base_snapshot,
+        }
+
+    def assign(self, vm_id, vm_name):
+        """已开通的虚拟机改名并开机（领用预热池虚拟机）"""
+        from pyVmomi import vim
+
+        si = self._connect()
+        vm = vim.VirtualMachine(vm_id, si._stub)
+        self._wait_task(vm.Rename_Task(newName=vm_name))
+        if vm.runtime.powerState != vim.VirtualMachinePowerState.poweredOn:
+            self._wait_task(vm.PowerOnVM_Task())
+        return {'vm_id': vm_id}
+
+
+def get_driver(config):
+    """按配置返回驱动：HYPERVISOR_DRIVER=auto 时配置了vCenter地址使用vsphere，否则使用fake"""
+    driver = config.get('HYPERVISOR_DRIVER', 'auto')
+    if driver == 'auto':
+        driver = 'vsphere' if config.get('VCENTER_HOST') else 'fake'
+    if driver == 'fake':
+        return FakeDriver(time_scale=config.get('FAKE_CLONE_TIME_SCALE', 1.0))
+    if driver == 'vsphere':
+        return VSphereDriver(config['VCENTER_HOST'], config.get('VCENTER_USER'), config.get('VCENTER_PASSWORD'),
+                             port=config.get('VCENTER_PORT', 443),
+                             verify_ssl=config.get('VCENTER_VERIFY_SSL', True))
+    raise ValueError(f"unknown hypervisor driver: {driver}")
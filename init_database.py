@@ -13,16 +13,19 @@ from datetime import datetime, timedelta
 # 添加应用根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db
-from app import Tenant, Project, VirtualMachine, IPPool, BillingRecord, UserSession
+import billing_partitions
+from models import create_db_app, db, Tenant, Project, VirtualMachine, IPPool, BillingRecord, UserSession
 import ipaddress
 
+# 仅加载配置和数据库层，不创建完整的Web应用
+app = create_db_app()
+
 def create_tables():
     """创建数据库表"""
     print("Creating database tables...")
     try:
         with app.app_context():
-            db.create_all()
+            billing_partitions.create_tables(db)
         print("✅ Database tables created successfully")
         return True
     except Exception as e:
@@ -182,7 +185,7 @@ def reset_database():
             db.drop_all()
             print("✅ All tables dropped")
             
-            db.create_all()
+            billing_partitions.create_tables(db)
             print("✅ Tables recreated")
             
             return True
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+JSON序列化模块
+为Flask应用提供可插拔的JSON Provider，优先使用orjson
+"""
+
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """处理标准库json无法直接序列化的类型"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, '_mapping'):
+        # SQLAlchemy Row
+        return dict(obj._mapping)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdJSONProvider(DefaultJSONProvider):
+    """标准库JSON Provider，datetime输出ISO格式，Decimal输出为数字"""
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+
+class ORJSONProvider(StdJSONProvider):
+    """基于orjson的JSON Provider，原生处理datetime，Decimal转为float"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # 带自定义参数时回退到标准库
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype
+        )
+
+
+JSON_PROVIDERS = {
+    'std': StdJSONProvider,
+    'orjson': ORJSONProvider,
+}
+
+
+def init_json_provider(app):
+    """根据配置为应用安装JSON Provider"""
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name == 'orjson' and orjson is None:
+        logger.warning("orjson未安装，使用标准库JSON序列化")
+        name = 'std'
+
+    provider_class = JSON_PROVIDERS.get(name)
+    if provider_class is None:
+        logger.warning(f"未知的JSON Provider: {name}，使用标准库JSON序列化")
+        provider_class = StdJSONProvider
+
+    app.json_provider_class = provider_class
+    app.json = provider_class(app)
+    logger.info(f"JSON Provider: {provider_class.__name__}")
+    return app.json
+
@@ -43,8 +43,9 @@ show_help() {
     echo "🗄️ 数据库命令:"
     echo "  init-db     初始化数据库"
     echo "  backup      备份数据库"
-    echo "  restore     恢复数据库备份 [备份文件]"
+    echo "  restore     恢复数据库备份 [备份ID或文件名]"
     echo "  reset-db    重置数据库（危险）"
+    echo "  partitions  维护计费分区（提前建分区并归档过期分区）"
     echo ""
     echo "🔧 维护命令:"
     echo "  update      更新并重启服务"
@@ -234,7 +235,8 @@ test_system() {
     # 测试数据库连接
     echo "2. 测试数据库连接..."
     if $COMPOSE exec -T app python3 -c "
-from app import app, db
+from models import create_db_app, db
+app = create_db_app()
 with app.app_context():
     db.session.execute('SELECT 1')
     print('Database connection OK')
@@ -336,10 +338,9 @@ case "${1:-help}" in
     init-db)
         echo -e "${BLUE}🗄️  初始化数据库...${NC}"
         if $COMPOSE exec app python3 -c "
-from app import app, db
-with app.app_context():
-    db.create_all()
-    print('✅ 数据库初始化完成')
+from models import create_db_app, init_database
+init_database(create_db_app())
+print('✅ 数据库初始化完成')
 "; then
             echo -e "${GREEN}✅ 数据库初始化成功${NC}"
         else
@@ -347,14 +348,21 @@ with app.app_context():
             exit 1
         fi
         ;;
+    partitions)
+        echo -e "${BLUE}🗂️  维护计费分区...${NC}"
+        if $COMPOSE exec app python3 billing_partitions.py --ensure && \
+           $COMPOSE exec app python3 billing_partitions.py --archive; then
+            echo -e "${GREEN}✅ 计费分区维护完成${NC}"
+        else
+            echo -e "${RED}❌ 计费分区维护失败${NC}"
+            exit 1
+        fi
+        ;;
     backup)
         echo -e "${BLUE}💾 备份数据库...${NC}"
-        timestamp=$(date +%Y%m%d_%H%M%S)
-        backup_file="backup_${timestamp}.sql"
-        
-        if $COMPOSE exec postgres pg_dump -U iaas_user vmware_iaas > "$backup_file"; then
-            echo -e "${GREEN}✅ 数据库备份完成: $backup_file${NC}"
-            echo "备份文件大小: $(du -h "$backup_file" | cut -f1)"
+        # 与定时备份（backup服务）使用同一备份仓库和任务锁
+        if $COMPOSE exec app python3 backup_manager.py --backup; then
+            echo -e "${GREEN}✅ 数据库备份完成${NC}"
         else
             echo -e "${RED}❌ 数据库备份失败${NC}"
             exit 1
@@ -363,22 +371,20 @@ with app.app_context():
     restore)
         echo -e "${BLUE}📥 恢复数据库...${NC}"
         if [ -z "${2:-}" ]; then
-            echo "用法: ./manage.sh restore <备份文件>"
-            echo "可用备份:"
-            ls -la backup_*.sql 2>/dev/null || echo "无备份文件"
-            exit 1
-        fi
-        
-        if [ ! -f "$2" ]; then
-            echo -e "${RED}❌ 备份文件不存在: $2${NC}"
+            echo "用法: ./manage.sh restore <备份ID或文件名>"
+            $COMPOSE exec app python3 backup_manager.py --list
             exit 1
         fi
         
         echo -e "${YELLOW}⚠️  这将覆盖现有数据，确认继续吗？ (y/N)${NC}"
         read -r confirm
         if [[ "$confirm" =~ ^[Yy]$ ]]; then
-            $COMPOSE exec -T postgres psql -U iaas_user -d vmware_iaas < "$2"
-            echo -e "${GREEN}✅ 数据库恢复完成${NC}"
+            if $COMPOSE exec app python3 backup_manager.py --restore "$2"; then
+                echo -e "${GREEN}✅ 数据库恢复完成${NC}"
+            else
+                echo -e "${RED}❌ 数据库恢复失败${NC}"
+                exit 1
+            fi
         else
             echo "操作已取消"
         fi
@@ -390,7 +396,8 @@ with app.app_context():
         if [[ "$confirm" == "RESET" ]]; then
             $COMPOSE exec postgres psql -U iaas_user -d vmware_iaas -c "DROP SCHEMA public CASCADE; CREATE SCHEMA public;"
             $COMPOSE exec app python3 -c "
-from app import app, db
+from models import create_db_app, db
+app = create_db_app()
 with app.app_context():
     db.create_all()
     print('数据库已重置')
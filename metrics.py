@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prometheus监控指标模块
+资源统计由后台线程定期执行一次聚合SQL生成快照，抓取时只读取快照；
+请求钩子与SQLAlchemy游标事件记录每个接口的延迟、查询次数和数据库耗时，
+连接池事件记录连接数与借出数（用于判断连接池是否饱和）；
+备份任务在独立进程中运行，结果写入指标文件，抓取时读取
+"""
+
+import os
+import json
+import time
+import logging
+
+from flask import g, request, has_request_context
+from sqlalchemy import select, func, event
+from sqlalchemy.engine import Engine
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from background import start_per_process
+from gpu_placement import GpuCapacityIndex
+
+logger = logging.getLogger(__name__)
+
+
+class _SnapshotCollector:
+    """从最近一次刷新的快照生成指标，抓取开销与数据库规模无关"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def collect(self):
+        snapshot = self.exporter.snapshot
+        if snapshot is None:
+            return
+
+        # 兼容原有的汇总指标（Grafana面板依赖）
+        totals = snapshot['totals']
+        for name, doc, value in (
+            ('vmware_iaas_vms_total', 'Total number of VMs', totals['vms']),
+            ('vmware_iaas_vms_running', 'Number of running VMs', totals['running']),
+            ('vmware_iaas_vms_stopped', 'Number of stopped VMs', totals['stopped']),
+            ('vmware_iaas_cpu_cores_total', 'Total CPU cores allocated', totals['cpu']),
+            ('vmware_iaas_memory_gb_total', 'Total memory allocated in GB', totals['memory']),
+            ('vmware_iaas_disk_gb_total', 'Total disk allocated in GB', totals['disk']),
+        ):
+            yield GaugeMetricFamily(name, doc, value=value)
+
+        vms = GaugeMetricFamily('vmware_iaas_vms', 'Number of VMs', labels=['tenant', 'status', 'gpu_type'])
+        cpu = GaugeMetricFamily('vmware_iaas_vm_cpu_cores', 'CPU cores allocated', labels=['tenant', 'status'])
+        memory = GaugeMetricFamily('vmware_iaas_vm_memory_gb', 'Memory allocated in GB', labels=['tenant', 'status'])
+        disk = GaugeMetricFamily('vmware_iaas_vm_disk_gb', 'Disk allocated in GB', labels=['tenant', 'status'])
+        gpus = GaugeMetricFamily('vmware_iaas_vm_gpus', 'GPUs allocated', labels=['tenant', 'status', 'gpu_type'])
+
+        for (tenant, status, gpu_type), values in snapshot['vms'].items():
+            vms.add_metric([tenant, status, gpu_type], values['count'])
+            gpus.add_metric([tenant, status, gpu_type], values['gpus'])
+        for (tenant, status), values in snapshot['resources'].items():
+            cpu.add_metric([tenant, status], values['cpu'])
+            memory.add_metric([tenant, status], values['memory'])
+            disk.add_metric([tenant, status], values['disk'])
+
+        ip_addresses = GaugeMetricFamily('vmware_iaas_ip_pool_addresses', 'IP addresses per pool state',
+                                         labels=['segment', 'state'])
+        ip_utilization = GaugeMetricFamily('vmware_iaas_ip_pool_utilization_ratio', 'Assigned / total IP addresses',
+                                           labels=['segment'])
+        for segment, values in snapshot['ip_pools'].items():
+            ip_addresses.add_metric([segment, 'available'], values['available'])
+            ip_addresses.add_metric([segment, 'assigned'], values['assigned'])
+            total = values['available'] + values['assigned']
+            ip_utilization.add_metric([segment], values['assigned'] / total if total else 0)
+
+        gpu_slots = GaugeMetricFamily('vmware_iaas_gpu_slots', 'GPU slots in the inventory per state',
+                                      labels=['gpu_type', 'state'])
+        gpu_utilization = GaugeMetricFamily('vmware_iaas_gpu_utilization_ratio', 'Used / total GPU slots',
+                                            labels=['gpu_type'])
+        gpu_fragmentation = GaugeMetricFamily('vmware_iaas_gpu_fragmentation_ratio',
+                                              'Free GPU slots on partially used hosts / all free slots',
+                                              labels=['gpu_type'])
+        gpu_largest_free = GaugeMetricFamily('vmware_iaas_gpu_largest_free_block',
+                                             'Largest number of free GPUs on a single host', labels=['gpu_type'])
+        for gpu_type, values in snapshot['gpus'].items():
+            gpu_slots.add_metric([gpu_type, 'used'], values['used_slots'])
+            gpu_slots.add_metric([gpu_type, 'free'], values['free_slots'])
+            gpu_utilization.add_metric([gpu_type], values['utilization'])
+            gpu_fragmentation.add_metric([gpu_type], values['fragmentation'])
+            gpu_largest_free.add_metric([gpu_type], values['largest_free'])
+
+        host_capacity = GaugeMetricFamily('vmware_iaas_host_capacity', 'Host capacity in the inventory per state',
+                                          labels=['resource', 'state'])
+        host_utilization = GaugeMetricFamily('vmware_iaas_host_utilization_ratio', 'Allocated / total host capacity',
+                                             labels=['resource'])
+        for resource, values in snapshot['hosts'].items():
+            host_capacity.add_metric([resource, 'used'], values['used'])
+            host_capacity.add_metric([resource, 'free'], values['total'] - values['used'])
+            host_utilization.add_metric([resource], values['used'] / values['total'] if values['total'] else 0)
+
+        provisions = GaugeMetricFamily('vmware_iaas_vm_provisions', 'VM provisions per clone mode and status',
+                                       labels=['clone_mode', 'status'])
+        provision_seconds = GaugeMetricFamily('vmware_iaas_vm_provision_avg_seconds',
+                                              'Average time from create request to ready per clone mode',
+                                              labels=['clone_mode'])
+        provision_storage = GaugeMetricFamily('vmware_iaas_vm_provision_storage_gb',
+                                              'Storage consumed by provisioned VMs per clone mode',
+                                              labels=['clone_mode'])
+        for (clone_mode, status), values in snapshot['provisions'].items():
+            provisions.add_metric([clone_mode, status], values['count'])
+            if status == 'done':
+                provision_seconds.add_metric([clone_mode], values['seconds'] / values['count'])
+                provision_storage.add_metric([clone_mode], values['storage_gb'])
+
+        warm_pool = GaugeMetricFamily('vmware_iaas_warm_pool_vms', 'Unclaimed warm pool VMs',
+                                      labels=['template', 'status'])
+        for (template, status), count in snapshot['warm_pool'].items():
+            warm_pool.add_metric([template, status], count)
+
+        yield from (vms, cpu, memory, disk, gpus, ip_addresses, ip_utilization,
+                    gpu_slots, gpu_utilization, gpu_fragmentation, gpu_largest_free,
+                    host_capacity, host_utilization, provisions, provision_seconds, provision_storage, warm_pool)
+
+        yield GaugeMetricFamily('vmware_iaas_metrics_refresh_timestamp_seconds',
+                                'Unix time of the last resource aggregate refresh', value=snapshot['timestamp'])
+        yield GaugeMetricFamily('vmware_iaas_metrics_refresh_duration_seconds',
+                                'Duration of the last resource aggregate refresh', value=snapshot['duration'])
+
+
+class _BackupCollector:
+    """读取备份任务写入的指标文件（backup_manager.py 每次任务结束后原子替换）"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def collect(self):
+        try:
+            with open(self.path) as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        runs = CounterMetricFamily('vmware_iaas_backup_runs', 'Backup job runs by result', labels=['job', 'result'])
+        last_run = GaugeMetricFamily('vmware_iaas_backup_last_run_timestamp_seconds',
+                                     'Unix time of the last finished backup job run', labels=['job'])
+        last_success = GaugeMetricFamily('vmware_iaas_backup_last_success_timestamp_seconds',
+                                         'Unix time of the last successful backup job run', labels=['job'])
+        succeeded = GaugeMetricFamily('vmware_iaas_backup_last_run_success',
+                                      'Whether the last backup job run succeeded', labels=['job'])
+        duration = GaugeMetricFamily('vmware_iaas_backup_last_duration_seconds',
+                                     'Duration of the last backup job run', labels=['job'])
+        size = GaugeMetricFamily('vmware_iaas_backup_last_size_bytes',
+                                 'Bytes written by the last successful backup job run', labels=['job'])
+
+        for job, stats in metrics.get('jobs', {}).items():
+            for result, count in stats['runs'].items():
+                runs.add_metric([job, result], count)
+            if 'last_run' in stats:
+                last_run.add_metric([job], stats['last_run'])
+                succeeded.add_metric([job], 1 if stats['last_result'] == 'success' else 0)
+                duration.add_metric([job], stats['duration_seconds'])
+            if 'last_success' in stats:
+                last_success.add_metric([job], stats['last_success'])
+                if stats.get('size_bytes') is not None:
+                    size.add_metric([job], stats['size_bytes'])
+        yield from (runs, last_run, last_success, succeeded, duration, size)
+
+        store = metrics.get('store')
+        if store:
+            yield GaugeMetricFamily('vmware_iaas_backup_store_backups', 'Backups in the deduplicated store',
+                                    value=store['backups'])
+            yield GaugeMetricFamily('vmware_iaas_backup_store_bytes', 'Compressed chunk bytes in the backup store',
+                                    value=store['stored_bytes'])
+            yield GaugeMetricFamily('vmware_iaas_backup_store_logical_bytes',
+                                    'Total uncompressed size of the backups in the store',
+                                    value=store['logical_bytes'])
+
+
+class MetricsExporter:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.registry = CollectorRegistry()
+        self.snapshot = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """初始化监控模块"""
+        self.app = app
+        self.db = db
+        self.refresh_interval = app.config.get('METRICS_REFRESH_INTERVAL', 15)
+        self.snapshot_collector = _SnapshotCollector(self)
+        self.registry.register(self.snapshot_collector)
+        self.backup_collector = _BackupCollector(
+            app.config.get('BACKUP_METRICS_FILE', '/app/backups/backup_metrics.json')
+        )
+        self.registry.register(self.backup_collector)
+        self._init_request_metrics(app)
+        self._init_pool_metrics(app, db)
+        app.extensions['metrics_exporter'] = self
+
+    def _init_request_metrics(self, app):
+        """注册请求计时钩子和数据库查询计数监听器"""
+        self.request_latency = Histogram(
+            'vmware_iaas_http_request_duration_seconds', 'HTTP request latency',
+            ['endpoint', 'method', 'status'], registry=self.registry,
+            buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+        )
+        self.request_queries = Histogram(
+            'vmware_iaas_http_request_db_queries', 'Database queries per HTTP request',
+            ['endpoint'], registry=self.registry,
+            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+        )
+        self.request_db_time = Histogram(
+            'vmware_iaas_http_request_db_duration_seconds', 'Database time per HTTP request',
+            ['endpoint'], registry=self.registry,
+            buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+        )
+        self.db_queries = Counter(
+            'vmware_iaas_db_queries', 'Database queries executed', ['endpoint'], registry=self.registry
+        )
+        self.warm_pool_requests = Counter(
+            'vmware_iaas_warm_pool_requests', 'Create requests matching a warm pool shape',
+            ['shape', 'result'], registry=self.registry
+        )
+        self.rejections = Counter(
+            'vmware_iaas_rate_limit_rejections', 'Requests rejected with 429',
+            ['route_class', 'reason'], registry=self.registry
+        )
+        self.provision_latency = Histogram(
+            'vmware_iaas_vm_provision_duration_seconds', 'Time from create request to VM ready',
+            ['clone_mode', 'status'], registry=self.registry,
+            buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+        )
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def observe_provision(self, clone_mode, status, seconds):
+        """记录一次虚拟机开通（由 provisioning 在后台线程调用）"""
+        self.provision_latency.labels(clone_mode, status).observe(seconds)
+
+    def observe_rejection(self, route_class, reason):
+        """记录一次限流（rate）或并发准入（concurrency）拒绝"""
+        self.rejections.labels(route_class, reason).inc()
+
+    def observe_warm_pool(self, shape, hit):
+        """记录一次预热池领用（命中/未命中）"""
+        self.warm_pool_requests.labels(shape, 'hit' if hit else 'miss').inc()
+
+    def _init_pool_metrics(self, app, db):
+        """注册连接池事件监听，多worker时Gauge按存活进程求和"""
+        self.pool_connections = Gauge(
+            'vmware_iaas_db_pool_connections', 'Open database connections held by the pool',
+            registry=self.registry, multiprocess_mode='livesum'
+        )
+        self.pool_checked_out = Gauge(
+            'vmware_iaas_db_pool_checked_out', 'Database connections currently checked out',
+            registry=self.registry, multiprocess_mode='livesum'
+        )
+        self.pool_limit = Gauge(
+            'vmware_iaas_db_pool_limit', 'Maximum connections the pool may open (pool_size + max_overflow)',
+            registry=self.registry, multiprocess_mode='livesum'
+        )
+        self.pool_checkouts = Counter(
+            'vmware_iaas_db_pool_checkouts', 'Database connection checkouts', registry=self.registry
+        )
+        self.pool_connects = Counter(
+            'vmware_iaas_db_pool_connects', 'New database connections opened', registry=self.registry
+        )
+        self.pool_invalidations = Counter(
+            'vmware_iaas_db_pool_invalidations', 'Database connections invalidated', registry=self.registry
+        )
+
+        # NullPool（PgBouncer模式）没有上限，不设置limit
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        if 'pool_size' in options:
+            self.pool_limit.set(options['pool_size'] + options.get('max_overflow', 10))
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'close', self._on_close)
+        event.listen(engine, 'detach', self._on_close)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.pool_connects.inc()
+        self.pool_connections.inc()
+
+    def _on_close(self, dbapi_connection, connection_record):
+        self.pool_connections.dec()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.pool_checkouts.inc()
+        self.pool_checked_out.inc()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.pool_checked_out.dec()
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.pool_invalidations.inc()
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        g.db_query_count = 0
+        g.db_query_time = 0.0
+
+    def _after_request(self, response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        query_count = g.get('db_query_count', 0)
+        db_time = g.get('db_query_time', 0.0)
+
+        self.request_latency.labels(endpoint, request.method, str(response.status_code)).observe(elapsed)
+        self.request_queries.labels(endpoint).observe(query_count)
+        self.request_db_time.labels(endpoint).observe(db_time)
+        if query_count:
+            self.db_queries.labels(endpoint).inc(query_count)
+
+        # 流式响应在生成器中执行的查询不计入本次统计
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={elapsed * 1000:.1f}, db;dur={db_time * 1000:.1f};desc="{query_count} queries"'
+        )
+        return response
+
+    def refresh(self):
+        """执行聚合SQL并原子替换快照"""
+        started = time.perf_counter()
+        tables = self.db.metadata.tables
+        vm_table = tables['virtual_machines']
+        tenant_table = tables['tenants']
+        ip_table = tables['ip_pools']
+        gpu_table = tables['gpu_inventory']
+        host_table = tables['host_inventory']
+        provision_table = tables['vm_provisions']
+        pool_table = tables['warm_pool_vms']
+
+        vm_stmt = (
+            select(
+                tenant_table.c.username,
+                vm_table.c.status,
+                vm_table.c.gpu_type,
+                func.count(),
+                func.coalesce(func.sum(vm_table.c.cpu_cores), 0),
+                func.coalesce(func.sum(vm_table.c.memory_gb), 0),
+                func.coalesce(func.sum(vm_table.c.disk_gb), 0),
+                func.coalesce(func.sum(vm_table.c.gpu_count), 0),
+            )
+            .select_from(vm_table.join(tenant_table, tenant_table.c.id == vm_table.c.tenant_id))
+            .group_by(tenant_table.c.username, vm_table.c.status, vm_table.c.gpu_type)
+        )
+        ip_stmt = (
+            select(ip_table.c.network_segment, ip_table.c.is_available, func.count())
+            .group_by(ip_table.c.network_segment, ip_table.c.is_available)
+        )
+        gpu_stmt = (
+            select(gpu_table.c.host_name, gpu_table.c.gpu_type, gpu_table.c.total_slots, gpu_table.c.used_slots)
+            .where(gpu_table.c.is_active)
+        )
+        host_stmt = (
+            select(*(func.coalesce(func.sum(host_table.c[column]), 0) for column in (
+                'cpu_cores', 'cpu_used', 'memory_gb', 'memory_used', 'disk_gb', 'disk_used'
+            )))
+            .where(host_table.c.is_active)
+        )
+        provision_stmt = (
+            select(
+                provision_table.c.clone_mode,
+                provision_table.c.status,
+                func.count(),
+                func.coalesce(func.sum(provision_table.c.provision_seconds), 0),
+                func.coalesce(func.sum(provision_table.c.storage_gb), 0),
+            )
+            .group_by(provision_table.c.clone_mode, provision_table.c.status)
+        )
+        pool_stmt = (
+            select(pool_table.c.template_name, pool_table.c.status, func.count())
+            .where(pool_table.c.status.in_(('provisioning', 'ready')))
+            .group_by(pool_table.c.template_name, pool_table.c.status)
+        )
+
+        with self.app.app_context():
+            # 配置了只读副本时聚合查询走副本
+            router = self.app.extensions.get('db_router')
+            engine = router.reporting_engine() if router else self.db.engine
+            with engine.connect() as conn:
+                vm_rows = conn.execute(vm_stmt).fetchall()
+                ip_rows = conn.execute(ip_stmt).fetchall()
+                gpu_rows = conn.execute(gpu_stmt).fetchall()
+                host_row = conn.execute(host_stmt).one()
+                provision_rows = conn.execute(provision_stmt).fetchall()
+                pool_rows = conn.execute(pool_stmt).fetchall()
+
+        totals = {'vms': 0, 'running': 0, 'stopped': 0, 'cpu': 0, 'memory': 0, 'disk': 0}
+        vms = {}
+        resources = {}
+        for tenant, status, gpu_type, count, cpu, memory, disk, gpu_count in vm_rows:
+            status = status or 'unknown'
+            vms[(tenant, status, gpu_type or 'none')] = {'count': count, 'gpus': int(gpu_count)}
+            bucket = resources.setdefault((tenant, status), {'cpu': 0, 'memory': 0, 'disk': 0})
+            bucket['cpu'] += int(cpu)
+            bucket['memory'] += int(memory)
+            bucket['disk'] += int(disk)
+
+            totals['vms'] += count
+            totals['cpu'] += int(cpu)
+            totals['memory'] += int(memory)
+            totals['disk'] += int(disk)
+            if status in ('running', 'stopped'):
+                totals[status] += count
+
+        ip_pools = {}
+        for segment, is_available, count in ip_rows:
+            bucket = ip_pools.setdefault(segment, {'available': 0, 'assigned': 0})
+            bucket['available' if is_available else 'assigned'] += count
+
+        self.snapshot = {
+            'totals': totals,
+            'vms': vms,
+            'resources': resources,
+            'ip_pools': ip_pools,
+            'gpus': GpuCapacityIndex.from_rows(gpu_rows).stats(),
+            'hosts': {
+                resource: {'total': int(host_row[i * 2]), 'used': int(host_row[i * 2 + 1])}
+                for i, resource in enumerate(('cpu_cores', 'memory_gb', 'disk_gb'))
+            },
+            'provisions': {
+                (clone_mode, status): {'count': count, 'seconds': float(seconds), 'storage_gb': float(storage_gb)}
+                for clone_mode, status, count, seconds, storage_gb in provision_rows
+            },
+            'warm_pool': {(template, status): count for template, status, count in pool_rows},
+            'timestamp': time.time(),
+            'duration': time.perf_counter() - started,
+        }
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Metrics refresh error: {str(e)}")
+
+    def _warm(self):
+        if self.snapshot is None:
+            self.refresh()
+
+    def _ensure_started(self):
+        """首次采集后启动刷新线程"""
+        start_per_process(self._refresh_loop, 'metrics-refresh', setup=self._warm)
+
+    def render(self):
+        """生成Prometheus文本格式的指标"""
+        self._ensure_started()
+        registry = self.registry
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            # 多worker部署：请求指标从各进程写入的文件汇总，资源快照取当前进程
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self.snapshot_collector)
+            registry.register(self.backup_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        started = conn.info['query_started'].pop()
+        g.db_query_count = g.get('db_query_count', 0) + 1
+        g.db_query_time = g.get('db_query_time', 0.0) + (time.perf_counter() - started)
+
+
+# 全局实例
+metrics_exporter = MetricsExporter()
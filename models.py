@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 数据库层
+SQLAlchemy实例、数据模型与建库初始化；命令行工具通过 create_db_app() 使用，
+无需加载路由、认证和监控等Web扩展
+"""
+
+import hashlib
+import logging
+import ipaddress
+from datetime import datetime
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import NullPool
+
+import quotas
+import gpu_placement
+import host_placement
+import template_catalog
+from hypervisor import get_driver
+import billing_partitions
+from config import Config
+from db_routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def init_db(app):
+    """将数据库扩展绑定到应用"""
+    if app.config.get('DB_PGBOUNCER'):
+        # PgBouncer事务池模式：连接复用交给PgBouncer，应用侧不保留连接
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool}
+    db.init_app(app)
+
+
+def create_db_app(config_class=Config):
+    """仅含配置和数据库的最小应用，供命令行工具使用"""
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    init_db(app)
+    return app
+
+# 数据库模型
+class Tenant(db.Model):
+    __tablename__ = 'tenants'
+    id = db.Column(db.Integer, primary_key=True)
+    ldap_uid = db.Column(db.String(100), unique=True, nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    display_name = db.Column(db.String(200))
+    email = db.Column(db.String(200))
+    department = db.Column(db.String(100))
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Project(db.Model):
+    __tablename__ = 'projects'
+    id = db.Column(db.Integer, primary_key=True)
+    project_name = db.Column(db.String(200), nullable=False)
+    project_code = db.Column(db.String(100), nullable=False, unique=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    description = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 关系
+    tenant = db.relationship('Tenant', backref='projects')
+
+class VirtualMachine(db.Model):
+    __tablename__ = 'virtual_machines'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    project_name = db.Column(db.String(200), nullable=False)
+    project_code = db.Column(db.String(100), nullable=False)
+    owner = db.Column(db.String(200), nullable=False)
+    deadline = db.Column(db.DateTime, nullable=False)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    
+    # 网络配置
+    ip_address = db.Column(db.String(15))
+    host_name = db.Column(db.String(100))
+    
+    # 资源配置
+    cpu_cores = db.Column(db.Integer, nullable=False)
+    memory_gb = db.Column(db.Integer, nullable=False)
+    disk_gb = db.Column(db.Integer, nullable=False)
+    gpu_type = db.Column(db.String(20))  # t4, 3090
+    gpu_count = db.Column(db.Integer, default=0)
+    
+    # VM状态
+    status = db.Column(db.String(20), default='creating')  # creating, running, stopped, expired, deleted, error
+    template_name = db.Column(db.String(100))
+    vcenter_vm_id = db.Column(db.String(100))  # vCenter中的VM ID
+    
+    # 时间戳
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 关系
+    project = db.relationship('Project', backref='virtual_machines')
+    tenant = db.relationship('Tenant', backref='virtual_machines')
+    
+    @property
+    def days_until_expiry(self):
+        """计算距离过期的天数"""
+        if self.deadline:
+            delta = self.deadline - datetime.utcnow()
+            return max(0, delta.days)
+        return 0
+
+class IPPool(db.Model):
+    __tablename__ = 'ip_pools'
+    id = db.Column(db.Integer, primary_key=True)
+    network_segment = db.Column(db.String(20), nullable=False)
+    ip_address = db.Column(db.String(15), nullable=False, unique=True)
+    is_available = db.Column(db.Boolean, default=True)
+    assigned_vm_id = db.Column(db.Integer, db.ForeignKey('virtual_machines.id'))
+    assigned_at = db.Column(db.DateTime)
+    
+    # 关系
+    virtual_machine = db.relationship('VirtualMachine', backref='assigned_ip')
+
+class BillingRecord(db.Model):
+    __tablename__ = 'billing_records'
+    id = db.Column(db.Integer, primary_key=True)
+    vm_id = db.Column(db.Integer, db.ForeignKey('virtual_machines.id'), nullable=False)
+    vm_name = db.Column(db.String(100), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    owner = db.Column(db.String(200), nullable=False)
+    
+    # 计费日期
+    billing_date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
+    
+    # 资源使用量
+    cpu_cores = db.Column(db.Integer, nullable=False)
+    memory_gb = db.Column(db.Integer, nullable=False)
+    disk_gb = db.Column(db.Integer, nullable=False)
+    gpu_type = db.Column(db.String(20))
+    gpu_count = db.Column(db.Integer, default=0)
+    
+    # 计费金额
+    cpu_cost = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    memory_cost = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    disk_cost = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    gpu_cost = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    total_cost = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    
+    # 时间戳
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 支撑 /api/billing/details 的 (billing_date, id) keyset分页
+        db.Index('ix_billing_records_tenant_date_id', 'tenant_id', 'billing_date', 'id'),
+    )
+    
+    # 关系
+    virtual_machine = db.relationship('VirtualMachine', backref='billing_records')
+    project = db.relationship('Project', backref='billing_records')
+    tenant = db.relationship('Tenant', backref='billing_records')
+
+class UserSession(db.Model):
+    __tablename__ = 'user_sessions'
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False)
+    session_token = db.Column(db.String(255), nullable=False, unique=True)
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    
+    # 关系
+    tenant = db.relationship('Tenant', backref='sessions')
+    
+    @staticmethod
+    def token_digest(token):
+        """会话表保存令牌摘要：含中文显示名的JWT会超过列长度"""
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+class ResourceQuota(db.Model):
+    """租户/项目的资源限额与已用量计数（limit为空表示不限），由 quotas 模块在虚拟机创建/删除的事务内维护"""
+    __tablename__ = 'resource_quotas'
+    scope = db.Column(db.String(10), primary_key=True)  # tenant, project
+    scope_id = db.Column(db.Integer, primary_key=True)
+    
+    vms_limit = db.Column(db.Integer)
+    cpu_cores_limit = db.Column(db.Integer)
+    memory_gb_limit = db.Column(db.Integer)
+    disk_gb_limit = db.Column(db.Integer)
+    gpu_count_limit = db.Column(db.Integer)
+    
+    vms_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    cpu_cores_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    memory_gb_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    disk_gb_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    gpu_count_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class GpuInventory(db.Model):
+    """每台主机每种GPU的卡槽数与已用数，由 gpu_placement 在虚拟机创建/删除的事务内维护"""
+    __tablename__ = 'gpu_inventory'
+    host_name = db.Column(db.String(100), primary_key=True)
+    gpu_type = db.Column(db.String(20), primary_key=True)  # t4, 3090
+    total_slots = db.Column(db.Integer, nullable=False)
+    used_slots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 停用的主机不再放置新虚拟机，已有虚拟机删除时照常释放
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='true')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class HostInventory(db.Model):
+    """ESXi主机的可分配容量与已分配量，由 host_placement 在虚拟机创建/删除的事务内维护"""
+    __tablename__ = 'host_inventory'
+    host_name = db.Column(db.String(100), primary_key=True)
+    cpu_cores = db.Column(db.Integer, nullable=False)
+    memory_gb = db.Column(db.Integer, nullable=False)
+    disk_gb = db.Column(db.Integer, nullable=False)
+    cpu_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    memory_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    disk_used = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 停用的主机（维护模式）不再放置新虚拟机，已有虚拟机删除时照常释放
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='true')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VmTemplate(db.Model):
+    """从虚拟化平台发现的模板，规格为创建虚拟机的最低要求，由 template_catalog 同步"""
+    __tablename__ = 'vm_templates'
+    name = db.Column(db.String(100), primary_key=True)
+    display_name = db.Column(db.String(200))
+    os_type = db.Column(db.String(20))  # Linux, Windows
+    guest_os = db.Column(db.String(100))
+    min_cpu_cores = db.Column(db.Integer)
+    min_memory_gb = db.Column(db.Integer)
+    disk_gb = db.Column(db.Integer)
+    # 最近一次发现时未出现的模板停用（已有虚拟机仍引用模板名）
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='true')
+    discovered_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VmProvision(db.Model):
+    """虚拟机的克隆任务与开通耗时/存储记录，由 provisioning 在后台执行克隆后更新"""
+    __tablename__ = 'vm_provisions'
+    vm_id = db.Column(db.Integer, db.ForeignKey('virtual_machines.id'), primary_key=True)
+    clone_mode = db.Column(db.String(20), nullable=False)  # full, linked, instant, warm（领用预热池）
+    template_name = db.Column(db.String(100))
+    base_snapshot = db.Column(db.String(200))  # 链接/即时克隆所用的基础快照
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, cloning, done, error
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # clone_seconds为驱动克隆耗时（含首次创建基础快照），provision_seconds为从创建请求到可用的总耗时（含排队）
+    clone_seconds = db.Column(db.Float)
+    provision_seconds = db.Column(db.Float)
+    storage_gb = db.Column(db.Float)
+
+    virtual_machine = db.relationship('VirtualMachine', backref=db.backref('provision', uselist=False))
+
+class WarmPoolVm(db.Model):
+    """预热池中已开通、已分配IP并关机的虚拟机，由 warm_pool 补充，创建虚拟机时按规格领用"""
+    __tablename__ = 'warm_pool_vms'
+    __table_args__ = (
+        db.Index('ix_warm_pool_vms_shape', 'template_name', 'cpu_cores', 'memory_gb', 'disk_gb', 'status'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    template_name = db.Column(db.String(100), nullable=False)
+    cpu_cores = db.Column(db.Integer, nullable=False)
+    memory_gb = db.Column(db.Integer, nullable=False)
+    disk_gb = db.Column(db.Integer, nullable=False)
+    clone_mode = db.Column(db.String(20), nullable=False)
+    # provisioning, ready, claimed, error；provisioning/ready 的虚拟机占用主机容量与IP
+    status = db.Column(db.String(20), nullable=False, default='provisioning')
+    error = db.Column(db.Text)
+
+    host_name = db.Column(db.String(100))
+    ip_address = db.Column(db.String(15))
+    vcenter_vm_id = db.Column(db.String(100))
+    storage_gb = db.Column(db.Float)
+    provision_seconds = db.Column(db.Float)
+    vm_id = db.Column(db.Integer, db.ForeignKey('virtual_machines.id'))  # 领用后的虚拟机
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime)
+    claimed_at = db.Column(db.DateTime)
+
+
+def init_database(app):
+    """初始化数据库：建表、补建索引、初始化IP池"""
+    with app.app_context():
+        try:
+            # 创建表（PostgreSQL上计费表为按月分区表，并提前创建分区）
+            billing_partitions.create_tables(db)
+            logger.info("Database tables created successfully")
+            
+            # create_all不会为已存在的表补建索引
+            for index in BillingRecord.__table__.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+            
+            # 配额计数与虚拟机表对齐（升级前已有的虚拟机、直接写库的数据）；
+            # 重算语句使用PostgreSQL语法（锁表、UPDATE ... FROM 别名），SQLite（基准测试）上跳过；
+            # 创建/删除虚拟机时的占用与释放语句两种数据库都可用
+            if db.engine.dialect.name == 'postgresql':
+                quotas.rebuild_usage(db.session)
+                logger.info("Quota usage counters rebuilt")
+                gpu_placement.rebuild_usage(db.session)
+                host_placement.rebuild_usage(db.session)
+            
+            # 模板目录（虚拟化平台不可用时保留已有目录，由应用后台重试）
+            try:
+                found, _ = template_catalog.sync_templates(db.session, get_driver(app.config))
+                logger.info(f"Template catalog synced: {found} templates")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Template discovery skipped: {str(e)}")
+            
+            # 初始化IP池
+            for segment in app.config['NETWORK_SEGMENTS']:
+                try:
+                    network = ipaddress.IPv4Network(segment)
+                    existing_count = IPPool.query.filter_by(network_segment=segment).count()
+                    
+                    if existing_count == 0:
+                        excluded_ips = {
+                            str(network.network_address),  # 网络地址
+                            str(network.broadcast_address),  # 广播地址
+                            str(network.network_address + 1),  # 通常是网关
+                        }
+                        
+                        added_count = 0
+                        for ip in network.hosts():
+                            ip_str = str(ip)
+                            if ip_str not in excluded_ips:
+                                ip_pool = IPPool(
+                                    network_segment=segment,
+                                    ip_address=ip_str,
+                                    is_available=True
+                                )
+                                db.session.add(ip_pool)
+                                added_count += 1
+                        
+                        db.session.commit()
+                        logger.info(f"Initialized IP pool for {segment}: {added_count} IPs")
+                    else:
+                        logger.info(f"IP pool for {segment} already exists: {existing_count} IPs")
+                        
+                except Exception as e:
+                    logger.error(f"Error initializing IP pool for {segment}: {str(e)}")
+                    continue
+            
+            logger.info("Database initialization completed")
+            
+        except Exception as e:
+            logger.error(f"Database initialization failed: {str(e)}")
+            raise
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 放置调度公共流程
+主机与GPU调度共用 预占 -> 占用 -> 刷新 -> 重试：在进程内容量索引中选出并预占（持锁，不访问数据库，
+并发请求不会选中同一份剩余容量），再用条件UPDATE在数据库中占用；其他worker已抢先占用时刷新该主机
+并换下一台，索引中无可用主机时按数据库重载一次。数据库计数始终是准的，索引只用于挑选。
+索引的变化随事务生效：占用在事务未提交（回滚或关闭）时撤销，释放在提交后才计入，
+避免回滚后索引中残留无人使用的已分配量（直到下次重载才消失）。
+
+子类提供索引类型与SQL；demand 为一次请求的规格（各模块的命名元组），索引方法均在持锁时调用
+"""
+
+import time
+import threading
+from datetime import datetime
+
+from sqlalchemy import text, event
+from sqlalchemy.orm import Session
+
+# session.info 中本事务的索引变化：(调度器, 'claim' 或 'release', 主机, demand)
+PENDING_KEY = 'placement_pending'
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for scheduler, action, host, demand in session.info.pop(PENDING_KEY, ()):
+        if action == 'release':
+            scheduler._unallocate_locked(host, demand)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    # 提交时已在 after_commit 中取走；仍有记录说明事务被回滚或关闭，撤销索引中的预占
+    if transaction.parent is not None:
+        return
+    for scheduler, action, host, demand in session.info.pop(PENDING_KEY, ()):
+        if action == 'claim':
+            scheduler._unallocate_locked(host, demand)
+
+
+class PlacementScheduler:
+    """按进程维护容量索引，占用以数据库条件更新为准"""
+
+    # 子类设置：app.extensions 中的名称与占用/释放语句
+    extension_name = None
+    allocate_sql = None
+    release_sql = None
+
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.index = None
+        self.loaded_at = 0.0
+        self.refresh_interval = 30
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.lock_timeout = app.config.get('PLACEMENT_LOCK_TIMEOUT_MS', 5000)
+        app.extensions[self.extension_name] = self
+
+    # 子类实现：查询数据库（不持锁）
+
+    def _load_index(self, session):
+        raise NotImplementedError
+
+    def _fetch_host(self, session, host, demand):
+        raise NotImplementedError
+
+    # 子类实现：读写索引（持锁）
+
+    def _apply_host(self, host, demand, row):
+        raise NotImplementedError
+
+    def _choose(self, demand, skip):
+        raise NotImplementedError
+
+    def _fits(self, host, demand):
+        raise NotImplementedError
+
+    def _allocate(self, host, demand):
+        raise NotImplementedError
+
+    def _unallocate(self, host, demand):
+        raise NotImplementedError
+
+    def _params(self, host, demand):
+        raise NotImplementedError
+
+    def reload(self, session):
+        # 查询不持有进程锁：锁内不做数据库往返，避免与等待行锁的事务互相等待
+        index = self._load_index(session)
+        with self._lock:
+            self.index = index
+            self.loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, session):
+        # 其他worker的占用与释放通过定期重载同步
+        if self.index is None or time.monotonic() - self.loaded_at > self.refresh_interval:
+            self.reload(session)
+
+    def _refresh_host(self, session, host, demand):
+        row = self._fetch_host(session, host, demand)
+        with self._lock:
+            self._apply_host(host, demand, row)
+
+    def _reserve(self, demand, skip, host=None):
+        """在索引中选出（host给定时只看该主机）并预占，没有放得下的主机时返回None"""
+        with self._lock:
+            if host is None:
+                host = self._choose(demand, skip)
+            elif host in skip or not self._fits(host, demand):
+                return None
+            if host is not None:
+                self._allocate(host, demand)
+            return host
+
+    def _claim(self, session, host, demand):
+        """在数据库中占用索引已预占的容量，失败（含锁等待超时）时撤销预占"""
+        claimed = 0
+        try:
+            if self.lock_timeout and self.db.engine.dialect.name == 'postgresql':
+                # 兜底：行锁等待超时报错而不是无限等待
+                session.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout)}"))
+            params = dict(self._params(host, demand), now=datetime.utcnow())
+            claimed = session.execute(self.allocate_sql, params).rowcount
+        finally:
+            if not claimed:
+                self._unallocate_locked(host, demand)
+        if claimed:
+            self._track(session, 'claim', host, demand)
+        return claimed
+
+    def _place(self, session, demand, host=None, skip=()):
+        """在当前事务内占用并返回主机，没有放得下的主机时返回None"""
+        for attempt in range(2):
+            tried = set(skip)
+            candidate = self._reserve(demand, tried, host)
+            while candidate is not None:
+                if self._claim(session, candidate, demand):
+                    return candidate
+                # 索引落后于数据库（其他worker已占用），刷新该主机后换下一台
+                self._refresh_host(session, candidate, demand)
+                tried.add(candidate)
+                candidate = self._reserve(demand, tried, host)
+            if attempt == 0:
+                # 按数据库重载一次，其他worker可能已释放容量
+                self.reload(session)
+        return None
+
+    def _track(self, session, action, host, demand):
+        session.info.setdefault(PENDING_KEY, []).append((self, action, host, demand))
+
+    def _unallocate_locked(self, host, demand):
+        # 索引可能已被重载替换：多释放的部分在下次占用失败时由刷新纠正，少释放会拒绝本可放下的请求
+        with self._lock:
+            if self.index is not None:
+                self._unallocate(host, demand)
+
+    def _release(self, session, host, demand):
+        """在当前事务内释放，提交后才从索引中扣减"""
+        session.execute(self.release_sql, dict(self._params(host, demand), now=datetime.utcnow()))
+        self._track(session, 'release', host, demand)
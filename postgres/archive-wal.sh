@@ -0,0 +1,15 @@
+#!/bin/sh
+# WAL归档（archive_command）：archive-wal.sh %p %f [归档目录]
+# 压缩后写临时文件再改名，避免恢复时读到不完整的段；同名段已存在时视为已归档
+set -e
+
+src="$1"
+name="$2"
+dir="${3:-/app/backups/wal}"
+
+mkdir -p "$dir"
+[ -f "$dir/$name.gz" ] && exit 0
+
+umask 022
+gzip -c "$src" > "$dir/$name.gz.tmp"
+mv "$dir/$name.gz.tmp" "$dir/$name.gz"
@@ -0,0 +1,18 @@
+#!/bin/bash
+# 只读副本启动：数据目录为空时从主库做一次基础备份（-R 生成standby配置），之后以热备模式启动
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    echo "Waiting for primary ${PRIMARY_HOST}:${PRIMARY_PORT}..."
+    until pg_isready -h "$PRIMARY_HOST" -p "$PRIMARY_PORT" -q; do
+        sleep 2
+    done
+
+    mkdir -p "$PGDATA"
+    chown postgres:postgres "$PGDATA"
+    chmod 700 "$PGDATA"
+    su-exec postgres env PGPASSWORD="$REPLICATION_PASSWORD" \
+        pg_basebackup -h "$PRIMARY_HOST" -p "$PRIMARY_PORT" -U replicator -D "$PGDATA" -R -X stream -P
+fi
+
+exec docker-entrypoint.sh postgres -c hot_standby=on
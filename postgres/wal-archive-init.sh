@@ -0,0 +1,5 @@
+#!/bin/bash
+# WAL归档初始化：允许应用账号建立复制连接执行 pg_basebackup（仅在数据目录首次初始化时执行）
+set -e
+
+echo "host replication ${POSTGRES_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 虚拟机开通
+创建虚拟机的请求只写入虚拟机与 vm_provisions 记录并提交，克隆由每个worker的线程池在后台执行:
+  pending -> cloning（条件更新认领，多个worker/重复提交只有一个执行）-> done / error
+完成后记录克隆方式、基础快照、克隆耗时、总开通耗时与存储占用，按克隆方式统计对比。
+后台线程定期重新提交长时间未被认领的记录（提交后worker退出等情况），
+克隆超时（执行中worker退出）的记录标记为失败而不重试，避免在虚拟化平台重复创建
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text, bindparam, DateTime
+
+from background import start_per_process
+from hypervisor import get_driver, CLONE_MODES
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'vm_provisions'
+
+# 认领与读取分两条语句：SQLite（基准测试）不支持 UPDATE ... FROM 别名及RETURNING其他表的列
+CLAIM_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = 'cloning', started_at = :now
+WHERE vm_id = :vm_id AND status = 'pending'
+""")
+
+CLAIMED_SQL = text(f"""
+SELECT p.clone_mode, p.template_name, p.created_at,
+       v.name, v.host_name, v.cpu_cores, v.memory_gb, v.disk_gb, v.vcenter_vm_id
+FROM {TABLE_NAME} p JOIN virtual_machines v ON v.id = p.vm_id
+WHERE p.vm_id = :vm_id
+""").columns(created_at=DateTime)
+
+FINISH_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = :status, error = :error,
+    base_snapshot = coalesce(:base_snapshot, base_snapshot), finished_at = :now, clone_seconds = :clone_seconds, provision_seconds = :provision_seconds,
+    storage_gb = coalesce(:storage_gb, storage_gb)
+WHERE vm_id = :vm_id
+""")
+
+# 克隆期间虚拟机已被删除时保持deleted，仍记录vCenter中的VM ID以便清理
+VM_READY_SQL = text("""
+UPDATE virtual_machines SET vcenter_vm_id = :vcenter_vm_id, updated_at = :now,
+    status = CASE WHEN status = 'creating' THEN :status ELSE status END
+WHERE id = :vm_id
+""")
+
+STALE_SQL = text(f"""
+SELECT vm_id FROM {TABLE_NAME} WHERE status = 'pending' AND created_at < :before ORDER BY created_at LIMIT 100
+""")
+
+TIMEOUT_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = 'error', error = 'provision timed out', finished_at = :now
+WHERE status = 'cloning' AND started_at < :before
+RETURNING vm_id
+""")
+
+TIMEOUT_VMS_SQL = text("""
+UPDATE virtual_machines SET status = 'error', updated_at = :now
+WHERE id IN :vm_ids AND status = 'creating'
+""").bindparams(bindparam('vm_ids', expanding=True))
+
+STATS_SQL = text(f"""
+SELECT clone_mode,
+       count(*) AS total,
+       count(*) FILTER (WHERE status = 'done') AS done,
+       count(*) FILTER (WHERE status = 'error') AS failed,
+       count(*) FILTER (WHERE status IN ('pending', 'cloning')) AS in_progress,
+       avg(clone_seconds) AS clone_avg,
+       avg(provision_seconds) AS provision_avg,
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY provision_seconds) AS provision_p50,
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY provision_seconds) AS provision_p95,
+       avg(storage_gb) AS storage_avg,
+       coalesce(sum(storage_gb), 0) AS storage_total
+FROM {TABLE_NAME}
+WHERE created_at >= :since
+GROUP BY clone_mode
+ORDER BY clone_mode
+""")
+
+
+def provision_stats(session, since):
+    """按克隆方式汇总since之后的开通记录（耗时单位秒，存储单位GB）"""
+    stats = {}
+    for row in session.execute(STATS_SQL, {'since': since}):
+        values = dict(row._mapping)
+        mode = values.pop('clone_mode')
+        stats[mode] = {
+            key: round(float(value), 3) if value is not None and not isinstance(value, int) else value
+            for key, value in values.items()
+        }
+    return stats
+
+
+class Provisioner:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self._driver = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.default_mode = app.config.get('DEFAULT_CLONE_MODE', 'full')
+        if self.default_mode not in CLONE_MODES:
+            raise ValueError(f"DEFAULT_CLONE_MODE must be one of {CLONE_MODES}")
+        self.workers = app.config.get('PROVISION_WORKERS', 4)
+        self.retry_interval = app.config.get('PROVISION_RETRY_INTERVAL', 60)
+        self.timeout = app.config.get('PROVISION_TIMEOUT', 3600)
+        app.extensions['provisioner'] = self
+
+    @property
+    def driver(self):
+        # 驱动在进程内共享，基础快照只需创建一次
+        if self._driver is None:
+            self._driver = get_driver(self.app.config)
+        return self._driver
+
+    def _create_executor(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='provision')
+
+    def _ensure_started(self):
+        """创建线程池并启动重试线程"""
+        start_per_process(self._retry_loop, 'provision-retry', setup=self._create_executor)
+
+    def submit(self, vm_id):
+        """提交后台克隆（须在虚拟机与开通记录提交之后调用）"""
+        self._ensure_started()
+        return self._executor.submit(self._run, vm_id)
+
+    def _run(self, vm_id):
+        try:
+            return self.provision(vm_id)
+        except Exception as e:
+            logger.error(f"Provision VM {vm_id} error: {str(e)}")
+            return False
+
+    def provision(self, vm_id):
+        """认领并执行一条开通记录，返回是否由本次调用执行"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                claimed = session.execute(CLAIM_SQL, {'vm_id': vm_id, 'now': datetime.utcnow()}).rowcount
+                row = session.execute(CLAIMED_SQL, {'vm_id': vm_id}).first() if claimed else None
+                session.commit()
+                if row is None:
+                    return False
+
+                result, error = None, None
+                started = time.monotonic()
+                try:
+                    if row.clone_mode == 'warm':
+                        # 领用的预热虚拟机已克隆，只需改名并开机
+                        result = self.driver.assign(row.vcenter_vm_id, row.name)
+                    else:
+                        result = self.driver.clone(row.template_name, row.name, row.clone_mode, row.cpu_cores,
+                                                   row.memory_gb, row.disk_gb, host_name=row.host_name)
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"Provision VM {vm_id} ({row.clone_mode} clone) error: {error}")
+                clone_seconds = time.monotonic() - started
+
+                now = datetime.utcnow()
+                provision_seconds = (now - row.created_at).total_seconds()
+                session.execute(FINISH_SQL, {
+                    'vm_id': vm_id,
+                    'status': 'error' if error else 'done',
+                    'error': error,
+                    'base_snapshot': result and result.get('base_snapshot'),
+                    'clone_seconds': clone_seconds,
+                    'provision_seconds': provision_seconds,
+                    'storage_gb': result and result.get('storage_gb'),
+                    'now': now,
+                })
+                session.execute(VM_READY_SQL, {
+                    'vm_id': vm_id,
+                    'status': 'error' if error else 'running',
+                    'vcenter_vm_id': result and result['vm_id'],
+                    'now': now,
+                })
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.remove()
+
+        exporter = self.app.extensions.get('metrics_exporter')
+        if exporter is not None:
+            exporter.observe_provision(row.clone_mode, 'error' if error else 'done', provision_seconds)
+        if not error:
+            logger.info(f"VM {vm_id} provisioned by {row.clone_mode} clone in {provision_seconds:.1f}s")
+        return True
+
+    def _retry_loop(self):
+        while True:
+            time.sleep(self.retry_interval)
+            try:
+                now = datetime.utcnow()
+                with self.app.app_context():
+                    with self.db.engine.begin() as conn:
+                        expired = conn.execute(
+                            TIMEOUT_SQL, {'now': now, 'before': now - timedelta(seconds=self.timeout)}
+                        ).scalars().all()
+                        if expired:
+                            conn.execute(TIMEOUT_VMS_SQL, {'now': now, 'vm_ids': expired})
+                        vm_ids = conn.execute(
+                            STALE_SQL, {'before': now - timedelta(seconds=self.retry_interval)}
+                        ).scalars().all()
+                for vm_id in vm_ids:
+                    self._executor.submit(self._run, vm_id)
+            except Exception as e:
+                logger.error(f"Provision retry error: {str(e)}")
+
+
+# 全局实例
+provisioner = Provisioner()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS provisioning')
+    parser.add_argument('--stats', action='store_true', help='Compare provisioning time and storage per clone mode')
+    parser.add_argument('--hours', type=int, default=24, help='Time window for --stats')
+    args = parser.parse_args()
+
+    from models import create_db_app, db
+
+    app = create_db_app()
+    with app.app_context():
+        if args.stats:
+            stats = provision_stats(db.session, datetime.utcnow() - timedelta(hours=args.hours))
+            print(f"{'Mode':<8} {'Done':>6} {'Error':>6} {'Avg s':>8} {'P50 s':>8} {'P95 s':>8} "
+                  f"{'Avg GB':>8} {'Total GB':>9}")
+            for mode, values in stats.items():
+                print(f"{mode:<8} {values['done']:>6} {values['failed']:>6} {values['provision_avg'] or 0:>8.1f} "
+                      f"{values['provision_p50'] or 0:>8.1f} {values['provision_p95'] or 0:>8.1f} "
+                      f"{values['storage_avg'] or 0:>8.2f} {values['storage_total']:>9.1f}")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
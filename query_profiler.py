@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+慢查询与N+1检测模块
+按采样率对请求内的SQL语句做指纹归并，同一指纹重复过多或单条语句过慢时
+输出一条JSON结构化日志（含路由、指纹、次数、耗时及抽样的EXPLAIN）
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """将SQL归一化为指纹：去掉字面量与参数占位符差异，合并IN列表"""
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _IN_LIST.sub('IN (?)', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+    return digest, normalized
+
+
+def _truncate(statement, limit=600):
+    """保留语句首尾（WHERE条件通常在末尾）"""
+    if len(statement) <= limit:
+        return statement
+    half = limit // 2
+    return f"{statement[:half]} ... {statement[-half:]}"
+
+
+class QueryProfiler:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.enabled = False
+        self._explained = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """初始化查询分析模块，未启用时不注册任何钩子"""
+        self.app = app
+        self.db = db
+        self.enabled = app.config.get('QUERY_PROFILER_ENABLED', False)
+        self.sample_rate = app.config.get('QUERY_PROFILER_SAMPLE_RATE', 0.05)
+        self.repeat_threshold = app.config.get('QUERY_PROFILER_REPEAT_THRESHOLD', 10)
+        self.slow_query_ms = app.config.get('QUERY_PROFILER_SLOW_QUERY_MS', 200)
+        self.explain_interval = app.config.get('QUERY_PROFILER_EXPLAIN_INTERVAL', 300)
+
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not event.contains(Engine, 'after_cursor_execute', self._after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        logger.info(
+            f"Query profiler enabled: sample_rate={self.sample_rate} "
+            f"repeat_threshold={self.repeat_threshold} slow_query_ms={self.slow_query_ms}"
+        )
+
+    def _before_request(self):
+        g.query_profile = {} if random.random() < self.sample_rate else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and g.get('query_profile') is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        profile = g.get('query_profile')
+        if profile is None or not conn.info.get('profile_started'):
+            return
+
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        digest, normalized = fingerprint(statement)
+        entry = profile.get(digest)
+        if entry is None:
+            entry = profile[digest] = {
+                'fingerprint': digest,
+                'statement': normalized,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'sample': (statement, parameters),
+            }
+        elapsed_ms = elapsed * 1000
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        if elapsed_ms > entry['max_ms']:
+            entry['max_ms'] = elapsed_ms
+            entry['sample'] = (statement, parameters)
+
+    def _after_request(self, response):
+        profile = g.get('query_profile')
+        if not profile:
+            return response
+
+        flagged = []
+        for entry in profile.values():
+            reasons = []
+            if entry['count'] > self.repeat_threshold:
+                reasons.append('n_plus_one')
+            if entry['max_ms'] >= self.slow_query_ms:
+                reasons.append('slow_query')
+            if reasons:
+                flagged.append((reasons, entry))
+
+        if not flagged:
+            return response
+
+        flagged.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+        worst = flagged[0][1]
+        record = {
+            'event': 'query_profile',
+            'route': request.url_rule.rule if request.url_rule else request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'query_count': sum(entry['count'] for entry in profile.values()),
+            'db_time_ms': round(sum(entry['total_ms'] for entry in profile.values()), 2),
+            'offenders': [
+                {
+                    'reasons': reasons,
+                    'fingerprint': entry['fingerprint'],
+                    'statement': _truncate(entry['statement']),
+                    'count': entry['count'],
+                    'total_ms': round(entry['total_ms'], 2),
+                    'max_ms': round(entry['max_ms'], 2),
+                }
+                for reasons, entry in flagged
+            ],
+            'explain': self._sample_explain(worst),
+        }
+        logger.warning(json.dumps(record, ensure_ascii=False, default=str))
+        return response
+
+    def _sample_explain(self, entry):
+        """对最严重的指纹抽样执行EXPLAIN，同一指纹在间隔内只执行一次"""
+        statement, parameters = entry['sample']
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return None
+        if self.db.engine.dialect.name != 'postgresql':
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(entry['fingerprint'])
+            if last is not None and now - last < self.explain_interval:
+                return None
+            self._explained[entry['fingerprint']] = now
+
+        try:
+            # 独立连接且不带ANALYZE，不会实际执行语句
+            with self.db.engine.connect() as conn:
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+            return plan[0]['Plan'] if isinstance(plan, list) else plan
+        except Exception as e:
+            logger.debug(f"EXPLAIN failed for {entry['fingerprint']}: {str(e)}")
+            return None
+
+
+# 全局实例
+query_profiler = QueryProfiler()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 资源配额
+租户和项目各有一行配额记录（resource_quotas），同一行保存限额与已用量计数（已删除的虚拟机不计入）。
+创建/删除虚拟机时在同一事务内用条件UPDATE增减计数：检查只需按主键更新一行，
+并发创建时后到的事务等待行锁并基于提交后的计数重新判断，不会超额
+"""
+
+import sys
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text, bindparam
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'resource_quotas'
+
+RESOURCES = ('vms', 'cpu_cores', 'memory_gb', 'disk_gb', 'gpu_count')
+
+# 固定加锁顺序（先租户后项目），并发事务不会互相等待形成死锁
+SCOPES = ('tenant', 'project')
+
+RESERVE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET
+    {', '.join(f'{r}_used = {r}_used + :{r}' for r in RESOURCES)},
+    updated_at = :now
+WHERE scope = :scope AND scope_id = :scope_id
+  AND {' AND '.join(f'({r}_limit IS NULL OR {r}_used + :{r} <= {r}_limit)' for r in RESOURCES)}
+""")
+
+# CASE而非GREATEST：SQLite（基准测试）上同样可用
+RELEASE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET
+    {', '.join(f'{r}_used = CASE WHEN {r}_used > :{r} THEN {r}_used - :{r} ELSE 0 END' for r in RESOURCES)},
+    updated_at = :now
+WHERE scope = :scope AND scope_id = :scope_id
+""")
+
+INSERT_SQL = text(f"""
+INSERT INTO {TABLE_NAME} (scope, scope_id, {', '.join(f'{r}_limit, {r}_used' for r in RESOURCES)}, updated_at)
+VALUES (:scope, :scope_id, {', '.join(f':{r}_limit, 0' for r in RESOURCES)}, :now)
+ON CONFLICT (scope, scope_id) DO NOTHING
+""")
+
+SELECT_SQL = text(f"""
+SELECT scope_id, {', '.join(f'{r}_limit, {r}_used' for r in RESOURCES)}
+FROM {TABLE_NAME}
+WHERE scope = :scope AND scope_id IN :scope_ids
+""").bindparams(bindparam('scope_ids', expanding=True))
+
+# 按虚拟机表重算已用量；锁表期间创建/删除虚拟机的事务等待，避免计数与重算结果交错
+REBUILD_SQL = (
+    f"LOCK TABLE {TABLE_NAME} IN SHARE ROW EXCLUSIVE MODE",
+    f"UPDATE {TABLE_NAME} SET {', '.join(f'{r}_used = 0' for r in RESOURCES)}",
+    f"""
+    UPDATE {TABLE_NAME} q SET
+        vms_used = u.vms, cpu_cores_used = u.cpu_cores, memory_gb_used = u.memory_gb,
+        disk_gb_used = u.disk_gb, gpu_count_used = u.gpu_count
+    FROM (
+        SELECT 'tenant' AS scope, tenant_id AS scope_id, count(*) AS vms, sum(cpu_cores) AS cpu_cores,
+               sum(memory_gb) AS memory_gb, sum(disk_gb) AS disk_gb, COALESCE(sum(gpu_count), 0) AS gpu_count
+        FROM virtual_machines WHERE status <> 'deleted' GROUP BY tenant_id
+        UNION ALL
+        SELECT 'project', project_id, count(*), sum(cpu_cores), sum(memory_gb), sum(disk_gb),
+               COALESCE(sum(gpu_count), 0)
+        FROM virtual_machines WHERE status <> 'deleted' GROUP BY project_id
+    ) u
+    WHERE q.scope = u.scope AND q.scope_id = u.scope_id
+    """,
+)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, scope, scope_id, resource, requested, used, limit):
+        self.scope = scope
+        self.scope_id = scope_id
+        self.resource = resource
+        self.requested = requested
+        self.used = used
+        self.limit = limit
+        super().__init__(f"{scope} {scope_id} {resource} quota exceeded: "
+                         f"requested {requested}, used {used}, limit {limit}")
+
+    def to_dict(self):
+        return {
+            'scope': self.scope,
+            'resource': self.resource,
+            'requested': self.requested,
+            'used': self.used,
+            'limit': self.limit,
+        }
+
+
+def vm_usage(cpu_cores, memory_gb, disk_gb, gpu_count):
+    """一台虚拟机占用的配额"""
+    return {'vms': 1, 'cpu_cores': cpu_cores, 'memory_gb': memory_gb, 'disk_gb': disk_gb,
+            'gpu_count': gpu_count or 0}
+
+
+def _default_limits(scope):
+    """配置中的默认限额，0表示不限（存为NULL）"""
+    defaults = current_app.config.get(f'QUOTA_{scope.upper()}_DEFAULTS', {})
+    return {f'{r}_limit': defaults.get(r) or None for r in RESOURCES}
+
+
+def _ensure_row(session, scope, scope_id):
+    session.execute(INSERT_SQL, dict(_default_limits(scope), scope=scope, scope_id=scope_id,
+                                     now=datetime.utcnow()))
+
+
+def _load(session, scope, scope_ids):
+    rows = session.execute(SELECT_SQL, {'scope': scope, 'scope_ids': list(scope_ids)})
+    quotas = {}
+    for row in rows:
+        values = row[1:]
+        quotas[row[0]] = {
+            resource: {'limit': values[i * 2], 'used': values[i * 2 + 1]}
+            for i, resource in enumerate(RESOURCES)
+        }
+    return quotas
+
+
+def reserve(session, tenant_id, project_id, usage):
+    """在当前事务内占用租户和项目配额，超额时抛出QuotaExceeded（调用方负责回滚）
+
+    正常路径每个范围一条按主键的条件UPDATE；记录不存在时按默认限额创建后重试
+    """
+    params = dict(usage, now=datetime.utcnow())
+    for scope, scope_id in zip(SCOPES, (tenant_id, project_id)):
+        params.update(scope=scope, scope_id=scope_id)
+        if session.execute(RESERVE_SQL, params).rowcount:
+            continue
+
+        quota = _load(session, scope, [scope_id]).get(scope_id)
+        if quota is None:
+            _ensure_row(session, scope, scope_id)
+            if session.execute(RESERVE_SQL, params).rowcount:
+                continue
+            quota = _load(session, scope, [scope_id])[scope_id]
+
+        for resource in RESOURCES:
+            limit, used = quota[resource]['limit'], quota[resource]['used']
+            if limit is not None and used + usage[resource] > limit:
+                raise QuotaExceeded(scope, scope_id, resource, usage[resource], used, limit)
+        raise QuotaExceeded(scope, scope_id, None, None, None, None)
+
+
+def release(session, tenant_id, project_id, usage):
+    """在当前事务内释放租户和项目配额"""
+    params = dict(usage, now=datetime.utcnow())
+    for scope, scope_id in zip(SCOPES, (tenant_id, project_id)):
+        session.execute(RELEASE_SQL, dict(params, scope=scope, scope_id=scope_id))
+
+
+def get_quotas(session, scope, scope_ids):
+    """返回 {scope_id: {resource: {'limit', 'used'}}}，尚无记录的按默认限额、零用量返回"""
+    quotas = _load(session, scope, scope_ids)
+    defaults = _default_limits(scope)
+    for scope_id in scope_ids:
+        quotas.setdefault(scope_id, {
+            resource: {'limit': defaults[f'{resource}_limit'], 'used': 0} for resource in RESOURCES
+        })
+    return quotas
+
+
+def set_limits(session, scope, scope_id, limits):
+    """修改限额（None或0表示不限），未给出的资源保持不变"""
+    unknown = set(limits) - set(RESOURCES)
+    if unknown:
+        raise ValueError(f"unknown quota resources: {', '.join(sorted(unknown))}")
+    values = {}
+    for resource, limit in limits.items():
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 0):
+            raise ValueError(f"{resource} limit must be a non-negative integer or null")
+        values[f'{resource}_limit'] = limit or None
+
+    _ensure_row(session, scope, scope_id)
+    if values:
+        assignments = ', '.join(f'{column} = :{column}' for column in values)
+        session.execute(
+            text(f"UPDATE {TABLE_NAME} SET {assignments}, updated_at = :now "
+                 f"WHERE scope = :scope AND scope_id = :scope_id"),
+            dict(values, scope=scope, scope_id=scope_id, now=datetime.utcnow())
+        )
+
+
+def rebuild_usage(session):
+    """为所有租户和项目补建配额记录，并按虚拟机表重算已用量（直接写入虚拟机表后使用）"""
+    now = datetime.utcnow()
+    for scope, table in (('tenant', 'tenants'), ('project', 'projects')):
+        limits = _default_limits(scope)
+        session.execute(
+            text(f"""
+            INSERT INTO {TABLE_NAME} (scope, scope_id, {', '.join(f'{r}_limit, {r}_used' for r in RESOURCES)},
+                                      updated_at)
+            SELECT :scope, id, {', '.join(f':{r}_limit, 0' for r in RESOURCES)}, :now FROM {table}
+            ON CONFLICT (scope, scope_id) DO NOTHING
+            """),
+            dict(limits, scope=scope, now=now)
+        )
+    for statement in REBUILD_SQL:
+        session.execute(text(statement))
+    session.commit()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS resource quotas')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Recalculate usage counters from virtual_machines')
+    parser.add_argument('--show', choices=SCOPES, help='Show quotas for a tenant or project')
+    parser.add_argument('--id', type=int, help='Tenant or project id for --show/--set')
+    parser.add_argument('--set', nargs='+', metavar='RESOURCE=LIMIT',
+                        help=f"Set limits for --show scope and --id ({', '.join(RESOURCES)}; 0 = unlimited)")
+    args = parser.parse_args()
+
+    from models import create_db_app, db
+
+    with create_db_app().app_context():
+        if args.rebuild:
+            rebuild_usage(db.session)
+            print("✅ Quota usage rebuilt")
+        elif args.show:
+            if args.id is None:
+                parser.error('--show requires --id')
+            if args.set:
+                try:
+                    limits = {}
+                    for item in args.set:
+                        resource, _, limit = item.partition('=')
+                        limits[resource] = int(limit)
+                    set_limits(db.session, args.show, args.id, limits)
+                    db.session.commit()
+                except ValueError as e:
+                    print(f"❌ {e}")
+                    sys.exit(1)
+            quota = get_quotas(db.session, args.show, [args.id])[args.id]
+            print(f"{'Resource':<12} {'Used':>10} {'Limit':>10}")
+            for resource in RESOURCES:
+                limit = quota[resource]['limit']
+                print(f"{resource:<12} {quota[resource]['used']:>10} {'-' if limit is None else limit:>10}")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
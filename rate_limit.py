@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+限流与准入控制模块
+令牌桶限流：按 路由类别（create_vm / power / login / login_ip）x 租户 计数，配置了Redis时由Lua脚本在Redis中
+原子扣减（各worker共享，时间取Redis服务器时钟），未配置或Redis不可用时回退到进程内令牌桶
+（此时限额按worker各自计算）。登录接口同时按客户端地址（login_ip）和提交的用户名（login）计数：
+前者限制单个来源轮换用户名的猜测，后者限制分散来源对同一账号的猜测。
+并发准入：每个worker同时处理的API请求数超过上限时直接返回429，上限应低于数据库连接池容量，
+在连接池耗尽（请求排队等待 pool_timeout 后报错）之前拒绝，避免堆积。
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+from functools import wraps
+
+from flask import g, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CLASSES = ('create_vm', 'power', 'login', 'login_ip')
+
+# 不受并发准入限制的路径（健康检查与监控抓取在过载时也应可用）
+EXEMPT_PATHS = ('/api/health', '/api/metrics')
+
+# KEYS[1]=桶；ARGV: 容量, 每秒补充数, 本次消耗；返回 {是否允许, 需等待秒数}
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+# 进程内令牌桶超过该数量时清理已回满的桶
+MAX_LOCAL_BUCKETS = 10000
+
+
+def parse_limit(value):
+    """'20/60' -> (容量20, 每秒补充20/60)；'off' 或空表示不限"""
+    value = str(value).strip()
+    if not value or value == 'off':
+        return None
+    try:
+        count, period = value.split('/')
+        count, period = float(count), float(period)
+    except ValueError:
+        raise ValueError(f"invalid rate limit '{value}', expected COUNT/SECONDS")
+    if count <= 0 or period <= 0:
+        raise ValueError(f"invalid rate limit '{value}', COUNT and SECONDS must be positive")
+    return count, count / period
+
+
+def parse_limits(value):
+    """'create_vm=20/60,login=10/60' -> {route_class: (容量, 每秒补充数)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        route_class, _, limit = item.partition('=')
+        if route_class not in ROUTE_CLASSES:
+            raise ValueError(f"unknown rate limit route class: {route_class}")
+        limits[route_class] = parse_limit(limit)
+    return limits
+
+
+class LocalBuckets:
+    """进程内令牌桶（Redis不可用时的回退）"""
+
+    def __init__(self):
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, 0))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            # 第三项为桶回满的时间，之后可以丢弃
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self.buckets) > MAX_LOCAL_BUCKETS:
+                self.buckets = {k: v for k, v in self.buckets.items() if v[2] > now}
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self.limits = {}
+        self.tenant_limits = {}
+        self.local = LocalBuckets()
+        self._redis = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self._slots = None
+        self.max_concurrent = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.limits = parse_limits(app.config.get('RATE_LIMITS', ''))
+        # {"租户用户名": {"create_vm": "100/60", ...}}
+        self.tenant_limits = {
+            tenant: {route_class: parse_limit(limit) for route_class, limit in limits.items()}
+            for tenant, limits in json.loads(app.config.get('RATE_LIMIT_TENANTS') or '{}').items()
+        }
+        for limits in self.tenant_limits.values():
+            unknown = set(limits) - set(ROUTE_CLASSES)
+            if unknown:
+                raise ValueError(f"unknown rate limit route class: {', '.join(sorted(unknown))}")
+        self.redis_host = app.config.get('REDIS_HOST', '')
+        self.redis_retry = app.config.get('RATE_LIMIT_REDIS_RETRY', 30)
+
+        self.max_concurrent = app.config.get('MAX_CONCURRENT_REQUESTS', 0)
+        if self.max_concurrent > 0:
+            self._slots = threading.BoundedSemaphore(self.max_concurrent)
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+        app.extensions['rate_limiter'] = self
+
+    def _redis_script(self):
+        """返回Redis上的限流脚本，未配置或暂不可用时返回None"""
+        if not self.redis_host or time.monotonic() < self._redis_down_until:
+            return None
+        if self._script is None:
+            import redis
+            timeout = self.app.config.get('RATE_LIMIT_REDIS_TIMEOUT', 0.1)
+            self._redis = redis.Redis(
+                host=self.redis_host,
+                port=self.app.config.get('REDIS_PORT', 6379),
+                password=self.app.config.get('REDIS_PASSWORD') or None,
+                socket_timeout=timeout,
+                socket_connect_timeout=timeout,
+            )
+            self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+        return self._script
+
+    def limit_for(self, route_class, tenant):
+        tenant_limits = self.tenant_limits.get(tenant, {})
+        if route_class in tenant_limits:
+            return tenant_limits[route_class]
+        return self.limits.get(route_class)
+
+    def check(self, route_class, tenant, cost=1):
+        """扣减令牌，返回 (是否允许, 需等待秒数, 后端)"""
+        limit = self.limit_for(route_class, tenant)
+        if not self.enabled or limit is None:
+            return True, 0.0, None
+        capacity, rate = limit
+        key = f"ratelimit:{route_class}:{tenant}"
+
+        try:
+            script = self._redis_script()
+            if script is not None:
+                allowed, retry_after = script(keys=[key], args=[capacity, rate, cost])
+                return bool(allowed), float(retry_after), 'redis'
+        except Exception as e:
+            # 暂停使用Redis一段时间，期间回退到进程内令牌桶，避免每个请求等待超时
+            self._redis_down_until = time.monotonic() + self.redis_retry
+            logger.warning(f"Rate limit Redis error, using in-process buckets for {self.redis_retry}s: {str(e)}")
+
+        allowed, retry_after = self.local.take(key, capacity, rate, cost)
+        return allowed, retry_after, 'local'
+
+    def _reject(self, route_class, reason, retry_after):
+        exporter = self.app.extensions.get('metrics_exporter')
+        if exporter is not None:
+            exporter.observe_rejection(route_class, reason)
+        retry_after = max(1, math.ceil(retry_after))
+        response = jsonify({'error': '请求过于频繁，请稍后重试', 'retry_after': retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def limit(self, route_class, key=None):
+        """路由限流装饰器；默认按 @token_required 传入的 current_user 计数，key为自定义的计数键函数"""
+        if route_class not in ROUTE_CLASSES:
+            raise ValueError(f"unknown rate limit route class: {route_class}")
+
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                tenant = key() if key is not None else args[0]['username']
+                allowed, retry_after, backend = self.check(route_class, tenant)
+                if not allowed:
+                    logger.info(f"Rate limited {route_class} for {tenant} ({backend}), retry after {retry_after:.1f}s")
+                    return self._reject(route_class, 'rate', retry_after)
+                return f(*args, **kwargs)
+            return decorated
+        return decorator
+
+    def _before_request(self):
+        if not request.path.startswith('/api/') or request.path.startswith(EXEMPT_PATHS):
+            return None
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"Shedding {request.method} {request.path}: "
+                           f"{self.max_concurrent} requests in flight in worker {os.getpid()}")
+            return self._reject('all', 'concurrency', 1)
+        g.admission_slot = True
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('admission_slot', None):
+            self._slots.release()
+
+    def status(self):
+        def describe(limit):
+            return None if limit is None else {'burst': limit[0], 'per_second': round(limit[1], 4)}
+
+        redis_state = 'disabled'
+        if self.redis_host:
+            redis_state = 'fallback' if time.monotonic() < self._redis_down_until else 'active'
+        return {
+            'enabled': self.enabled,
+            'limits': {route_class: describe(self.limits.get(route_class)) for route_class in ROUTE_CLASSES},
+            'tenant_limits': {
+                tenant: {route_class: describe(limit) for route_class, limit in limits.items()}
+                for tenant, limits in self.tenant_limits.items()
+            },
+            'redis': redis_state,
+            'local_buckets': len(self.local.buckets),
+            'max_concurrent_requests': self.max_concurrent,
+            'pid': os.getpid(),
+        }
+
+
+def client_ip_key():
+    """按客户端地址计数；经反向代理部署时需配置 TRUSTED_PROXY_COUNT，否则所有请求都是代理的地址"""
+    return f"ip:{request.remote_addr}"
+
+
+def login_key():
+    """登录按提交的用户名计数，没有用户名时按客户端地址"""
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    return username.strip() if isinstance(username, str) and username.strip() else client_ip_key()
+
+
+# 全局实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+请求级性能剖析模块
+按采样率对请求做栈采样（sample）或函数级跟踪（trace），最近N份结果保存在环形缓冲区，
+可导出为折叠栈文本或speedscope JSON，并按ORM、序列化、认证等层汇总耗时。
+状态保存在进程内：多worker部署时请用 PROFILER_ENABLED 环境变量统一开启。
+gevent worker下只能使用trace模式，且同一线程内其他greenlet的调用也会被计入。
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# 按文件路径归属到层，从栈顶向下第一个命中的层计入
+LAYER_PATTERNS = (
+    ('orm', ('sqlalchemy', 'flask_sqlalchemy', 'psycopg2')),
+    ('serialization', ('json_provider', 'orjson', os.sep + 'json' + os.sep, 'flask' + os.sep + 'json')),
+    ('auth', (os.sep + 'auth.py', os.sep + 'jwt' + os.sep)),
+)
+
+PROFILE_MODES = ('sample', 'trace')
+
+
+def _frame_name(code):
+    filename = code.co_filename
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _green_threads():
+    """gevent打补丁后线程即greenlet，采样线程无法在请求执行期间运行"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _layer_of(stack_files):
+    for filename in reversed(stack_files):
+        for layer, patterns in LAYER_PATTERNS:
+            if any(pattern in filename for pattern in patterns):
+                return layer
+    return 'app'
+
+
+class _StackSampler(threading.Thread):
+    """定时采样目标线程的调用栈"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.files = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        weight = int(self.interval * 1_000_000)
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            files = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                files.append(frame.f_code.co_filename)
+                frame = frame.f_back
+            key = tuple(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + weight
+            self.files[key] = tuple(reversed(files))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.stacks, self.files
+
+
+class _CallTracer:
+    """基于sys.setprofile的确定性跟踪，记录每个调用栈的自身耗时"""
+
+    def __init__(self):
+        self.stack = []
+        self.stacks = {}
+        self.files = {}
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if event in ('call', 'c_call'):
+            if event == 'call':
+                name, filename = _frame_name(frame.f_code), frame.f_code.co_filename
+            else:
+                name, filename = f"{getattr(arg, '__qualname__', arg)} (builtin)", '<builtin>'
+            self.stack.append([name, filename, now, 0.0])
+        elif event in ('return', 'c_return', 'c_exception'):
+            if not self.stack:
+                # 开始跟踪前已在栈上的帧
+                return
+            name, filename, started, child_time = self.stack.pop()
+            elapsed = now - started
+            key = tuple(item[0] for item in self.stack) + (name,)
+            self.stacks[key] = self.stacks.get(key, 0) + int((elapsed - child_time) * 1_000_000)
+            self.files[key] = tuple(item[1] for item in self.stack) + (filename,)
+            if self.stack:
+                self.stack[-1][3] += elapsed
+
+    def stop(self):
+        return self.stacks, self.files
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self.profiles = deque(maxlen=20)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """初始化剖析模块"""
+        self.app = app
+        self.profiles = deque(maxlen=app.config.get('PROFILER_MAX_PROFILES', 20))
+        self.configure(
+            enabled=app.config.get('PROFILER_ENABLED', False),
+            sample_rate=app.config.get('PROFILER_SAMPLE_RATE', 0.01),
+            mode=app.config.get('PROFILER_MODE', 'sample'),
+            interval_ms=app.config.get('PROFILER_INTERVAL_MS', 2),
+            route_prefix=app.config.get('PROFILER_ROUTE_PREFIX', '/api/'),
+        )
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def configure(self, enabled=None, sample_rate=None, mode=None, interval_ms=None, route_prefix=None):
+        """更新剖析配置，参数非法时抛出ValueError"""
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}")
+        if mode == 'sample' and _green_threads():
+            raise ValueError("sample mode is not supported under gevent, use trace")
+        if sample_rate is not None and not 0 <= float(sample_rate) <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if interval_ms is not None and float(interval_ms) <= 0:
+            raise ValueError("interval_ms must be positive")
+
+        if sample_rate is not None:
+            self.sample_rate = float(sample_rate)
+        if mode is not None:
+            self.mode = mode
+        if interval_ms is not None:
+            self.interval = float(interval_ms) / 1000
+        if route_prefix is not None:
+            self.route_prefix = route_prefix
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        return self.status()
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'mode': self.mode,
+            'interval_ms': self.interval * 1000,
+            'route_prefix': self.route_prefix,
+            'stored_profiles': len(self.profiles),
+            'max_profiles': self.profiles.maxlen,
+            'pid': os.getpid(),
+        }
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        if not request.path.startswith(self.route_prefix) or request.path.startswith('/api/admin/profil'):
+            return
+        if random.random() >= self.sample_rate:
+            return
+
+        if self.mode == 'trace':
+            collector = _CallTracer()
+            sys.setprofile(collector)
+        else:
+            collector = _StackSampler(threading.get_ident(), self.interval)
+            collector.start()
+        g.request_profile = (collector, time.perf_counter(), datetime.utcnow())
+
+    def _after_request(self, response):
+        active = g.pop('request_profile', None)
+        if active is None:
+            return response
+
+        collector, started, started_at = active
+        if isinstance(collector, _CallTracer):
+            sys.setprofile(None)
+        stacks, files = collector.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        layers = {}
+        for key, weight in stacks.items():
+            layer = _layer_of(files.get(key, ()))
+            layers[layer] = layers.get(layer, 0) + weight
+
+        with self._lock:
+            profile_id = self._next_id
+            self._next_id += 1
+            self.profiles.append({
+                'id': profile_id,
+                'route': request.url_rule.rule if request.url_rule else request.path,
+                'path': request.full_path.rstrip('?'),
+                'method': request.method,
+                'status': response.status_code,
+                'mode': 'trace' if isinstance(collector, _CallTracer) else 'sample',
+                'started_at': started_at.isoformat(),
+                'duration_ms': round(duration_ms, 2),
+                'layers_ms': {layer: round(weight / 1000, 2) for layer, weight in layers.items()},
+                'stacks': stacks,
+            })
+        return response
+
+    def _teardown_request(self, exc):
+        # 请求异常未经过after_request时确保停止采集
+        active = g.pop('request_profile', None)
+        if active is not None:
+            if isinstance(active[0], _CallTracer):
+                sys.setprofile(None)
+            active[0].stop()
+
+    def list_profiles(self):
+        """返回缓冲区内各剖析结果的摘要（最新在前）"""
+        return [
+            {key: value for key, value in profile.items() if key != 'stacks'}
+            for profile in reversed(self.profiles)
+        ]
+
+    def get_profile(self, profile_id):
+        for profile in self.profiles:
+            if profile['id'] == profile_id:
+                return profile
+        return None
+
+    def to_collapsed(self, profile):
+        """折叠栈格式（flamegraph.pl / speedscope可直接导入），权重单位为微秒"""
+        lines = [
+            f"{';'.join(key)} {weight}"
+            for key, weight in sorted(profile['stacks'].items())
+            if weight > 0
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def to_speedscope(self, profile):
+        """speedscope JSON格式"""
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+        for key, weight in profile['stacks'].items():
+            if weight <= 0:
+                continue
+            sample = []
+            for name in key:
+                if name not in frame_index:
+                    frame_index[name] = len(frames)
+                    frames.append({'name': name})
+                sample.append(frame_index[name])
+            samples.append(sample)
+            weights.append(weight)
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': f"{profile['method']} {profile['path']} #{profile['id']}",
+                'unit': 'microseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+            'name': f"vmware-iaas profile {profile['id']}",
+            'exporter': 'vmware-iaas request_profiler',
+        }
+
+
+# 全局实例
+request_profiler = RequestProfiler()
@@ -0,0 +1,1204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 页面与API路由
+"""
+
+import os
+import csv
+import io
+import json
+import base64
+import binascii
+import zlib
+import logging
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, send_from_directory, redirect, current_app, stream_with_context
+from sqlalchemy import text, select, func, tuple_
+from metrics import metrics_exporter
+from request_profiler import request_profiler
+from db_routing import db_router, use_primary
+from models import db, Tenant, Project, VirtualMachine, IPPool, BillingRecord, UserSession, VmProvision
+import quotas
+from gpu_placement import gpu_scheduler, NoGpuCapacity
+from host_placement import host_scheduler, NoHostCapacity
+from template_catalog import template_catalog
+from provisioning import provisioner, provision_stats
+from warm_pool import warm_pool
+from rate_limit import rate_limiter, login_key, client_ip_key
+from hypervisor import CLONE_MODES
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('main', __name__)
+
+# 列表接口直接查询的列，JSON Provider负责datetime/Decimal序列化
+VM_LIST_COLUMNS = (
+    VirtualMachine.id,
+    VirtualMachine.name,
+    VirtualMachine.project_id,
+    VirtualMachine.project_name,
+    VirtualMachine.project_code,
+    VirtualMachine.owner,
+    VirtualMachine.ip_address,
+    VirtualMachine.host_name,
+    VirtualMachine.cpu_cores,
+    VirtualMachine.memory_gb,
+    VirtualMachine.disk_gb,
+    VirtualMachine.gpu_type,
+    VirtualMachine.gpu_count,
+    VirtualMachine.status,
+    VirtualMachine.template_name,
+    VirtualMachine.deadline,
+    VirtualMachine.created_at,
+    VirtualMachine.updated_at,
+)
+
+BILLING_DETAIL_COLUMNS = (
+    BillingRecord.id,
+    BillingRecord.vm_name,
+    Project.project_name,
+    Project.project_code,
+    BillingRecord.owner,
+    BillingRecord.billing_date,
+    BillingRecord.cpu_cores,
+    BillingRecord.memory_gb,
+    BillingRecord.disk_gb,
+    BillingRecord.gpu_type,
+    BillingRecord.gpu_count,
+    BillingRecord.cpu_cost,
+    BillingRecord.memory_cost,
+    BillingRecord.disk_cost,
+    BillingRecord.gpu_cost,
+    BillingRecord.total_cost,
+    BillingRecord.created_at,
+)
+
+BILLING_EXPORT_COLUMNS = (
+    BillingRecord.id,
+    BillingRecord.billing_date,
+    BillingRecord.tenant_id,
+    BillingRecord.project_id,
+    Project.project_name,
+    Project.project_code,
+    BillingRecord.vm_id,
+    BillingRecord.vm_name,
+    BillingRecord.owner,
+    BillingRecord.cpu_cores,
+    BillingRecord.memory_gb,
+    BillingRecord.disk_gb,
+    BillingRecord.gpu_type,
+    BillingRecord.gpu_count,
+    BillingRecord.cpu_cost,
+    BillingRecord.memory_cost,
+    BillingRecord.disk_cost,
+    BillingRecord.gpu_cost,
+    BillingRecord.total_cost,
+)
+
+# 导入认证模块
+try:
+    from auth import ldap_auth, token_required, admin_required, get_current_user, is_admin
+    logger.info("认证模块加载成功")
+except ImportError:
+    logger.warning("认证模块未找到，使用基础认证")
+    # 基础认证实现
+    def token_required(f):
+        from functools import wraps
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            return f({'username': 'demo', 'display_name': '演示用户'}, *args, **kwargs)
+        return decorated
+    
+    def is_admin(user):
+        return bool(user) and user.get('username') == 'admin'
+    
+    def admin_required(f):
+        from functools import wraps
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            return jsonify({'error': '需要管理员权限'}), 403
+        return decorated
+    
+    class BasicAuth:
+        def init_app(self, app):
+            pass
+        
+        def authenticate(self, username, password):
+            if username == 'admin' and password == 'admin123':
+                return {'username': 'admin', 'display_name': '管理员', 'email': 'admin@demo.com'}
+            return None
+        
+        def generate_token(self, user_info):
+            return 'demo-token'
+    
+    ldap_auth = BasicAuth()
+
+# 路由定义
+@bp.route('/')
+def index():
+    """主页 - 重定向到登录页"""
+    return redirect('/static/login.html')
+
+@bp.route('/login')
+def login_page():
+    """登录页面"""
+    return send_from_directory('static', 'login.html')
+
+@bp.route('/dashboard')
+def dashboard():
+    """控制台页面"""
+    return send_from_directory('static', 'index.html')
+
+@bp.route('/static/<path:filename>')
+def static_files(filename):
+    """静态文件服务"""
+    return send_from_directory('static', filename)
+
+@bp.route('/api/health')
+@use_primary
+def health_check():
+    """健康检查接口 - 容错版本"""
+    health_status = {
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'version': '2.0.0',
+        'services': {}
+    }
+    
+    # 数据库检查 - 失败时降级而非失败
+    try:
+        with current_app.app_context():
+            db.session.execute(text('SELECT 1'))
+            db.session.commit()
+        health_status['services']['database'] = 'connected'
+    except Exception as e:
+        logger.warning(f"Database health check failed: {str(e)}")
+        health_status['services']['database'] = 'degraded'
+        health_status['status'] = 'degraded'  # 降级而非失败
+    
+    if db_router.replicas:
+        health_status['services']['replicas'] = db_router.status()
+    
+    # Redis检查（如果配置了）
+    redis_host = os.environ.get('REDIS_HOST')
+    if redis_host:
+        try:
+            import redis
+            r = redis.Redis(
+                host=redis_host,
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                password=os.environ.get('REDIS_PASSWORD'),
+                socket_timeout=2
+            )
+            r.ping()
+            health_status['services']['redis'] = 'connected'
+        except Exception as e:
+            health_status['services']['redis'] = 'degraded'
+    
+    # 始终返回200，让Docker认为服务可用
+    return jsonify(health_status), 200
+
+@bp.route('/api/auth/login', methods=['POST'])
+@rate_limiter.limit('login_ip', key=client_ip_key)
+@rate_limiter.limit('login', key=login_key)
+def login():
+    """用户登录"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求数据格式错误'}), 400
+        
+        username = data.get('username', '').strip()
+        password = data.get('password', '')
+        
+        if not username or not password:
+            return jsonify({'error': '用户名和密码不能为空'}), 400
+        
+        # 认证用户
+        user_info = ldap_auth.authenticate(username, password)
+        if not user_info:
+            return jsonify({'error': '用户名或密码错误'}), 401
+        
+        # 查找或创建租户
+        tenant = Tenant.query.filter_by(ldap_uid=user_info['username']).first()
+        if not tenant:
+            tenant = Tenant(
+                ldap_uid=user_info['username'],
+                username=user_info['username'],
+                display_name=user_info.get('display_name', user_info['username']),
+                email=user_info.get('email', f"{user_info['username']}@company.com"),
+                department=user_info.get('department', 'IT')
+            )
+            db.session.add(tenant)
+            db.session.commit()
+            logger.info(f"Created new tenant: {tenant.username}")
+        
+        # 生成访问令牌
+        token = ldap_auth.generate_token(user_info)
+        
+        # 记录会话
+        session = UserSession(
+            tenant_id=tenant.id,
+            session_token=UserSession.token_digest(token),
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', ''),
+            expires_at=datetime.utcnow() + timedelta(hours=24)
+        )
+        db.session.add(session)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'token': token,
+            'user': {
+                'id': tenant.id,
+                'username': tenant.username,
+                'display_name': tenant.display_name,
+                'email': tenant.email,
+                'department': tenant.department
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Login error: {str(e)}")
+        return jsonify({'error': '登录服务异常，请稍后重试'}), 500
+
+@bp.route('/api/auth/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    """用户登出"""
+    try:
+        # 获取当前会话令牌
+        token = request.headers.get('Authorization', '').replace('Bearer ', '')
+        if token:
+            session = UserSession.query.filter_by(session_token=UserSession.token_digest(token)).first()
+            if session:
+                session.is_active = False
+                db.session.commit()
+        
+        return jsonify({'success': True, 'message': '已成功登出'})
+    except Exception as e:
+        logger.error(f"Logout error: {str(e)}")
+        return jsonify({'error': '登出失败'}), 500
+
+@bp.route('/api/auth/verify', methods=['POST'])
+@token_required
+def verify_token(current_user):
+    """验证令牌"""
+    return jsonify({
+        'valid': True,
+        'user': current_user
+    })
+
+@bp.route('/api/auth/profile')
+@token_required
+def get_profile(current_user):
+    """获取用户资料"""
+    return jsonify({
+        'user': current_user
+    })
+
+@bp.route('/api/templates')
+@token_required
+def list_templates(current_user):
+    """获取虚拟机模板列表（读取内存缓存，客户端携带If-None-Match且未变化时返回304）"""
+    cache = template_catalog.snapshot()
+    response = Response(cache['body'], mimetype='application/json')
+    response.set_etag(cache['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@bp.route('/api/admin/templates/refresh', methods=['POST'])
+@admin_required
+def refresh_templates(current_user):
+    """立即从虚拟化平台同步模板目录"""
+    try:
+        template_catalog.discover(force=True)
+        template_catalog.load()
+    except Exception as e:
+        logger.error(f"Refresh templates error: {str(e)}")
+        return jsonify({'error': '模板同步失败'}), 502
+    
+    logger.info(f"Template catalog refreshed by {current_user['username']}")
+    return jsonify({'templates': list(template_catalog.snapshot()['templates'].values())})
+
+@bp.route('/api/admin/provisioning/stats')
+@admin_required
+def provisioning_stats(current_user):
+    """按克隆方式对比开通耗时与存储占用"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return jsonify({'hours': hours, 'clone_modes': provision_stats(db.session, since)})
+    except Exception as e:
+        logger.error(f"Provisioning stats error: {str(e)}")
+        return jsonify({'error': '获取开通统计失败'}), 500
+
+@bp.route('/api/admin/rate-limits')
+@admin_required
+def rate_limit_status(current_user):
+    """当前worker的限流配置与状态"""
+    return jsonify(rate_limiter.status())
+
+@bp.route('/api/admin/warm-pool')
+@admin_required
+def warm_pool_stats(current_user):
+    """各预热规格的池水位、命中率与预热/冷创建的开通耗时对比"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return jsonify({'hours': hours, 'clone_mode': warm_pool.clone_mode,
+                        'shapes': warm_pool.stats(db.session, since)})
+    except Exception as e:
+        logger.error(f"Warm pool stats error: {str(e)}")
+        return jsonify({'error': '获取预热池统计失败'}), 500
+
+@bp.route('/api/system/stats')
+@token_required
+def system_stats(current_user):
+    """获取系统统计信息"""
+    try:
+        # 获取当前租户ID
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        # 统计虚拟机
+        total_vms = VirtualMachine.query.filter_by(tenant_id=tenant.id).count()
+        running_vms = VirtualMachine.query.filter_by(tenant_id=tenant.id, status='running').count()
+        stopped_vms = VirtualMachine.query.filter_by(tenant_id=tenant.id, status='stopped').count()
+        expired_vms = VirtualMachine.query.filter_by(tenant_id=tenant.id, status='expired').count()
+        
+        # 即将过期的虚拟机（7天内）
+        seven_days_later = datetime.utcnow() + timedelta(days=7)
+        expiring_vms = VirtualMachine.query.filter(
+            VirtualMachine.tenant_id == tenant.id,
+            VirtualMachine.deadline <= seven_days_later,
+            VirtualMachine.status != 'expired'
+        ).count()
+        
+        # 统计资源
+        vms = VirtualMachine.query.filter_by(tenant_id=tenant.id).all()
+        total_cpu = sum(vm.cpu_cores for vm in vms)
+        total_memory = sum(vm.memory_gb for vm in vms)
+        total_disk = sum(vm.disk_gb for vm in vms)
+        total_gpus = sum(vm.gpu_count for vm in vms if vm.gpu_count)
+        
+        # 统计项目
+        total_projects = Project.query.filter_by(tenant_id=tenant.id).count()
+        
+        return jsonify({
+            'vms': {
+                'total': total_vms,
+                'running': running_vms,
+                'stopped': stopped_vms,
+                'expired': expired_vms,
+                'expiring_soon': expiring_vms
+            },
+            'resources': {
+                'total_cpu_cores': total_cpu,
+                'total_memory_gb': total_memory,
+                'total_disk_gb': total_disk,
+                'total_gpus': total_gpus
+            },
+            'projects': {
+                'total': total_projects
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"System stats error: {str(e)}")
+        return jsonify({'error': '获取系统统计失败'}), 500
+
+@bp.route('/api/vms')
+@token_required
+def list_vms(current_user):
+    """获取虚拟机列表"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        project_id = request.args.get('project_id', type=int)
+        
+        # 直接按列查询Row元组，避免构造ORM对象
+        query = select(*VM_LIST_COLUMNS).where(VirtualMachine.tenant_id == tenant.id)
+        if project_id:
+            query = query.where(VirtualMachine.project_id == project_id)
+        
+        rows = db.session.execute(query.order_by(VirtualMachine.created_at.desc()))
+        
+        now = datetime.utcnow()
+        vm_list = []
+        for row in rows:
+            vm_data = row._asdict()
+            deadline = vm_data['deadline']
+            vm_data['days_until_expiry'] = max(0, (deadline - now).days) if deadline else 0
+            vm_list.append(vm_data)
+        
+        return jsonify({'vms': vm_list})
+        
+    except Exception as e:
+        logger.error(f"List VMs error: {str(e)}")
+        return jsonify({'error': '获取虚拟机列表失败'}), 500
+
+@bp.route('/api/vms', methods=['POST'])
+@token_required
+@rate_limiter.limit('create_vm')
+def create_vm(current_user):
+    """创建虚拟机"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求数据格式错误'}), 400
+        
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        # 验证必需字段
+        required_fields = ['name', 'template_name', 'cpu_cores', 'memory_gb', 'disk_gb', 'deadline', 'owner']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'缺少必需字段: {field}'}), 400
+        
+        try:
+            cpu_cores = int(data['cpu_cores'])
+            memory_gb = int(data['memory_gb'])
+            disk_gb = int(data['disk_gb'])
+            gpu_count = int(data.get('gpu_count') or 0)
+        except (TypeError, ValueError):
+            return jsonify({'error': '资源规格必须为整数'}), 400
+        if min(cpu_cores, memory_gb, disk_gb) <= 0 or gpu_count < 0:
+            return jsonify({'error': '资源规格必须为正整数'}), 400
+        
+        # 解析deadline（在占用配额与放置之前校验全部输入）
+        try:
+            deadline = datetime.fromisoformat(data['deadline'].replace('Z', '+00:00'))
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'error': '时间格式错误'}), 400
+        
+        clone_mode = data.get('clone_mode') or provisioner.default_mode
+        if clone_mode not in CLONE_MODES:
+            return jsonify({'error': f"克隆方式必须为: {', '.join(CLONE_MODES)}"}), 400
+        
+        # 按模板最低规格校验，即时克隆须与模板规格一致（内存缓存，不访问虚拟化平台）
+        template_error = template_catalog.validate(data['template_name'], cpu_cores, memory_gb, disk_gb,
+                                                   clone_mode)
+        if template_error:
+            return jsonify({'error': template_error}), 400
+        
+        # 处理项目
+        project_id = data.get('project_id')
+        if not project_id:
+            # 创建新项目
+            project = Project(
+                project_name=data.get('project_name', '默认项目'),
+                project_code=data.get('project_code', f'PROJ-{datetime.now().strftime("%Y%m%d%H%M%S")}'),
+                tenant_id=tenant.id
+            )
+            db.session.add(project)
+            db.session.flush()
+            project_id = project.id
+        else:
+            project = Project.query.filter_by(id=project_id, tenant_id=tenant.id).first()
+            if not project:
+                return jsonify({'error': '项目不存在'}), 404
+        
+        # 占用配额：租户、项目各一条按主键的条件更新，行锁持有到提交，并发创建不会超额
+        try:
+            quotas.reserve(db.session, tenant.id, project_id,
+                           quotas.vm_usage(cpu_cores, memory_gb, disk_gb, gpu_count))
+        except quotas.QuotaExceeded as e:
+            db.session.rollback()
+            logger.info(f"Create VM rejected for {current_user['username']}: {str(e)}")
+            return jsonify({'error': '资源配额不足', 'quota': e.to_dict()}), 403
+        
+        # 放置：GPU虚拟机按GPU库存选出主机并在该主机上占用CPU/内存/磁盘（放不下时换下一台GPU主机）；
+        # 非GPU虚拟机规格与预热规格一致时领用一台预热虚拟机，沿用其主机容量与IP，其余按策略选择主机
+        # （未登记库存时不做容量管理）
+        gpu_type = data.get('gpu_type')
+        host_name = None
+        pooled = None
+        try:
+            if gpu_type and gpu_count > 0:
+                host_name = host_scheduler.place_gpu(db.session, gpu_scheduler, gpu_type, gpu_count,
+                                                     cpu_cores, memory_gb, disk_gb, project_id=project_id)
+            else:
+                pooled = warm_pool.claim(db.session, data['template_name'], cpu_cores, memory_gb, disk_gb)
+                if pooled is not None:
+                    # 预热虚拟机的主机容量在补充时已占用，这里只计入项目（亲和策略）
+                    host_name = pooled.host_name
+                    host_scheduler.attribute(db.session, host_name, project_id)
+                    clone_mode = 'warm'
+                else:
+                    host_name = host_scheduler.place(db.session, cpu_cores, memory_gb, disk_gb,
+                                                     project_id=project_id)
+        except NoGpuCapacity as e:
+            db.session.rollback()
+            logger.info(f"Create VM rejected for {current_user['username']}: {str(e)}")
+            return jsonify({
+                'error': 'GPU资源不足',
+                'gpu': {
+                    'gpu_type': e.gpu_type,
+                    'requested': e.count,
+                    'free': e.free_slots,
+                    'largest_free': e.largest_free,
+                }
+            }), 409
+        except NoHostCapacity as e:
+            db.session.rollback()
+            logger.info(f"Create VM rejected for {current_user['username']}: {str(e)}")
+            return jsonify({'error': '主机资源不足', 'host': e.host}), 409
+        
+        # 分配IP地址
+        if pooled is not None:
+            ip_pool = IPPool.query.filter_by(ip_address=pooled.ip_address).first() if pooled.ip_address else None
+        else:
+            ip_pool = IPPool.query.filter_by(is_available=True).first()
+        assigned_ip = None
+        if ip_pool:
+            assigned_ip = ip_pool.ip_address
+            ip_pool.is_available = False
+            ip_pool.assigned_at = datetime.utcnow()
+        
+        # 创建虚拟机记录
+        vm = VirtualMachine(
+            name=data['name'],
+            project_id=project_id,
+            project_name=project.project_name,
+            project_code=project.project_code,
+            owner=data['owner'],
+            deadline=deadline,
+            tenant_id=tenant.id,
+            ip_address=assigned_ip,
+            host_name=host_name,
+            cpu_cores=cpu_cores,
+            memory_gb=memory_gb,
+            disk_gb=disk_gb,
+            gpu_type=gpu_type,
+            gpu_count=gpu_count,
+            template_name=data['template_name'],
+            vcenter_vm_id=pooled.vcenter_vm_id if pooled is not None else None,
+            status='creating'
+        )
+        
+        db.session.add(vm)
+        db.session.add(VmProvision(virtual_machine=vm, clone_mode=clone_mode, template_name=vm.template_name,
+                                   storage_gb=pooled.storage_gb if pooled is not None else None))
+        if pooled is not None:
+            db.session.flush()
+            warm_pool.link(db.session, pooled.id, vm.id)
+        
+        # 更新IP池分配
+        if ip_pool:
+            ip_pool.assigned_vm_id = vm.id
+        
+        db.session.commit()
+        
+        logger.info(f"VM created: {vm.name} by {current_user['username']}")
+        
+        # 提交后在后台克隆（领用预热池时为改名并开机），完成后状态变为running（失败为error）
+        provisioner.submit(vm.id)
+        
+        return jsonify({
+            'success': True,
+            'vm': {
+                'id': vm.id,
+                'name': vm.name,
+                'status': vm.status,
+                'ip_address': vm.ip_address,
+                'clone_mode': clone_mode
+            }
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Create VM error: {str(e)}")
+        return jsonify({'error': '创建虚拟机失败'}), 500
+
+@bp.route('/api/vms/<int:vm_id>/power/<action>', methods=['POST'])
+@token_required
+@rate_limiter.limit('power')
+def vm_power_action(current_user, vm_id, action):
+    """虚拟机电源操作"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        vm = VirtualMachine.query.filter_by(id=vm_id, tenant_id=tenant.id).first()
+        if not vm:
+            return jsonify({'error': '虚拟机不存在'}), 404
+        
+        if action not in ['on', 'off', 'restart']:
+            return jsonify({'error': '无效的操作'}), 400
+        
+        # 更新虚拟机状态
+        if action == 'on':
+            vm.status = 'running'
+            message = f'虚拟机 {vm.name} 已启动'
+        elif action == 'off':
+            vm.status = 'stopped'
+            message = f'虚拟机 {vm.name} 已关闭'
+        elif action == 'restart':
+            vm.status = 'running'
+            message = f'虚拟机 {vm.name} 已重启'
+        
+        vm.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        logger.info(f"VM power action: {vm.name} {action} by {current_user['username']}")
+        
+        # TODO: 调用VMware API执行实际操作
+        
+        return jsonify({
+            'success': True,
+            'message': message,
+            'status': vm.status
+        })
+        
+    except Exception as e:
+        logger.error(f"VM power action error: {str(e)}")
+        return jsonify({'error': '操作失败'}), 500
+
+@bp.route('/api/vms/<int:vm_id>', methods=['DELETE'])
+@token_required
+def delete_vm(current_user, vm_id):
+    """删除虚拟机"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        # 锁定虚拟机行到提交：并发删除同一台虚拟机时后者等待，读到deleted后不再重复释放
+        vm = VirtualMachine.query.filter_by(id=vm_id, tenant_id=tenant.id).with_for_update().first()
+        if not vm:
+            return jsonify({'error': '虚拟机不存在'}), 404
+        
+        # 释放配额、GPU与主机容量、IP地址（重复删除不再释放）
+        if vm.status != 'deleted':
+            quotas.release(db.session, vm.tenant_id, vm.project_id,
+                           quotas.vm_usage(vm.cpu_cores, vm.memory_gb, vm.disk_gb, vm.gpu_count))
+            if vm.host_name and vm.gpu_type and vm.gpu_count:
+                gpu_scheduler.release(db.session, vm.host_name, vm.gpu_type, vm.gpu_count)
+            if vm.host_name:
+                host_scheduler.release(db.session, vm.host_name, vm.cpu_cores, vm.memory_gb, vm.disk_gb,
+                                       vm.project_id)
+            
+            if vm.ip_address:
+                ip_pool = IPPool.query.filter_by(ip_address=vm.ip_address).first()
+                if ip_pool:
+                    ip_pool.is_available = True
+                    ip_pool.assigned_vm_id = None
+                    ip_pool.assigned_at = None
+        
+        # 更新状态为已删除而不是物理删除
+        vm.status = 'deleted'
+        vm.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        logger.info(f"VM deleted: {vm.name} by {current_user['username']}")
+        
+        # TODO: 调用VMware API删除实际虚拟机
+        
+        return jsonify({
+            'success': True,
+            'message': f'虚拟机 {vm.name} 已删除'
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Delete VM error: {str(e)}")
+        return jsonify({'error': '删除虚拟机失败'}), 500
+
+@bp.route('/api/quotas')
+@token_required
+def get_quotas(current_user):
+    """当前租户及其各项目的配额与已用量"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        projects = db.session.execute(
+            select(Project.id, Project.project_name, Project.project_code)
+            .where(Project.tenant_id == tenant.id, Project.is_active.is_(True))
+            .order_by(Project.id)
+        ).all()
+        tenant_quota = quotas.get_quotas(db.session, 'tenant', [tenant.id])[tenant.id]
+        project_quotas = quotas.get_quotas(db.session, 'project', [project.id for project in projects])
+        
+        return jsonify({
+            'tenant': tenant_quota,
+            'projects': [
+                {
+                    'project_id': project.id,
+                    'project_name': project.project_name,
+                    'project_code': project.project_code,
+                    'quota': project_quotas[project.id],
+                }
+                for project in projects
+            ]
+        })
+        
+    except Exception as e:
+        logger.error(f"Get quotas error: {str(e)}")
+        return jsonify({'error': '获取配额失败'}), 500
+
+@bp.route('/api/admin/quotas/<scope>/<int:scope_id>', methods=['PUT'])
+@admin_required
+def update_quota(current_user, scope, scope_id):
+    """修改租户或项目的限额，请求体为 {资源: 限额}，null或0表示不限"""
+    if scope not in quotas.SCOPES:
+        return jsonify({'error': '无效的配额范围'}), 400
+    model = Tenant if scope == 'tenant' else Project
+    if db.session.get(model, scope_id) is None:
+        return jsonify({'error': '配额对象不存在'}), 404
+    
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': '请求数据格式错误'}), 400
+    
+    try:
+        quotas.set_limits(db.session, scope, scope_id, data)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': f'配额设置无效: {str(e)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Update quota error: {str(e)}")
+        return jsonify({'error': '修改配额失败'}), 500
+    
+    logger.info(f"Quota for {scope} {scope_id} updated by {current_user['username']}: {data}")
+    return jsonify(quotas.get_quotas(db.session, scope, [scope_id])[scope_id])
+
+@bp.route('/api/projects')
+@token_required
+def list_projects(current_user):
+    """获取项目列表"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        projects = Project.query.filter_by(tenant_id=tenant.id, is_active=True).order_by(Project.created_at.desc()).all()
+        
+        project_list = []
+        for project in projects:
+            vm_count = VirtualMachine.query.filter_by(project_id=project.id).count()
+            project_data = {
+                'id': project.id,
+                'project_name': project.project_name,
+                'project_code': project.project_code,
+                'description': project.description,
+                'vm_count': vm_count,
+                'created_at': project.created_at.isoformat(),
+                'updated_at': project.updated_at.isoformat()
+            }
+            project_list.append(project_data)
+        
+        return jsonify({'projects': project_list})
+        
+    except Exception as e:
+        logger.error(f"List projects error: {str(e)}")
+        return jsonify({'error': '获取项目列表失败'}), 500
+
+@bp.route('/api/projects', methods=['POST'])
+@token_required
+def create_project(current_user):
+    """创建项目"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求数据格式错误'}), 400
+        
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        project_name = data.get('project_name', '').strip()
+        project_code = data.get('project_code', '').strip()
+        
+        if not project_name or not project_code:
+            return jsonify({'error': '项目名称和编号不能为空'}), 400
+        
+        # 检查项目编号是否重复
+        existing = Project.query.filter_by(project_code=project_code).first()
+        if existing:
+            return jsonify({'error': '项目编号已存在'}), 400
+        
+        project = Project(
+            project_name=project_name,
+            project_code=project_code,
+            tenant_id=tenant.id,
+            description=data.get('description', '')
+        )
+        
+        db.session.add(project)
+        db.session.commit()
+        
+        logger.info(f"Project created: {project.project_code} by {current_user['username']}")
+        
+        return jsonify({
+            'success': True,
+            'project': {
+                'id': project.id,
+                'project_name': project.project_name,
+                'project_code': project.project_code,
+                'description': project.description
+            }
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Create project error: {str(e)}")
+        return jsonify({'error': '创建项目失败'}), 500
+
+def _billing_date_filters(args):
+    """解析 start_date/end_date 为日期条件，使分区表可在规划阶段裁剪分区"""
+    filters = []
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    if start_date:
+        filters.append(BillingRecord.billing_date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        filters.append(BillingRecord.billing_date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    return filters
+
+@bp.route('/api/billing/summary')
+@token_required
+def billing_summary(current_user):
+    """计费摘要统计"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        # 获取查询参数
+        project_id = request.args.get('project_id', type=int)
+        try:
+            date_filters = _billing_date_filters(request.args)
+        except ValueError:
+            return jsonify({'error': '时间格式错误'}), 400
+        
+        # 构建查询
+        query = BillingRecord.query.filter_by(tenant_id=tenant.id).filter(*date_filters)
+        
+        if project_id:
+            query = query.filter_by(project_id=project_id)
+        
+        records = query.all()
+        
+        # 计算总计
+        total_cost = sum(float(record.total_cost) for record in records)
+        record_count = len(records)
+        
+        # 按项目统计
+        project_stats = {}
+        for record in records:
+            key = f"{record.project_id}_{record.project.project_code}"
+            if key not in project_stats:
+                project_stats[key] = {
+                    'project_id': record.project_id,
+                    'project_name': record.project.project_name,
+                    'project_code': record.project.project_code,
+                    'vm_count': 0,
+                    'cpu_cost': 0,
+                    'memory_cost': 0,
+                    'disk_cost': 0,
+                    'gpu_cost': 0,
+                    'total_cost': 0
+                }
+            
+            stats = project_stats[key]
+            stats['vm_count'] += 1
+            stats['cpu_cost'] += float(record.cpu_cost)
+            stats['memory_cost'] += float(record.memory_cost)
+            stats['disk_cost'] += float(record.disk_cost)
+            stats['gpu_cost'] += float(record.gpu_cost)
+            stats['total_cost'] += float(record.total_cost)
+        
+        return jsonify({
+            'total_cost': total_cost,
+            'record_count': record_count,
+            'project_stats': project_stats
+        })
+        
+    except Exception as e:
+        logger.error(f"Billing summary error: {str(e)}")
+        return jsonify({'error': '获取计费摘要失败'}), 500
+
+BILLING_DETAILS_MAX_PER_PAGE = 200
+
+def _encode_billing_cursor(billing_date, record_id):
+    """编码keyset分页游标"""
+    raw = f"{billing_date.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_billing_cursor(cursor):
+    """解码keyset分页游标，格式错误时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        date_part, id_part = raw.split('|', 1)
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+
+def _estimate_count(count_stmt):
+    """通过PostgreSQL查询计划估算行数，不支持时返回None"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    try:
+        compiled = count_stmt.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        # COUNT聚合节点之下的扫描节点给出满足条件的行数估计，并行扫描按进程数放大
+        node = plan[0]['Plan']
+        workers = 0
+        while node.get('Plans') and node.get('Node Type') in ('Aggregate', 'Gather'):
+            workers = max(workers, node.get('Workers Planned', 0))
+            node = node['Plans'][0]
+        return int(node['Plan Rows']) * (workers + 1)
+    except Exception as e:
+        logger.warning(f"Count estimate failed: {str(e)}")
+        return None
+
+@bp.route('/api/billing/details')
+@token_required
+def billing_details(current_user):
+    """计费详细记录"""
+    try:
+        tenant = Tenant.query.filter_by(username=current_user['username']).first()
+        if not tenant:
+            return jsonify({'error': '用户信息不存在'}), 404
+        
+        # 分页参数
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), BILLING_DETAILS_MAX_PER_PAGE)
+        project_id = request.args.get('project_id', type=int)
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        cursor = request.args.get('cursor')
+        
+        try:
+            filters = [BillingRecord.tenant_id == tenant.id] + _billing_date_filters(request.args)
+        except ValueError:
+            return jsonify({'error': '时间格式错误'}), 400
+        if project_id:
+            filters.append(BillingRecord.project_id == project_id)
+        
+        # 直接按列查询Row元组，项目信息一次join取回
+        stmt = (
+            select(*BILLING_DETAIL_COLUMNS)
+            .join(Project, Project.id == BillingRecord.project_id)
+            .where(*filters)
+        )
+        
+        # keyset分页: 按 (billing_date, id) 倒序，从游标位置之后继续
+        if cursor:
+            try:
+                cursor_date, cursor_id = _decode_billing_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': '无效的分页游标'}), 400
+            # 行值比较无法用于分区裁剪，额外加上单列日期条件
+            stmt = stmt.where(
+                BillingRecord.billing_date <= cursor_date,
+                tuple_(BillingRecord.billing_date, BillingRecord.id) < tuple_(cursor_date, cursor_id)
+            )
+        
+        stmt = stmt.order_by(BillingRecord.billing_date.desc(), BillingRecord.id.desc()).limit(per_page + 1)
+        
+        records = [row._asdict() for row in db.session.execute(stmt)]
+        has_next = len(records) > per_page
+        records = records[:per_page]
+        
+        next_cursor = None
+        if has_next:
+            last = records[-1]
+            next_cursor = _encode_billing_cursor(last['billing_date'], last['id'])
+        
+        # 总数: 显式请求时精确COUNT，否则使用查询计划估算
+        count_stmt = select(func.count()).select_from(BillingRecord).where(*filters)
+        total = None if include_total else _estimate_count(count_stmt)
+        total_is_estimate = total is not None
+        if total is None:
+            total = db.session.execute(count_stmt).scalar()
+        
+        return jsonify({
+            'records': records,
+            'pagination': {
+                'per_page': per_page,
+                'total': total,
+                'total_is_estimate': total_is_estimate,
+                'next_cursor': next_cursor,
+                'has_next': has_next,
+                'has_prev': bool(cursor)
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Billing details error: {str(e)}")
+        return jsonify({'error': '获取计费详情失败'}), 500
+
+def _iter_billing_export(stmt, fmt, batch_size, json_dumps):
+    """通过服务端游标逐批读取计费记录并编码为CSV/NDJSON文本块"""
+    columns = [column.key for column in BILLING_EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    
+    if writer:
+        writer.writerow(columns)
+    
+    with (db_router.read_engine() or db.engine).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for partition in result.partitions():
+            if writer:
+                writer.writerows(partition)
+            else:
+                for row in partition:
+                    buffer.write(json_dumps(row._asdict()))
+                    buffer.write('\n')
+            
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def _gzip_stream(chunks):
+    """对输出块进行流式gzip压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@bp.route('/api/billing/export')
+@token_required
+def billing_export(current_user):
+    """流式导出计费记录 (CSV/NDJSON)"""
+    try:
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': '不支持的导出格式'}), 400
+        
+        project_id = request.args.get('project_id', type=int)
+        all_tenants = request.args.get('all_tenants', 'false').lower() == 'true'
+        
+        stmt = select(*BILLING_EXPORT_COLUMNS).join(Project, Project.id == BillingRecord.project_id)
+        
+        # 管理员可导出全部租户，普通用户仅限本租户
+        if all_tenants:
+            if not is_admin(current_user):
+                return jsonify({'error': '需要管理员权限'}), 403
+        else:
+            tenant = Tenant.query.filter_by(username=current_user['username']).first()
+            if not tenant:
+                return jsonify({'error': '用户信息不存在'}), 404
+            stmt = stmt.where(BillingRecord.tenant_id == tenant.id)
+        
+        try:
+            stmt = stmt.where(*_billing_date_filters(request.args))
+        except ValueError:
+            return jsonify({'error': '时间格式错误'}), 400
+        if project_id:
+            stmt = stmt.where(BillingRecord.project_id == project_id)
+        
+        stmt = stmt.order_by(BillingRecord.billing_date, BillingRecord.id)
+        
+        chunks = _iter_billing_export(
+            stmt, fmt, current_app.config['BILLING_EXPORT_BATCH_SIZE'], current_app.json.dumps
+        )
+        
+        headers = {
+            'Content-Disposition': f'attachment; filename=billing_export.{fmt}',
+            'X-Accel-Buffering': 'no',
+            'Vary': 'Accept-Encoding'
+        }
+        if 'gzip' in request.headers.get('Accept-Encoding', '').lower():
+            chunks = _gzip_stream(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        logger.info(f"Billing export started: format={fmt} all_tenants={all_tenants} by {current_user['username']}")
+        
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+        
+    except Exception as e:
+        logger.error(f"Billing export error: {str(e)}")
+        return jsonify({'error': '导出计费记录失败'}), 500
+
+@bp.route('/api/metrics')
+def metrics():
+    """Prometheus监控指标"""
+    try:
+        body, content_type = metrics_exporter.render()
+        return body, 200, {'Content-Type': content_type}
+    except Exception as e:
+        logger.error(f"Metrics error: {str(e)}")
+        return "# Error generating metrics\n", 500, {'Content-Type': 'text/plain'}
+
+@bp.route('/api/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def profiling_settings(current_user):
+    """查看或修改请求剖析配置（仅作用于当前进程）"""
+    if request.method == 'GET':
+        return jsonify(request_profiler.status())
+    
+    data = request.get_json() or {}
+    try:
+        status = request_profiler.configure(
+            enabled=data.get('enabled'),
+            sample_rate=data.get('sample_rate'),
+            mode=data.get('mode'),
+            interval_ms=data.get('interval_ms'),
+            route_prefix=data.get('route_prefix')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'剖析配置无效: {str(e)}'}), 400
+    
+    logger.info(f"Profiling settings updated by {current_user['username']}: {status}")
+    return jsonify(status)
+
+@bp.route('/api/admin/profiles')
+@admin_required
+def list_request_profiles(current_user):
+    """列出最近的请求剖析结果"""
+    return jsonify({'profiles': request_profiler.list_profiles()})
+
+@bp.route('/api/admin/profiles/<int:profile_id>')
+@admin_required
+def get_request_profile(current_user, profile_id):
+    """导出单个剖析结果: format=speedscope（默认）或 collapsed"""
+    profile = request_profiler.get_profile(profile_id)
+    if not profile:
+        return jsonify({'error': '剖析结果不存在'}), 404
+    
+    if request.args.get('format', 'speedscope') == 'collapsed':
+        return request_profiler.to_collapsed(profile), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(request_profiler.to_speedscope(profile))
+
+# 错误处理
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'API接口不存在'}), 404
+    return send_from_directory('static', 'error.html'), 404
+
+@bp.app_errorhandler(500)
+def internal_error(error):
+    db.session.rollback()
+    if request.path.startswith('/api/'):
+        return jsonify({'error': '服务器内部错误'}), 500
+    return send_from_directory('static', 'error.html'), 500
+
+@bp.app_errorhandler(403)
+def forbidden_error(error):
+    return jsonify({'error': '权限不足'}), 403
@@ -737,18 +737,12 @@ function renderBillingSummary(data) {
     summaryEl.innerHTML = html;
 }
 
+// keyset分页游标栈: billingCursors[i] 为第 i+1 页的起始游标
+let billingCursors = [null];
+
 async function loadBillingDetails() {
-    const projectId = document.getElementById('billing-project-filter').value;
-    let url = '/billing/details';
-    
-    if (projectId) {
-        url += `?project_id=${projectId}`;
-    }
-    
-    const data = await apiRequest(url);
-    if (data) {
-        renderBillingDetails(data);
-    }
+    billingCursors = [null];
+    await loadBillingPage(0);
 }
 
 function renderBillingDetails(data) {
@@ -795,7 +789,7 @@ function renderBillingDetails(data) {
         </div>
     `;
     
-    if (data.pagination.pages > 1) {
+    if (data.pagination.has_next || data.pagination.has_prev) {
         html += renderPagination(data.pagination);
     }
     
@@ -804,31 +798,41 @@ function renderBillingDetails(data) {
 
 function renderPagination(pagination) {
     let html = '<div class="pagination">';
+    const pageIndex = billingCursors.length - 2;
+    const pages = Math.max(1, Math.ceil(pagination.total / pagination.per_page));
     
     if (pagination.has_prev) {
-        html += `<button class="btn btn-primary" onclick="loadBillingPage(${pagination.page - 1})">上一页</button>`;
+        html += `<button class="btn btn-primary" onclick="loadBillingPage(${pageIndex - 1})">上一页</button>`;
     }
     
-    html += `<span>第 ${pagination.page} 页，共 ${pagination.pages} 页</span>`;
+    html += `<span>第 ${pageIndex + 1} 页，共 ${pagination.total_is_estimate ? '约 ' : ''}${pages} 页</span>`;
     
     if (pagination.has_next) {
-        html += `<button class="btn btn-primary" onclick="loadBillingPage(${pagination.page + 1})">下一页</button>`;
+        html += `<button class="btn btn-primary" onclick="loadBillingPage(${pageIndex + 1})">下一页</button>`;
     }
     
     html += '</div>';
     return html;
 }
 
-async function loadBillingPage(page) {
+async function loadBillingPage(pageIndex) {
     const projectId = document.getElementById('billing-project-filter').value;
-    let url = `/billing/details?page=${page}`;
+    const params = new URLSearchParams();
+    const cursor = billingCursors[pageIndex];
     
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
     if (projectId) {
-        url += `&project_id=${projectId}`;
+        params.set('project_id', projectId);
     }
     
-    const data = await apiRequest(url);
+    const query = params.toString();
+    const data = await apiRequest(`/billing/details${query ? '?' + query : ''}`);
     if (data) {
+        // 截断到当前页并记录下一页游标
+        billingCursors = billingCursors.slice(0, pageIndex + 1);
+        billingCursors.push(data.pagination.next_cursor);
         renderBillingDetails(data);
     }
 }
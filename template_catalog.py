@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 虚拟机模板目录
+vm_templates 保存从虚拟化平台发现的模板及其规格；每个worker在内存中缓存启用的模板
+（含序列化好的响应体与ETag），/api/templates 与创建虚拟机时的规格校验只读缓存。
+后台线程定期从数据库重载缓存；发现（调用驱动）由持有advisory锁的一个worker按间隔执行
+"""
+
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, DateTime
+
+from background import start_per_process
+from hypervisor import get_driver
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'vm_templates'
+
+FIELDS = ('display_name', 'os_type', 'guest_os', 'min_cpu_cores', 'min_memory_gb', 'disk_gb')
+
+UPSERT_SQL = text(f"""
+INSERT INTO {TABLE_NAME} (name, {', '.join(FIELDS)}, is_active, discovered_at, updated_at)
+VALUES (:name, {', '.join(f':{f}' for f in FIELDS)}, true, :now, :now)
+ON CONFLICT (name) DO UPDATE SET
+    {', '.join(f'{f} = EXCLUDED.{f}' for f in FIELDS)},
+    is_active = true, discovered_at = EXCLUDED.discovered_at,
+    updated_at = CASE
+        WHEN ({', '.join(f'{TABLE_NAME}.{f}' for f in FIELDS)}, {TABLE_NAME}.is_active)
+             IS DISTINCT FROM ({', '.join(f'EXCLUDED.{f}' for f in FIELDS)}, true)
+        THEN EXCLUDED.updated_at ELSE {TABLE_NAME}.updated_at END
+""")
+
+DEACTIVATE_SQL = text(f"""
+UPDATE {TABLE_NAME} SET is_active = false, updated_at = :now
+WHERE is_active AND discovered_at < :now
+""")
+
+ACTIVE_SQL = text(f"""
+SELECT name, {', '.join(FIELDS)} FROM {TABLE_NAME} WHERE is_active ORDER BY name
+""")
+
+# 多个worker同时到期时只有一个执行发现，其余跳过（仅PostgreSQL；SQLite为单进程，到期即执行）
+DISCOVERY_LOCK_SQL = text(f"SELECT pg_try_advisory_xact_lock(hashtext('{TABLE_NAME}'))")
+LAST_DISCOVERY_SQL = text(f"SELECT max(discovered_at) AS discovered_at FROM {TABLE_NAME}").columns(
+    discovered_at=DateTime)
+
+
+def sync_templates(session, driver):
+    """从驱动发现模板并写入数据库，未再出现的模板停用；返回 (发现数, 停用数)
+
+    驱动返回空列表时不停用任何模板（多为权限或目录配置问题，避免清空目录）
+    """
+    templates = driver.list_templates()
+    now = datetime.utcnow()
+    for template in templates:
+        session.execute(UPSERT_SQL, dict({f: template.get(f) for f in FIELDS}, name=template['name'], now=now))
+    deactivated = 0
+    if templates:
+        deactivated = session.execute(DEACTIVATE_SQL, {'now': now}).rowcount
+    else:
+        logger.warning(f"Template discovery via {driver.name} returned no templates, catalog left unchanged")
+    session.commit()
+    return len(templates), deactivated
+
+
+class TemplateCatalog:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.cache = None
+        self._driver = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.refresh_interval = app.config.get('TEMPLATE_REFRESH_INTERVAL', 60)
+        self.discovery_interval = app.config.get('TEMPLATE_DISCOVERY_INTERVAL', 300)
+        app.extensions['template_catalog'] = self
+        # 启动时加载缓存（预加载时fork出的worker直接继承），首个请求不必查库
+        self._warm()
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = get_driver(self.app.config)
+        return self._driver
+
+    def load(self):
+        """从数据库重载启用的模板并原子替换缓存"""
+        with self.app.app_context():
+            with self.db.engine.connect() as conn:
+                rows = conn.execute(ACTIVE_SQL).all()
+        self._set_cache([dict(row._mapping) for row in rows])
+
+    def _set_cache(self, templates):
+        body = json.dumps({'templates': templates}, ensure_ascii=False).encode('utf-8')
+        self.cache = {
+            'templates': {template['name']: template for template in templates},
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+        }
+
+    def discover(self, force=False):
+        """到期（或force）且取得advisory锁时调用驱动同步模板，返回是否执行了发现"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                if self.db.engine.dialect.name == 'postgresql' and \
+                        not session.execute(DISCOVERY_LOCK_SQL).scalar():
+                    return False
+                last = session.execute(LAST_DISCOVERY_SQL).scalar()
+                if not force and last and datetime.utcnow() - last < timedelta(seconds=self.discovery_interval):
+                    return False
+                found, deactivated = sync_templates(session, self.driver)
+                logger.info(f"Template discovery via {self.driver.name}: {found} found, {deactivated} deactivated")
+                return True
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.remove()
+
+    def _refresh(self, force=False):
+        try:
+            self.discover(force)
+        except Exception as e:
+            logger.error(f"Template discovery error: {str(e)}")
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Template cache refresh error: {str(e)}")
+
+    def _refresh_loop(self):
+        if not self.cache['templates']:
+            # 首次启动目录为空时立即发现一次（在后台线程中，请求不等待虚拟化平台）
+            self._refresh(force=True)
+        while True:
+            time.sleep(self.refresh_interval)
+            self._refresh()
+
+    def _warm(self):
+        """目录为空时从数据库加载；数据库不可用时使用空目录（不校验规格），由刷新线程重试"""
+        if self.cache is not None and self.cache['templates']:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Template cache load error: {str(e)}")
+            if self.cache is None:
+                self._set_cache([])
+
+    def _ensure_started(self):
+        """加载缓存并启动刷新线程"""
+        start_per_process(self._refresh_loop, 'template-refresh', setup=self._warm)
+
+    def snapshot(self):
+        self._ensure_started()
+        return self.cache
+
+    def get(self, name):
+        return self.snapshot()['templates'].get(name)
+
+    def validate(self, name, cpu_cores, memory_gb, disk_gb, clone_mode=None):
+        """按模板最低规格校验，返回错误信息；目录为空（尚未发现）时不校验
+
+        即时克隆继承基础虚拟机（即模板）的CPU与内存，请求的规格必须与模板一致
+        """
+        templates = self.snapshot()['templates']
+        if not templates:
+            return None
+        template = templates.get(name)
+        if template is None:
+            return f'模板不存在: {name}'
+        if cpu_cores < (template['min_cpu_cores'] or 0):
+            return f"模板 {name} 至少需要 {template['min_cpu_cores']} 核CPU"
+        if memory_gb < (template['min_memory_gb'] or 0):
+            return f"模板 {name} 至少需要 {template['min_memory_gb']}GB 内存"
+        if disk_gb < (template['disk_gb'] or 0):
+            return f"模板 {name} 的系统盘为 {template['disk_gb']}GB，磁盘不能小于该值"
+        if clone_mode == 'instant' and (cpu_cores, memory_gb) != (template['min_cpu_cores'], template['min_memory_gb']):
+            return (f"即时克隆的规格与模板 {name} 相同（{template['min_cpu_cores']}核CPU / "
+                    f"{template['min_memory_gb']}GB 内存），其他规格请使用完整或链接克隆")
+        return None
+
+
+# 全局实例
+template_catalog = TemplateCatalog()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS template catalog')
+    parser.add_argument('--sync', action='store_true', help='Discover templates from the hypervisor driver now')
+    parser.add_argument('--list', action='store_true', help='List active templates')
+    args = parser.parse_args()
+
+    from models import create_db_app, db
+
+    app = create_db_app()
+    with app.app_context():
+        if args.sync:
+            driver = get_driver(app.config)
+            try:
+                found, deactivated = sync_templates(db.session, driver)
+            except Exception as e:
+                print(f"❌ Template discovery via {driver.name} failed: {str(e)}")
+                raise SystemExit(1)
+            print(f"✅ {found} templates discovered via {driver.name}, {deactivated} deactivated")
+        elif args.list:
+            print(f"{'Name':<32} {'OS':<8} {'Min CPU':>7} {'Min GB':>6} {'Disk GB':>7}")
+            for row in db.session.execute(ACTIVE_SQL):
+                print(f"{row.name:<32} {row.os_type or '-':<8} {row.min_cpu_cores or '-':>7} "
+                      f"{row.min_memory_gb or '-':>6} {row.disk_gb or '-':>7}")
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试夹具
+放置、配额与预热池依赖PostgreSQL的条件UPDATE、行锁与 FOR UPDATE SKIP LOCKED，这些测试连接真实数据库：
+TEST_DATABASE_URL 指向一个专用库（每个测试前清空相关表），未设置时跳过。
+
+  createdb vmware_iaas_test
+  TEST_DATABASE_URL=postgresql://postgres@127.0.0.1:5432/vmware_iaas_test python -m pytest -q tests
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+# 每个测试前清空；ip_pools/virtual_machines 等由各测试自行插入所需数据
+TABLES = ('warm_pool_vms', 'vm_provisions', 'virtual_machines', 'ip_pools', 'projects', 'tenants',
+          'resource_quotas', 'gpu_inventory', 'host_inventory', 'vm_templates')
+
+
+class IntegrationConfig(Config):
+    SQLALCHEMY_DATABASE_URI = TEST_DATABASE_URL
+    # 并发测试每个线程占用一个连接
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 40, 'max_overflow': 0}
+    HOST_PLACEMENT_POLICY = 'spread'
+    HOST_CPU_OVERCOMMIT = 1.0
+    GPU_PLACEMENT_POLICY = 'best_fit'
+    QUOTA_TENANT_DEFAULTS = {}
+    QUOTA_PROJECT_DEFAULTS = {}
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not TEST_DATABASE_URL.startswith('postgresql'):
+        pytest.skip('TEST_DATABASE_URL (PostgreSQL) not set')
+    import billing_partitions
+    from models import create_db_app, db
+
+    app = create_db_app(IntegrationConfig)
+    with app.app_context():
+        billing_partitions.create_tables(db)
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from sqlalchemy import text
+    from models import db
+
+    with app.app_context():
+        db.session.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+        db.session.commit()
+        yield db
+        db.session.remove()
+
+
+def run_concurrently(app, count, work):
+    """count个线程各自在独立的应用上下文（独立会话与连接）中同时执行 work(session)，
+    work返回后提交、抛出异常时回滚；返回各线程的结果（异常对象原样返回）"""
+    from models import db
+
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        with app.app_context():
+            try:
+                barrier.wait()
+                results[i] = work(db.session)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                results[i] = e
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not any(thread.is_alive() for thread in threads), 'concurrent workers did not finish'
+    return results
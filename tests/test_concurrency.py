@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""并发占用：N个请求同时争抢只够K个的配额/主机容量/GPU卡槽/预热虚拟机时恰好K个成功"""
+
+import itertools
+from datetime import datetime
+
+from sqlalchemy import text
+
+import quotas
+from conftest import run_concurrently
+from gpu_placement import GpuScheduler, NoGpuCapacity
+from host_placement import HostScheduler, NoHostCapacity
+from models import GpuInventory, HostInventory, WarmPoolVm
+from warm_pool import WarmPool, parse_shapes
+
+REQUESTS = 12
+
+
+def split(results, error):
+    """按结果类型分成成功与预期的失败，出现其他异常时直接失败"""
+    unexpected = [r for r in results if isinstance(r, Exception) and not isinstance(r, error)]
+    assert not unexpected, unexpected
+    return [r for r in results if not isinstance(r, Exception)], [r for r in results if isinstance(r, error)]
+
+
+def test_concurrent_quota_reservations_stop_at_limit(app, db):
+    quotas.set_limits(db.session, 'project', 1, {'vms': 5})
+    db.session.commit()
+
+    results = run_concurrently(app, REQUESTS, lambda session: quotas.reserve(
+        session, 1, 1, quotas.vm_usage(2, 4, 50, 0)))
+
+    succeeded, rejected = split(results, quotas.QuotaExceeded)
+    assert len(succeeded) == 5
+    assert len(rejected) == REQUESTS - 5
+    used = quotas.get_quotas(db.session, 'project', [1])[1]
+    assert used['vms']['used'] == 5
+    assert used['cpu_cores']['used'] == 10
+    # 租户不限额，只计入成功的5台
+    assert quotas.get_quotas(db.session, 'tenant', [1])[1]['vms']['used'] == 5
+
+
+def test_concurrent_host_placements_stop_at_capacity(app, db):
+    db.session.add(HostInventory(host_name='esx-1', cpu_cores=16, memory_gb=256, disk_gb=2000))
+    db.session.commit()
+    # 两个调度器模拟两个worker进程各自的索引：互相看不到对方的预占，只能靠条件UPDATE保证不超占
+    schedulers = [HostScheduler(app, db), HostScheduler(app, db)]
+    pick = itertools.count()
+
+    results = run_concurrently(app, REQUESTS, lambda session: schedulers[next(pick) % 2].place(
+        session, 4, 16, 100))
+
+    succeeded, rejected = split(results, NoHostCapacity)
+    assert succeeded == ['esx-1'] * 4
+    assert len(rejected) == REQUESTS - 4
+    cpu_used, memory_used = db.session.execute(text(
+        "SELECT cpu_used, memory_used FROM host_inventory WHERE host_name = 'esx-1'")).one()
+    assert (cpu_used, memory_used) == (16, 64)
+
+
+def test_concurrent_gpu_placements_stop_at_free_slots(app, db):
+    db.session.add(GpuInventory(host_name='gpu-1', gpu_type='a100', total_slots=4, used_slots=0))
+    db.session.add(GpuInventory(host_name='gpu-2', gpu_type='a100', total_slots=2, used_slots=1))
+    db.session.commit()
+    schedulers = [GpuScheduler(app, db), GpuScheduler(app, db)]
+    pick = itertools.count()
+
+    results = run_concurrently(app, REQUESTS, lambda session: schedulers[next(pick) % 2].place(
+        session, 'a100', 1))
+
+    succeeded, rejected = split(results, NoGpuCapacity)
+    assert sorted(succeeded) == ['gpu-1'] * 4 + ['gpu-2']
+    assert len(rejected) == REQUESTS - 5
+    used = dict(db.session.execute(text("SELECT host_name, used_slots FROM gpu_inventory")).all())
+    assert used == {'gpu-1': 4, 'gpu-2': 2}
+
+
+def test_concurrent_warm_claims_take_distinct_vms(app, db):
+    pool = WarmPool(app, db)
+    pool.shapes = parse_shapes('centos7:2:4:50:3')
+    now = datetime.utcnow()
+    for i in range(3):
+        db.session.add(WarmPoolVm(name=f'warm-{i}', template_name='centos7', cpu_cores=2, memory_gb=4,
+                                  disk_gb=50, clone_mode='full', status='ready', host_name='esx-1',
+                                  ip_address=f'10.0.0.{i + 1}', ready_at=now))
+    db.session.commit()
+
+    results = run_concurrently(app, REQUESTS, lambda session: pool.claim(session, 'centos7', 2, 4, 50))
+
+    assert not [r for r in results if isinstance(r, Exception)], results
+    ids = [row.id for row in results if row is not None]
+    assert sorted(ids) == [1, 2, 3]
+    assert results.count(None) == REQUESTS - 3
+    statuses = db.session.execute(text("SELECT DISTINCT status FROM warm_pool_vms")).scalars().all()
+    assert statuses == ['claimed']
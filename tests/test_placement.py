@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""放置调度：GPU主机资源不足时换下一台、预热领用计入项目亲和"""
+
+import pytest
+from sqlalchemy import text
+
+from gpu_placement import GpuScheduler
+from host_placement import HostScheduler, NoHostCapacity
+from models import GpuInventory, HostInventory
+
+
+@pytest.fixture
+def schedulers(app, db):
+    return HostScheduler(app, db), GpuScheduler(app, db)
+
+
+def add_gpu_host(db, host, total_slots, used_slots, cpu_cores, cpu_used):
+    db.session.add(GpuInventory(host_name=host, gpu_type='a100', total_slots=total_slots, used_slots=used_slots))
+    db.session.add(HostInventory(host_name=host, cpu_cores=cpu_cores, memory_gb=256, disk_gb=2000,
+                                 cpu_used=cpu_used))
+    db.session.commit()
+
+
+def usage(db, host):
+    return db.session.execute(text(
+        "SELECT g.used_slots, h.cpu_used FROM gpu_inventory g JOIN host_inventory h USING (host_name) "
+        "WHERE host_name = :host"), {'host': host}).one()
+
+
+def test_gpu_vm_moves_to_next_gpu_host_when_first_is_full_on_cpu(db, schedulers):
+    host_scheduler, gpu_scheduler = schedulers
+    # best_fit 先选空闲卡槽最少的 gpu-1，但它的CPU已用满
+    add_gpu_host(db, 'gpu-1', total_slots=4, used_slots=2, cpu_cores=16, cpu_used=16)
+    add_gpu_host(db, 'gpu-2', total_slots=4, used_slots=0, cpu_cores=16, cpu_used=0)
+
+    host = host_scheduler.place_gpu(db.session, gpu_scheduler, 'a100', 2, 8, 64, 100)
+    db.session.commit()
+
+    assert host == 'gpu-2'
+    assert tuple(usage(db, 'gpu-1')) == (2, 16)
+    assert tuple(usage(db, 'gpu-2')) == (2, 8)
+    assert gpu_scheduler.index.pools['a100'].free == {'gpu-1': 2, 'gpu-2': 2}
+
+
+def test_gpu_vm_rejected_when_no_gpu_host_has_room(db, schedulers):
+    host_scheduler, gpu_scheduler = schedulers
+    add_gpu_host(db, 'gpu-1', total_slots=4, used_slots=0, cpu_cores=16, cpu_used=16)
+    add_gpu_host(db, 'gpu-2', total_slots=4, used_slots=0, cpu_cores=16, cpu_used=12)
+
+    with pytest.raises(NoHostCapacity):
+        host_scheduler.place_gpu(db.session, gpu_scheduler, 'a100', 2, 8, 64, 100)
+    db.session.rollback()
+
+    assert tuple(usage(db, 'gpu-1')) == (0, 16)
+    assert tuple(usage(db, 'gpu-2')) == (0, 12)
+    assert gpu_scheduler.index.pools['a100'].free == {'gpu-1': 4, 'gpu-2': 4}
+
+
+def test_warm_claimed_host_counts_for_project_affinity(db, schedulers):
+    host_scheduler, _ = schedulers
+    for host in ('esx-1', 'esx-2'):
+        db.session.add(HostInventory(host_name=host, cpu_cores=16, memory_gb=256, disk_gb=2000))
+    db.session.commit()
+
+    host_scheduler.attribute(db.session, 'esx-2', 7)
+    db.session.rollback()
+    assert host_scheduler.index.project_hosts.get(7, {}) == {}
+
+    host_scheduler.attribute(db.session, 'esx-2', 7)
+    db.session.commit()
+    assert host_scheduler.index.project_hosts[7] == {'esx-2': 1}
+    host_scheduler.index.policy = 'affinity'
+    assert host_scheduler.index.choose(2, 4, 50, project_id=7) == 'esx-2'
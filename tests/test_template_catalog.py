@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+"""模板目录：启动时加载缓存，数据库不可用时返回空目录而不是报错"""
+
+from sqlalchemy import text
+
+import template_catalog
+from models import VmTemplate
+from template_catalog import TemplateCatalog
+
+
+def test_catalog_loaded_at_startup(app, db):
+    db.session.add(VmTemplate(name='centos7', os_type='Linux', min_cpu_cores=2, min_memory_gb=4, disk_gb=50))
+    db.session.commit()
+
+    catalog = TemplateCatalog(app, db)
+
+    assert list(catalog.cache['templates']) == ['centos7']
+    assert catalog.cache['templates']['centos7']['min_cpu_cores'] == 2
+
+
+def test_catalog_empty_when_database_unavailable(app, db, monkeypatch):
+    monkeypatch.setattr(template_catalog, 'ACTIVE_SQL', text("SELECT * FROM missing_vm_templates"))
+
+    catalog = TemplateCatalog(app, db)
+
+    assert catalog.cache['templates'] == {}
+    assert catalog.cache['body'] == b'{"templates": []}'
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VMware IaaS Platform - 虚拟机预热池
+按配置的规格（模板 + CPU/内存/磁盘）保持N台已克隆、已分配IP与主机容量、处于关机状态的虚拟机。
+创建虚拟机的规格与某个预热规格一致时，在同一事务内用 FOR UPDATE SKIP LOCKED 领用一台
+（并发请求各领一台互不等待），之后只需改名并开机（provisioning 中 clone_mode 记为 warm）。
+后台线程按间隔补充：持有advisory锁的一个worker登记待开通的虚拟机，再在线程池中克隆。仅支持PostgreSQL
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from background import start_per_process
+from hypervisor import CLONE_MODES
+from host_placement import host_scheduler, NoHostCapacity
+from provisioning import provisioner
+from template_catalog import template_catalog
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'warm_pool_vms'
+
+SHAPE_WHERE = "template_name = :template AND cpu_cores = :cpu AND memory_gb = :memory AND disk_gb = :disk"
+
+CLAIM_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = 'claimed', claimed_at = :now
+WHERE id = (
+    SELECT id FROM {TABLE_NAME} WHERE status = 'ready' AND {SHAPE_WHERE}
+    ORDER BY ready_at LIMIT 1 FOR UPDATE SKIP LOCKED
+)
+RETURNING id, host_name, ip_address, vcenter_vm_id, storage_gb
+""")
+
+LINK_SQL = text(f"UPDATE {TABLE_NAME} SET vm_id = :vm_id WHERE id = :id")
+
+LEVELS_SQL = text(f"""
+SELECT template_name, cpu_cores, memory_gb, disk_gb, status, count(*) FROM {TABLE_NAME}
+WHERE status IN ('provisioning', 'ready')
+GROUP BY template_name, cpu_cores, memory_gb, disk_gb, status
+""")
+
+INSERT_SQL = text(f"""
+INSERT INTO {TABLE_NAME} (name, template_name, cpu_cores, memory_gb, disk_gb, clone_mode, status,
+                          host_name, ip_address, created_at)
+VALUES ('', :template, :cpu, :memory, :disk, :clone_mode, 'provisioning', :host, :ip, :now)
+RETURNING id
+""")
+
+NAME_SQL = text(f"UPDATE {TABLE_NAME} SET name = :name WHERE id = :id")
+
+BUILD_SQL = text(f"""
+SELECT name, template_name, cpu_cores, memory_gb, disk_gb, clone_mode, host_name, created_at
+FROM {TABLE_NAME} WHERE id = :id AND status = 'provisioning'
+""")
+
+READY_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = 'ready', vcenter_vm_id = :vcenter_vm_id, storage_gb = :storage_gb,
+    provision_seconds = :provision_seconds, ready_at = :now
+WHERE id = :id AND status = 'provisioning'
+""")
+
+# 开通失败或超时：标记失败并返回占用的主机容量与IP
+FAIL_SQL = text(f"""
+UPDATE {TABLE_NAME} SET status = 'error', error = :error
+WHERE id = :id AND status = 'provisioning'
+RETURNING host_name, ip_address, cpu_cores, memory_gb, disk_gb
+""")
+
+EXPIRED_SQL = text(f"""
+SELECT id FROM {TABLE_NAME} WHERE status = 'provisioning' AND created_at < :before
+""")
+
+IP_CLAIM_SQL = text("""
+UPDATE ip_pools SET is_available = false, assigned_at = :now
+WHERE id = (SELECT id FROM ip_pools WHERE is_available ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED)
+RETURNING ip_address
+""")
+
+IP_RELEASE_SQL = text("""
+UPDATE ip_pools SET is_available = true, assigned_vm_id = NULL, assigned_at = NULL WHERE ip_address = :ip
+""")
+
+# 多个worker同时到期时只有一个登记补充，其余跳过
+REFILL_LOCK_SQL = text(f"SELECT pg_try_advisory_xact_lock(hashtext('{TABLE_NAME}'))")
+
+# 按规格统计领用情况：预热命中（warm）与冷创建的次数及开通耗时
+HIT_RATE_SQL = text(f"""
+SELECT count(*) FILTER (WHERE p.clone_mode = 'warm') AS hits,
+       count(*) FILTER (WHERE p.clone_mode <> 'warm') AS misses,
+       avg(p.provision_seconds) FILTER (WHERE p.clone_mode = 'warm') AS warm_seconds_avg,
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY p.provision_seconds)
+           FILTER (WHERE p.clone_mode = 'warm') AS warm_seconds_p95,
+       avg(p.provision_seconds) FILTER (WHERE p.clone_mode <> 'warm') AS cold_seconds_avg,
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY p.provision_seconds)
+           FILTER (WHERE p.clone_mode <> 'warm') AS cold_seconds_p95
+FROM vm_provisions p JOIN virtual_machines v ON v.id = p.vm_id
+WHERE p.created_at >= :since AND coalesce(v.gpu_count, 0) = 0
+  AND v.template_name = :template AND v.cpu_cores = :cpu AND v.memory_gb = :memory AND v.disk_gb = :disk
+""")
+
+
+def parse_shapes(value):
+    """解析 WARM_POOL_SHAPES: 模板:CPU:内存GB:磁盘GB:数量，多个规格以逗号分隔"""
+    shapes = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        try:
+            template, cpu, memory, disk, size = item.rsplit(':', 4)
+            shapes.append({'template': template, 'cpu': int(cpu), 'memory': int(memory), 'disk': int(disk),
+                           'size': int(size)})
+        except ValueError:
+            raise ValueError(f"invalid WARM_POOL_SHAPES entry: {item}")
+    return shapes
+
+
+def shape_label(shape):
+    return f"{shape['template']}/{shape['cpu']}c{shape['memory']}g{shape['disk']}d"
+
+
+class WarmPool:
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.shapes = []
+        self._executor = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.shapes = parse_shapes(app.config.get('WARM_POOL_SHAPES', ''))
+        if self.shapes:
+            with app.app_context():
+                dialect = db.engine.dialect.name
+            if dialect != 'postgresql':
+                # 领用与补充依赖 FOR UPDATE SKIP LOCKED 与advisory锁
+                logger.warning(f"Warm pool disabled: requires PostgreSQL, database is {dialect}")
+                self.shapes = []
+        self.clone_mode = app.config.get('WARM_POOL_CLONE_MODE') or app.config.get('DEFAULT_CLONE_MODE', 'full')
+        if self.clone_mode not in CLONE_MODES:
+            raise ValueError(f"WARM_POOL_CLONE_MODE must be one of {CLONE_MODES}")
+        self.refill_interval = app.config.get('WARM_POOL_REFILL_INTERVAL', 30)
+        self.workers = app.config.get('WARM_POOL_WORKERS', 2)
+        self.timeout = app.config.get('PROVISION_TIMEOUT', 3600)
+        if self.shapes:
+            # 每个worker处理首个请求时开始补充
+            app.before_request(self._ensure_started)
+        app.extensions['warm_pool'] = self
+
+    def match(self, template_name, cpu_cores, memory_gb, disk_gb):
+        for shape in self.shapes:
+            if (shape['template'], shape['cpu'], shape['memory'], shape['disk']) == \
+                    (template_name, cpu_cores, memory_gb, disk_gb):
+                return shape
+        return None
+
+    def claim(self, session, template_name, cpu_cores, memory_gb, disk_gb):
+        """在当前事务内领用一台规格一致的就绪虚拟机，返回其记录（含主机、IP、vCenter ID），
+        规格不在预热池或池已空时返回None"""
+        shape = self.match(template_name, cpu_cores, memory_gb, disk_gb)
+        if shape is None:
+            return None
+        row = session.execute(CLAIM_SQL, {'template': template_name, 'cpu': cpu_cores, 'memory': memory_gb,
+                                          'disk': disk_gb, 'now': datetime.utcnow()}).first()
+        exporter = self.app.extensions.get('metrics_exporter')
+        if exporter is not None:
+            exporter.observe_warm_pool(shape_label(shape), row is not None)
+        return row
+
+    def link(self, session, pool_id, vm_id):
+        session.execute(LINK_SQL, {'id': pool_id, 'vm_id': vm_id})
+
+    def _create_executor(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warm-pool')
+
+    def _ensure_started(self):
+        """创建线程池并启动补充线程"""
+        start_per_process(self._refill_loop, 'warm-pool-refill', setup=self._create_executor)
+
+    def _refill_loop(self):
+        while True:
+            try:
+                for pool_id in self.refill():
+                    self._executor.submit(self._run, pool_id)
+            except Exception as e:
+                logger.error(f"Warm pool refill error: {str(e)}")
+            time.sleep(self.refill_interval)
+
+    def _release(self, session, row):
+        if row.host_name:
+            host_scheduler.release(session, row.host_name, row.cpu_cores, row.memory_gb, row.disk_gb)
+        if row.ip_address:
+            session.execute(IP_RELEASE_SQL, {'ip': row.ip_address})
+
+    def refill(self):
+        """取得advisory锁时清理超时的开通，并为不足的规格登记待开通的虚拟机（占用主机容量与IP），
+        返回新登记的ID（由调用方克隆）"""
+        if not self.shapes:
+            return []
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                if not session.execute(REFILL_LOCK_SQL).scalar():
+                    return []
+                now = datetime.utcnow()
+
+                before = now - timedelta(seconds=self.timeout)
+                for pool_id in session.execute(EXPIRED_SQL, {'before': before}).scalars().all():
+                    row = session.execute(FAIL_SQL, {'id': pool_id, 'error': 'provision timed out'}).first()
+                    if row is not None:
+                        self._release(session, row)
+
+                levels = {}
+                for template, cpu, memory, disk, status, count in session.execute(LEVELS_SQL):
+                    levels[(template, cpu, memory, disk)] = levels.get((template, cpu, memory, disk), 0) + count
+
+                created = []
+                for shape in self.shapes:
+                    key = (shape['template'], shape['cpu'], shape['memory'], shape['disk'])
+                    shape_error = template_catalog.validate(shape['template'], shape['cpu'], shape['memory'],
+                                                            shape['disk'], self.clone_mode)
+                    if shape_error:
+                        logger.warning(f"Warm pool {shape_label(shape)} not refilled: {shape_error}")
+                        continue
+                    for _ in range(shape['size'] - levels.get(key, 0)):
+                        try:
+                            host = host_scheduler.place(session, shape['cpu'], shape['memory'], shape['disk'])
+                        except NoHostCapacity as e:
+                            logger.warning(f"Warm pool {shape_label(shape)} not refilled: {str(e)}")
+                            break
+                        ip = session.execute(IP_CLAIM_SQL, {'now': now}).scalar()
+                        pool_id = session.execute(INSERT_SQL, {
+                            'template': shape['template'], 'cpu': shape['cpu'], 'memory': shape['memory'],
+                            'disk': shape['disk'], 'clone_mode': self.clone_mode, 'host': host, 'ip': ip,
+                            'now': now,
+                        }).scalar()
+                        session.execute(NAME_SQL, {'id': pool_id, 'name': f'iaas-pool-{pool_id}'})
+                        created.append(pool_id)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.remove()
+        if created:
+            logger.info(f"Warm pool refill: {len(created)} VMs queued")
+        return created
+
+    def _run(self, pool_id):
+        try:
+            return self.build(pool_id)
+        except Exception as e:
+            logger.error(f"Warm pool build {pool_id} error: {str(e)}")
+            return False
+
+    def build(self, pool_id):
+        """克隆一台登记的预热虚拟机（关机状态），失败时返回占用的主机容量与IP"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                row = session.execute(BUILD_SQL, {'id': pool_id}).first()
+                session.rollback()
+                if row is None:
+                    return False
+                try:
+                    result = provisioner.driver.clone(row.template_name, row.name, row.clone_mode, row.cpu_cores,
+                                                      row.memory_gb, row.disk_gb, host_name=row.host_name,
+                                                      power_on=False)
+                except Exception as e:
+                    logger.error(f"Warm pool build {pool_id} ({row.clone_mode} clone) error: {str(e)}")
+                    failed = session.execute(FAIL_SQL, {'id': pool_id, 'error': str(e)}).first()
+                    if failed is not None:
+                        self._release(session, failed)
+                    session.commit()
+                    return False
+
+                now = datetime.utcnow()
+                session.execute(READY_SQL, {
+                    'id': pool_id,
+                    'vcenter_vm_id': result['vm_id'],
+                    'storage_gb': result['storage_gb'],
+                    'provision_seconds': (now - row.created_at).total_seconds(),
+                    'now': now,
+                })
+                session.commit()
+                return True
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.remove()
+
+    def levels(self, session):
+        """各规格的目标数量、就绪数与开通中数量"""
+        counts = {}
+        for template, cpu, memory, disk, status, count in session.execute(LEVELS_SQL):
+            counts[(template, cpu, memory, disk, status)] = count
+        return {
+            shape_label(shape): {
+                'size': shape['size'],
+                'ready': counts.get((shape['template'], shape['cpu'], shape['memory'], shape['disk'], 'ready'), 0),
+                'provisioning': counts.get(
+                    (shape['template'], shape['cpu'], shape['memory'], shape['disk'], 'provisioning'), 0),
+            }
+            for shape in self.shapes
+        }
+
+    def stats(self, session, since):
+        """各规格的池水位、命中率与预热/冷创建的开通耗时对比（秒）"""
+        levels = self.levels(session)
+        for shape in self.shapes:
+            row = session.execute(HIT_RATE_SQL, {'since': since, 'template': shape['template'], 'cpu': shape['cpu'],
+                                                 'memory': shape['memory'], 'disk': shape['disk']}).one()
+            values = {key: round(float(value), 3) if value is not None and not isinstance(value, int) else value
+                      for key, value in row._mapping.items()}
+            requests = values['hits'] + values['misses']
+            values['hit_rate'] = round(values['hits'] / requests, 3) if requests else None
+            levels[shape_label(shape)].update(values)
+        return levels
+
+
+# 全局实例
+warm_pool = WarmPool()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VMware IaaS warm VM pool')
+    parser.add_argument('--refill', action='store_true', help='Refill the pool now and wait for the clones')
+    parser.add_argument('--stats', action='store_true', help='Show pool levels and hit rate per shape')
+    parser.add_argument('--hours', type=int, default=24, help='Time window for --stats')
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    if args.refill:
+        created = warm_pool.refill()
+        built = sum(1 for pool_id in created if warm_pool._run(pool_id))
+        print(f"✅ {built}/{len(created)} warm VMs provisioned")
+    elif args.stats:
+        with app.app_context():
+            stats = warm_pool.stats(db.session, datetime.utcnow() - timedelta(hours=args.hours))
+        print(f"{'Shape':<40} {'Ready':>9} {'Hits':>6} {'Misses':>6} {'Hit %':>6} {'Warm s':>7} {'Cold s':>7}")
+        for label, values in stats.items():
+            hit_rate = '-' if values['hit_rate'] is None else f"{values['hit_rate']:.0%}"
+            ready = f"{values['ready']}/{values['size']}"
+            print(f"{label:<40} {ready:>9} {values['hits']:>6} "
+                  f"{values['misses']:>6} {hit_rate:>6} {values['warm_seconds_avg'] or 0:>7.1f} "
+                  f"{values['cold_seconds_avg'] or 0:>7.1f}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()